@@ -0,0 +1,5 @@
+"""
+Benchmarks for the search engine
+
+Run with ``python -m benchmarks.run --help`` from the repository root.
+"""
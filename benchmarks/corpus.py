@@ -0,0 +1,100 @@
+"""
+Synthetic corpus generator
+
+Builds reproducible corpora of any size out of the vocabulary of the phrases
+used for testing, injecting typos in the words so that the fuzzy matchers
+have some work to do.
+"""
+import os
+import random
+import string
+
+from search import utils
+
+#: phrases the vocabulary is extracted from
+PHRASES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'tests', 'phrases.txt')
+
+#: query shapes, as ranges of number of words, chosen to hit every branch of
+#: :func:`search.matchers.lazy_match` against the generated items
+QUERY_SHAPES = {
+    'single': (1, 1),
+    'pair': (2, 2),
+    'short': (3, 4),
+    'long': (6, 10),
+}
+
+
+def vocabulary(path=PHRASES):
+    """Return the sorted list of unique tokens found in the phrases file."""
+    with open(path) as fo:
+        return sorted(set(utils.tokenize(fo.read())))
+
+
+def typo(word, rnd):
+    """Return `word` with one random typo: a swap, drop, insert or replace."""
+    if len(word) < 2:
+        return word
+    i = rnd.randrange(len(word) - 1)
+    kind = rnd.choice(('swap', 'drop', 'insert', 'replace'))
+    if kind == 'swap':
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 'drop':
+        return word[:i] + word[i + 1:]
+    char = rnd.choice(string.ascii_lowercase)
+    if kind == 'insert':
+        return word[:i] + char + word[i:]
+    return word[:i] + char + word[i + 1:]
+
+
+def phrase(words, length, rnd, typos=0.):
+    """Return a phrase of `length` random `words`, with a `typos` rate."""
+    chosen = (rnd.choice(words) for _ in range(length))
+    return ' '.join(
+        typo(word, rnd) if rnd.random() < typos else word
+        for word in chosen
+    )
+
+
+class Item:
+    """Generated corpus item, with a short `name` and a longer `description`"""
+    __slots__ = ('id', 'name', 'description')
+
+    def __init__(self, id, name, description):
+        self.id = id
+        self.name = name
+        self.description = description
+
+    def __repr__(self):
+        return '<Item {}: {!r}>'.format(self.id, self.name)
+
+
+def generate(size, seed=0, typos=.1, words=None):
+    """
+    Generate a list of `size` :class:`Item`, always the same ones for the
+    same `seed`. Names have from 1 to 5 words and descriptions from 5 to 20,
+    with about `typos` of the words misspelled.
+    """
+    rnd = random.Random(seed)
+    words = words or vocabulary()
+    return [
+        Item(i,
+             phrase(words, rnd.randint(1, 5), rnd, typos),
+             phrase(words, rnd.randint(5, 20), rnd, typos))
+        for i in range(size)
+    ]
+
+
+def queries(count, shape, seed=0, typos=.2, words=None):
+    """
+    Generate `count` queries with the number of words of the given
+    :any:`QUERY_SHAPES` `shape`.
+    """
+    rnd = random.Random('{}-{}'.format(seed, shape))
+    words = words or vocabulary()
+    low, high = QUERY_SHAPES[shape]
+    return [
+        phrase(words, rnd.randint(low, high), rnd, typos)
+        for _ in range(count)
+    ]
@@ -0,0 +1,211 @@
+"""
+Benchmark runner
+
+Measures the throughput of each matcher and of the whole engine over a
+synthetic corpus (see :mod:`benchmarks.corpus`), for each query shape, and
+writes a JSON report that can be compared against a saved baseline::
+
+    python -m benchmarks.run --size 100000 --output baseline.json
+    python -m benchmarks.run --size 100000 --baseline baseline.json
+
+When comparing, the process exits with status 1 if any measure got worse
+than the baseline by more than the given tolerance.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from search import analysis, matchers
+from search.core import SearchEngine
+from benchmarks import corpus
+
+#: version of the report format
+REPORT_VERSION = 1
+
+#: attributes of the generated items that are searched
+ATTRIBUTES = ['name', 'description']
+
+#: matchers measured on their own
+MATCHERS = [
+    'simple_ratio',
+    'best_token_ratio',
+    'token_sort_ratio',
+    'intersect_token_ratio',
+    'lazy_match',
+]
+
+#: how each measure should move to be an improvement
+HIGHER_IS_BETTER = {'pairs_per_sec': True, 'docs_per_sec': True}
+
+
+def percentile(values, pct):
+    """Return the `pct` percentile of `values` with the nearest rank method."""
+    values = sorted(values)
+    rank = max(int(round(pct / 100. * len(values) + .5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def bench_matchers(items, queries):
+    """
+    Measure each matcher against the names and descriptions of `items`, for
+    all the `queries`, returning the number of pairs matched per second.
+    """
+    report = {}
+    for name in MATCHERS:
+        matcher = getattr(matchers, name)
+        analysis.cache.clear()
+        pairs = 0
+        start = time.perf_counter()
+        for query in queries:
+            for item in items:
+                matcher(query, item.name)
+                matcher(query, item.description)
+            pairs += 2 * len(items)
+        elapsed = time.perf_counter() - start
+        report[name] = {'pairs_per_sec': pairs / elapsed}
+    return report
+
+
+def bench_engine(items, queries):
+    """
+    Search `items` for each of the `queries`, returning the documents
+    searched per second, the latency percentiles in milliseconds and the
+    peak memory allocated by the first search.
+    """
+    engine = SearchEngine(ATTRIBUTES, limit=10)
+
+    analysis.cache.clear()
+    tracemalloc.start()
+    engine.search(queries[0], items)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    analysis.cache.clear()
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        engine.search(query, items)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        'docs_per_sec': len(items) * len(queries) / sum(latencies),
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p90': percentile(latencies, 90) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': max(latencies) * 1000,
+        },
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def run(size, seed=0, queries=5, matcher_sample=200, shapes=None):
+    """Run every benchmark and return the report as a dictionary."""
+    shapes = shapes or list(corpus.QUERY_SHAPES)
+    words = corpus.vocabulary()
+    items = corpus.generate(size, seed, words=words)
+    shape_queries = {
+        shape: corpus.queries(queries, shape, seed, words=words)
+        for shape in shapes
+    }
+
+    sample = items[:matcher_sample]
+    all_queries = [q for shape in shapes for q in shape_queries[shape][:1]]
+
+    return {
+        'version': REPORT_VERSION,
+        'meta': {
+            'size': size,
+            'seed': seed,
+            'queries': queries,
+            'matcher_sample': len(sample),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'matchers': bench_matchers(sample, all_queries),
+        'engine': {
+            shape: bench_engine(items, shape_queries[shape])
+            for shape in shapes
+        },
+    }
+
+
+def _measures(report, prefix=()):
+    """Yield ``(path, value)`` for each number in the report measures."""
+    for key, value in report.items():
+        if isinstance(value, dict):
+            yield from _measures(value, prefix + (key,))
+        else:
+            yield prefix + (key,), value
+
+
+def compare(report, baseline, tolerance=.1):
+    """
+    Compare the measures of `report` with the `baseline` ones.
+
+    Returns:
+        list: ``(path, baseline, current, change, regressed)`` tuples, where
+        `change` is the relative change and `regressed` tells if the measure
+        got worse by more than `tolerance`.
+    """
+    base = dict(_measures({k: baseline[k] for k in ('matchers', 'engine')}))
+    rows = []
+    for path, value in _measures(
+            {k: report[k] for k in ('matchers', 'engine')}):
+        if path not in base or not base[path]:
+            continue
+        change = (value - base[path]) / base[path]
+        higher_is_better = HIGHER_IS_BETTER.get(path[-1], False)
+        worse = -change if higher_is_better else change
+        rows.append((path, base[path], value, change, worse > tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=10000,
+                        help='number of items in the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=5,
+                        help='queries for each query shape')
+    parser.add_argument('--matcher-sample', type=int, default=200,
+                        help='number of items the matchers are measured on')
+    parser.add_argument('--shapes', nargs='+',
+                        choices=list(corpus.QUERY_SHAPES))
+    parser.add_argument('--output', help='where to write the JSON report')
+    parser.add_argument('--baseline', help='JSON report to compare with')
+    parser.add_argument('--tolerance', type=float, default=.1,
+                        help='relative change considered a regression')
+    args = parser.parse_args(argv)
+
+    report = run(args.size, args.seed, args.queries, args.matcher_sample,
+                 args.shapes)
+
+    if args.output:
+        with open(args.output, 'w') as fo:
+            json.dump(report, fo, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as fo:
+        baseline = json.load(fo)
+
+    regressions = 0
+    for path, base, value, change, regressed in compare(
+            report, baseline, args.tolerance):
+        regressions += regressed
+        print('{:<45} {:>14.2f} {:>14.2f} {:>+8.1%}{}'.format(
+            '.'.join(path), base, value, change,
+            '  REGRESSION' if regressed else ''))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
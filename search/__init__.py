@@ -1,4 +1,3 @@
-from search.core import SearchEngine  # noqa: F401
 """
 Fuzzy Search engine
 =====================
@@ -65,3 +64,7 @@ Tweaking
 Basic algorithm configuration can be found in :any:`search.config`, that allows
 some tweaking on how it filters words and weights stuff.
 """
+from search.analysis import Analyzer  # noqa: F401
+from search.core import SearchEngine  # noqa: F401
+from search.corpus import Corpus  # noqa: F401
+from search.index import SearchIndex  # noqa: F401
@@ -0,0 +1,340 @@
+"""
+Text analysis
+
+Contains the :class:`Analyzer`, that turns strings into tokens, the
+:class:`Analysis` of a string, holding all the tokenized forms the matchers
+need, and a cached :func:`analyze` function so that every attribute value is
+tokenized once and then reused across searches. Queries are compiled once per
+search in a :class:`CompiledQuery`.
+
+Every token of the analysed strings is interned in the global :any:`tokens`
+dictionary, so that each analysis can hold its unique tokens as a compact
+array of integer ids. Queries only look their tokens up, so that searching
+does not grow the dictionary.
+"""
+import copy
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+
+from search import utils, config
+from search.cache import LRUCache
+
+
+class TokenDictionary:
+    """
+    Thread safe, append only mapping of each token to an integer id, in the
+    order the tokens are first seen.
+
+        >>> dictionary = TokenDictionary()
+        >>> dictionary.ids(['watson', 'holmes', 'watson'])
+        array('I', [0, 1])
+
+    .. note::
+        Ids are never released, so the dictionary grows with the vocabulary
+        of the analysed strings. Queries use :meth:`get` instead, as their
+        tokens are not worth an id if no string has them.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __getitem__(self, token_id):
+        return self._tokens[token_id]
+
+    def intern(self, token):
+        """Return the id of `token`, assigning a new one if needed."""
+        token_id = self._ids.get(token)
+        if token_id is None:
+            with self._lock:
+                token_id = self._ids.get(token)
+                if token_id is None:
+                    token_id = self._ids[sys.intern(token)] = len(self._tokens)
+                    self._tokens.append(token)
+        return token_id
+
+    def get(self, token):
+        """Return the id of `token`, or ``None`` if it has none."""
+        return self._ids.get(token)
+
+    def ids(self, tokens):
+        """Return the sorted array of the unique ids of `tokens`."""
+        return array('I', sorted({self.intern(token) for token in tokens}))
+
+
+#: the dictionary of every analysed token
+tokens = TokenDictionary()
+
+#: id standing for the query tokens that no analysed string has, higher
+#: than any other id
+UNKNOWN = 2 ** (8 * array('I').itemsize) - 1
+
+
+class Analyzer:
+    """
+    Pipeline turning a string into its tokens: the string is normalized,
+    lowercased and split, then the tokens that are too short or are
+    stopwords are dropped and the others stemmed
+
+        >>> analyzer = Analyzer(min_length=2, stop_words=['the'])
+        >>> analyzer.tokenize('The Hound of the Baskervilles')
+        ['hound', 'baskervilles']
+
+    The :class:`Analysis` of each string is kept in a cache of
+    `cache_size` strings, see :meth:`analyze`. Each
+    :class:`search.core.SearchEngine` can use its own analyzer, the
+    :any:`default` one following :mod:`search.config`.
+
+    The `pattern`, `min_length` and `stop_words` not given are read from
+    :mod:`search.config` whenever a string is analysed, so that changing
+    the configuration changes the tokens, as with
+    :func:`search.utils.tokenize`: the cached analyses are then dropped.
+
+    Arguments:
+        pattern (str): regular expression matching the separators of the
+            tokens, :any:`config.STR_SPLIT_REGEX` by default.
+        min_length (int): tokens up to this length are dropped,
+            :any:`config.MIN_WORD_LENGTH` by default.
+        stop_words (iterable): tokens to drop, :any:`config.STOP_WORDS` by
+            default.
+        casefold (bool): use :meth:`str.casefold` instead of
+            :meth:`str.lower`, so that for instance ``'ß'`` matches
+            ``'ss'``.
+        normalization (str): the :func:`unicodedata.normalize` form to apply
+            to the strings (as ``'NFKC'``), if any.
+        stemmer (callable): function returning the stem of a token, as
+            ``nltk.stem.PorterStemmer().stem``. It must be defined at module
+            level for the searches split across worker processes.
+        cache_size (int): number of analysed strings to keep,
+            :any:`config.ANALYSIS_CACHE_SIZE` by default.
+    """
+
+    def __init__(self, pattern=None, min_length=None, stop_words=None,
+                 casefold=False, normalization=None, stemmer=None,
+                 cache_size=None):
+        self.casefold = casefold
+        self.normalization = normalization
+        self.stemmer = stemmer
+        self.cache_size = config.ANALYSIS_CACHE_SIZE if cache_size is None \
+            else cache_size
+        #: cache of the analysed strings
+        self.cache = LRUCache(self.cache_size)
+
+        # the given options, and the configuration the others were read from
+        self._options = pattern, min_length, stop_words
+        self._config = None
+        self._configure()
+
+    def _configure(self):
+        """
+        Read the options not given from :mod:`search.config`, if it changed
+        since the last time, dropping the cached analyses.
+        """
+        pattern, min_length, stop_words = self._options
+        if self._config is not None and None not in self._options:
+            # every option was given
+            return
+        current = (config.STR_SPLIT_REGEX, config.MIN_WORD_LENGTH,
+                   config.STOP_WORDS)
+        if current == self._config:
+            return
+        # a copy of the stop words, so that changes in place are noticed
+        self._config = current[:2] + (copy.copy(current[2]),)
+
+        self.pattern = config.STR_SPLIT_REGEX if pattern is None else pattern
+        self.min_length = config.MIN_WORD_LENGTH if min_length is None \
+            else min_length
+        self.stop_words = frozenset(
+            config.STOP_WORDS if stop_words is None else stop_words)
+        self._split = re.compile(self.pattern).split
+        self.cache.clear()
+
+    def __repr__(self):
+        return '<Analyzer {!r} min_length={}>'.format(
+            self.pattern, self.min_length)
+
+    def __reduce__(self):
+        # the default analyzer stays the default one in other processes,
+        # while the others are rebuilt without their cache
+        if self is default:
+            return 'default'
+        return (Analyzer, (
+            self.pattern, self.min_length, self.stop_words, self.casefold,
+            self.normalization, self.stemmer, self.cache_size))
+
+    def tokenize(self, string):
+        """Return the list of the tokens of `string`, in order."""
+        self._configure()
+        if self.normalization is not None:
+            string = unicodedata.normalize(self.normalization, string)
+        string = string.casefold() if self.casefold else string.lower()
+
+        min_length, stop_words = self.min_length, self.stop_words
+        tokens = [
+            token for token in self._split(string)
+            if len(token) > min_length and token not in stop_words
+        ]
+        if self.stemmer is not None:
+            tokens = [self.stemmer(token) for token in tokens]
+        return tokens
+
+    def analyze(self, string):
+        """
+        Return the :class:`Analysis` of `string`, reusing the cached one if
+        the same string was analysed before. Already analysed values are
+        returned as they are, so the method can be called on either.
+        """
+        if isinstance(string, Analysis):
+            return string
+
+        self._configure()
+        analysis = self.cache.get(string)
+        if analysis is None:
+            analysis = Analysis(string, self)
+            self.cache.set(string, analysis)
+        return analysis
+
+    def compile(self, query):
+        """
+        Return the :class:`CompiledQuery` for `query`, if not compiled yet
+        with this analyzer.
+        """
+        if isinstance(query, CompiledQuery) and query.analyzer is self:
+            return query
+        return CompiledQuery(str(query), self)
+
+
+class Analysis:
+    """
+    Tokenized forms of a string, computed once upon creation.
+
+    Attributes:
+        string (str): the original string
+        analyzer (Analyzer): the analyzer that tokenized the string, the
+            :any:`default` one if not given
+        tokens (list): tokens as returned by :meth:`Analyzer.tokenize`
+        ids (array): sorted ids of the unique tokens in :any:`tokens`
+        sorted_tokens (list): sorted unique tokens
+        joined (str): sorted unique tokens joined together
+        length (int): number of unique tokens
+    """
+    __slots__ = ('string', 'analyzer', 'tokens', 'ids', 'sorted_tokens',
+                 'joined', 'length')
+
+    def __init__(self, string, analyzer=None):
+        self.string = string
+        self.analyzer = analyzer or default
+        self.tokens = self.analyzer.tokenize(string)
+        self.ids = tokens.ids(self.tokens)
+        self.sorted_tokens = sorted(tokens[i] for i in self.ids)
+        self.joined = utils.stringify_tokens(self.sorted_tokens)
+        self.length = len(self.ids)
+
+    @property
+    def token_set(self):
+        """The set of the unique tokens."""
+        return set(self.sorted_tokens)
+
+    def __str__(self):
+        return self.string
+
+    def __repr__(self):
+        return '<Analysis {!r}>'.format(self.string)
+
+
+class CompiledQuery(Analysis):
+    """
+    Analysis of a search query, built once at the start of a search and passed
+    to the matchers in place of the query string, so that the query is not
+    tokenized again for each object and attribute. The strings it is matched
+    against are analysed with the same analyzer.
+
+    Queries are not stored in the analysis cache, to avoid evicting the
+    analysed attribute values, and their tokens are not interned: the
+    :any:`ids` of the tokens no string has yet are replaced by a single
+    :any:`UNKNOWN`, and looked up again once the dictionary grows.
+    """
+    __slots__ = ('_ids', '_known', '_unknown', '_seen')
+
+    def __init__(self, string, analyzer=None):
+        self.string = string
+        self.analyzer = analyzer or default
+        self.tokens = self.analyzer.tokenize(string)
+        self.sorted_tokens = sorted(set(self.tokens))
+        self.joined = utils.stringify_tokens(self.sorted_tokens)
+        self.length = len(self.sorted_tokens)
+        self._known = []
+        self._unknown = self.sorted_tokens
+        self._seen = None
+        self._lookup()
+
+    def _lookup(self):
+        """Look up the ids of the tokens that had none."""
+        self._seen = len(tokens)
+        unknown = []
+        for token in self._unknown:
+            token_id = tokens.get(token)
+            if token_id is None:
+                unknown.append(token)
+            else:
+                self._known.append(token_id)
+        self._unknown = unknown
+
+        ids = array('I', sorted(self._known))
+        if unknown:
+            # no string has them, so one id is enough to tell them apart
+            ids.append(UNKNOWN)
+        self._ids = ids
+
+    @property
+    def ids(self):
+        """
+        Sorted ids of the unique tokens, ending with :any:`UNKNOWN` if some
+        of them are in no analysed string.
+        """
+        if self._unknown and self._seen != len(tokens):
+            self._lookup()
+        return self._ids
+
+    def __repr__(self):
+        return '<CompiledQuery {!r}>'.format(self.string)
+
+
+#: the analyzer used when none is given, built from :mod:`search.config`
+default = Analyzer()
+
+#: shared cache of the strings analysed by the :any:`default` analyzer
+cache = default.cache
+
+
+def compile_query(query, analyzer=None):
+    """
+    Return the :class:`CompiledQuery` for `query` with `analyzer`, if not
+    compiled with it yet. Without an `analyzer`, compiled queries are
+    returned as they are and the others compiled with the :any:`default`
+    one.
+    """
+    if analyzer is None:
+        if isinstance(query, CompiledQuery):
+            return query
+        analyzer = default
+    return analyzer.compile(query)
+
+
+def analyze(string, analyzer=None):
+    """
+    Return the :class:`Analysis` of `string` with `analyzer` (the
+    :any:`default` one if not given), reusing the cached one if the same
+    string was analysed before. Already analysed values are returned as
+    they are, so the function can be called on either.
+    """
+    if isinstance(string, Analysis):
+        return string
+    return (analyzer or default).analyze(string)
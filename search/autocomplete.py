@@ -0,0 +1,282 @@
+"""
+Autocomplete
+
+Contains the :class:`PrefixIndex`, that finds the objects with words
+starting with each word of a partially typed query, and the
+:class:`AutocompleteSession`, that follows the query as it is typed, one
+keystroke at a time, refining the previous results instead of searching
+again from scratch
+
+    >>> index = PrefixIndex(Item.select(), ['name', 'category'])
+    >>> session = AutocompleteSession(index, limit=10)
+    >>> session('s')
+    >>> session('sh')
+    >>> session('sherlock h')
+
+Unlike the fuzzy search, autocompletion matches words by prefix: every word
+of the query, the last one included, must be the start of a word of the
+object. Words are not filtered by length by the :any:`default` analyzer, as
+short ones are what is typed first.
+"""
+import heapq
+from bisect import bisect_left, insort
+from itertools import groupby
+
+from search.analysis import Analyzer
+from search.corpus import Corpus
+
+#: the analyzer of the words when none is given, keeping the short ones
+default = Analyzer(min_length=0)
+
+
+def terms(query, analyzer=None):
+    """
+    Return the sorted list of the unique words of `query`, as split by
+    `analyzer` (the :any:`default` one if not given), all of them
+    considered as prefixes.
+    """
+    return sorted(set((analyzer or default).tokenize(query)))
+
+
+class PrefixIndex:
+    """
+    Index of the words of the given `attributes` of each object in `dataset`,
+    kept in a sorted vocabulary so that the words starting with a prefix are
+    found with a binary search.
+
+    Objects are ranked by how much of their words the query words cover,
+    that is the average over the query words of their length divided by the
+    length of the shortest object word they start, so that complete words
+    rank first. Ties keep the order of the dataset.
+
+    If `dataset` is a :class:`search.corpus.Corpus`, the index reads the
+    values from its columns and returns its items, and the objects added
+    later are appended to it.
+
+    Arguments:
+        dataset (iterable): iterable of `objects` to index.
+        attributes (list): names of the attributes to index.
+        analyzer (search.analysis.Analyzer): the analyzer splitting the
+            values and the queries in words, the :any:`default` one if not
+            given.
+    """
+
+    def __init__(self, dataset, attributes, analyzer=None):
+        self.attributes = list(attributes)
+        self.analyzer = analyzer or default
+        self.documents = []
+        # word -> ids of the documents containing it
+        self.vocabulary = {}
+        # sorted words of the vocabulary
+        self.words = []
+        # document id -> its sorted unique words
+        self.document_words = []
+        #: the indexed :class:`search.corpus.Corpus`, if any
+        self.corpus = None
+
+        if isinstance(dataset, Corpus):
+            self.corpus = dataset
+            self.documents = dataset.items
+            for doc_id, (_, values) in enumerate(
+                    dataset.rows(self.attributes)):
+                self._index(doc_id, values)
+        else:
+            for obj in dataset:
+                self.add(obj)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def add(self, obj):
+        """Append `obj` to the index and return its document id."""
+        if self.corpus is not None:
+            doc_id = self.corpus.append(obj)
+            values = [self.corpus.columns[attr][doc_id]
+                      for attr in self.attributes]
+        else:
+            doc_id = len(self.documents)
+            self.documents.append(obj)
+            values = [getattr(obj, attr) for attr in self.attributes]
+
+        self._index(doc_id, values)
+        return doc_id
+
+    def _index(self, doc_id, values):
+        """Index the attribute `values` of the document `doc_id`."""
+        words = set()
+        for value in values:
+            words.update(self.analyzer.tokenize(value))
+        self.document_words.append(sorted(words))
+
+        for word in words:
+            if word not in self.vocabulary:
+                self.vocabulary[word] = []
+                insort(self.words, word)
+            self.vocabulary[word].append(doc_id)
+
+    def _range(self, prefix):
+        """Return where the words starting with `prefix` start and stop."""
+        start = bisect_left(self.words, prefix)
+        if not prefix:
+            return start, len(self.words)
+        # the first string after all the ones starting with the prefix
+        after = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return start, bisect_left(self.words, after, start)
+
+    def complete(self, prefix):
+        """Return the sorted list of the words starting with `prefix`."""
+        start, stop = self._range(prefix)
+        return self.words[start:stop]
+
+    def matches(self, prefix):
+        """
+        Return the set of ids of the documents with a word starting with
+        `prefix`.
+        """
+        doc_ids = set()
+        for word in self.complete(prefix):
+            doc_ids.update(self.vocabulary[word])
+        return doc_ids
+
+    def coverage(self, doc_id, prefix):
+        """
+        Return the length of `prefix` divided by the length of the shortest
+        word of the document `doc_id` starting with it, or ``0``.
+        """
+        words = self.document_words[doc_id]
+        shortest = None
+        for i in range(bisect_left(words, prefix), len(words)):
+            if not words[i].startswith(prefix):
+                break
+            if shortest is None or len(words[i]) < shortest:
+                shortest = len(words[i])
+        return len(prefix) / shortest if shortest else 0
+
+    def candidate_ids(self, query_terms, previous=None):
+        """
+        Return the set of ids of the documents matching every one of the
+        `query_terms`, as returned by :func:`terms`.
+
+        Arguments:
+            previous (tuple): ``(terms, candidate_ids)`` of a previous call,
+                reused if each of its terms is the start of one of the
+                `query_terms`, as its candidates then include the new ones.
+        """
+        candidates = None
+        if previous is not None:
+            old_terms, old_ids = previous
+            if all(any(term.startswith(old) for term in query_terms)
+                   for old in old_terms):
+                candidates = old_ids
+                query_terms = [t for t in query_terms if t not in old_terms]
+
+        for term in query_terms:
+            if candidates is None:
+                candidates = self.matches(term)
+                continue
+            if not candidates:
+                break
+            start, stop = self._range(term)
+            if len(candidates) <= stop - start:
+                # fewer candidates to check than words to look up
+                candidates = {
+                    doc_id for doc_id in candidates
+                    if self.coverage(doc_id, term)
+                }
+            else:
+                candidates = candidates & self.matches(term)
+        return candidates if candidates is not None else set()
+
+    def rank(self, query_terms, candidates, limit=-1):
+        """
+        Return the ids of the best `limit` `candidates` for `query_terms`,
+        best first. if `limit` is ``-1`` all of them are returned.
+        """
+        if len(query_terms) == 1 and 0 < limit < len(candidates):
+            return self._rank_prefix(query_terms[0], candidates, limit)
+
+        scored = (
+            (-sum(self.coverage(doc_id, term) for term in query_terms),
+             doc_id)
+            for doc_id in candidates
+        )
+        if limit > 0:
+            scored = heapq.nsmallest(limit, scored)
+        else:
+            scored = sorted(scored)
+        return [doc_id for _, doc_id in scored]
+
+    def _rank_prefix(self, prefix, candidates, limit):
+        """
+        Same as :meth:`rank` for a single query term, walking through the
+        words starting with it from the shortest, since the first word each
+        document is found with gives its coverage.
+        """
+        ranked, seen = [], set()
+        words = sorted(self.complete(prefix), key=len)
+        for _, group in groupby(words, key=len):
+            found = set()
+            for word in group:
+                found.update(self.vocabulary[word])
+            found = (found & candidates) - seen
+            seen |= found
+            ranked.extend(sorted(found))
+            if len(ranked) >= limit:
+                break
+        return ranked[:limit]
+
+    def search(self, query, limit=-1):
+        """
+        Return the objects matching the partially typed `query`, best first.
+        if `limit` is ``-1`` all the matching objects are returned.
+        """
+        query_terms = terms(query, self.analyzer)
+        if not query_terms:
+            return []
+        doc_ids = self.rank(
+            query_terms, self.candidate_ids(query_terms), limit)
+        return [self.documents[doc_id] for doc_id in doc_ids]
+
+
+class AutocompleteSession:
+    """
+    Autocompletion of a query typed one keystroke at a time in a search box.
+    Calling the session with the query typed so far returns the same results
+    as :meth:`PrefixIndex.search`, but the candidates of the previous query
+    are reused whenever the new one extends it, so that only the words that
+    changed are looked up.
+
+    Arguments:
+        index (PrefixIndex): the index to search.
+        limit (int): max number of results to return. if ``-1`` will return
+            everything.
+    """
+
+    def __init__(self, index, limit=10):
+        self.index = index
+        self.limit = limit
+        # terms and candidate ids of the last query
+        self._previous = None
+
+    def __call__(self, query):
+        return self.search(query)
+
+    def search(self, query):
+        """Return the objects matching the query typed so far."""
+        query_terms = terms(query, self.index.analyzer)
+        if not query_terms:
+            self._previous = None
+            return []
+
+        candidates = self.index.candidate_ids(query_terms, self._previous)
+        self._previous = query_terms, candidates
+
+        doc_ids = self.index.rank(query_terms, candidates, self.limit)
+        return [self.index.documents[doc_id] for doc_id in doc_ids]
+
+    def reset(self):
+        """Forget the previous query, as when the search box is cleared."""
+        self._previous = None
@@ -0,0 +1,100 @@
+"""
+Ratio backends
+
+Every matcher bottoms out in a `ratio` function, that given two strings
+returns their similarity as a value between 0 and 1. This module contains
+the available implementations, that can be selected for each
+:class:`search.core.SearchEngine` by name or passing the function itself.
+
+* ``difflib``: :func:`search.utils.ratio`, the reference implementation that
+  uses :class:`difflib.SequenceMatcher`.
+* ``indel``: :func:`indel_ratio`, a bit-parallel implementation of the
+  normalized `Indel` similarity, based on the longest common subsequence.
+
+Both are twice the characters matching over the total length of the strings,
+so the matchers can bound them and skip the comparisons that cannot reach the
+needed match. They count the matching characters differently, though, so
+``indel`` is not a drop-in replacement for ``difflib``: it rates most objects
+the same, but it can rate some higher, so a search can return a few more
+objects and rank them differently. Other ratio functions are rated exactly,
+unless they declare the same bounds with a ``bounded = True`` attribute (see
+:func:`search.utils.is_bounded`).
+"""
+from search import utils, config
+
+
+def lcs_length(query, string):
+    """
+    Length of the longest common subsequence of the two strings, computed
+    with the bit-parallel algorithm by Allison and Dix, treating a Python
+    ``int`` as a bit vector as long as `query`.
+
+    Example:
+        >>> lcs_length('holmes', 'hlomes')
+        5
+    """
+    if not query or not string:
+        return 0
+
+    # bit masks of the positions of each character inside the query
+    masks = {}
+    bit = 1
+    for char in query:
+        masks[char] = masks.get(char, 0) | bit
+        bit <<= 1
+
+    full = bit - 1
+    vector = full
+    for char in string:
+        matches = vector & masks.get(char, 0)
+        vector = ((vector + matches) | (vector - matches)) & full
+
+    # every bit cleared in the vector is a character of the subsequence
+    return len(query) - bin(vector).count('1')
+
+
+def indel_ratio(query, string):
+    """
+    Normalized Indel similarity, ``2 * lcs / (len(query) + len(string))``.
+
+    This is the same formula as :meth:`difflib.SequenceMatcher.ratio`, but
+    the matching characters are counted with the longest common subsequence
+    instead of the matching blocks heuristic, so the value is always equal to
+    or greater than the one from :func:`search.utils.ratio`. The two are
+    usually the same for similar strings, but can differ by a lot for the
+    dissimilar ones.
+    Like the latter returns 1 for two empty strings.
+    """
+    length = len(query) + len(string)
+    if length == 0:
+        return 1.0
+    return 2.0 * lcs_length(query, string) / length
+
+
+indel_ratio.bounded = True
+
+
+#: available ratio backends, by name
+BACKENDS = {
+    'difflib': utils.ratio,
+    'indel': indel_ratio,
+}
+
+
+def get_backend(backend=None):
+    """
+    Return the ratio function for `backend`, that can be either one of the
+    :any:`BACKENDS` names or a ratio function itself. Defaults to
+    :any:`config.RATIO_BACKEND`.
+
+    Raises:
+        ValueError: if there is no backend with the given name.
+    """
+    if backend is None:
+        backend = config.RATIO_BACKEND
+    if callable(backend):
+        return backend
+    try:
+        return BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Unknown ratio backend: {!r}'.format(backend))
@@ -0,0 +1,215 @@
+"""
+Batch scoring
+
+Contains the :class:`Column` type, that encodes a column of attribute strings
+(the values of one attribute for every object of a dataset) once, and then
+scores a query against the whole column at once with a q-gram profile
+similarity. The q-grams the rows have in common with the query are cheap to
+count, and are used as a first pass filter by the q-gram count filter (see
+:func:`min_common`), so that only the rows that could match the query are
+passed to the much slower matchers.
+"""
+import math
+from array import array
+from collections import Counter
+
+from search import config
+from search.analysis import analyze
+
+
+def profile(string, size=config.QGRAM_SIZE, analyzer=None):
+    """
+    Return the q-gram profile of `string`, that is a :class:`Counter` of the
+    q-grams of length `size` of each of its unique tokens, as split by
+    `analyzer` (the default one if not given).
+    Tokens shorter than `size` count as a single q-gram.
+
+    Example:
+        >>> profile('hello, hello world', 3)
+        Counter({'hel': 1, 'ell': 1, 'llo': 1, 'wor': 1, 'orl': 1, 'rld': 1})
+    """
+    grams = Counter()
+    for token in analyze(string, analyzer).sorted_tokens:
+        if len(token) <= size:
+            grams[token] += 1
+            continue
+        grams.update(token[i:i + size] for i in range(len(token) - size + 1))
+    return grams
+
+
+def min_common(length, other, threshold, size=config.QGRAM_SIZE):
+    """
+    Return how many q-grams of length `size` two strings of `length` and
+    `other` characters have in common at least, if their ratio is at least
+    `threshold`, by the q-gram count filter: the ratio needs that many
+    matching characters, so the strings are at most ``edits`` insertions and
+    deletions apart, and each of them changes at most `size` q-grams
+
+        max(length, other) - size + 1 - size * edits
+
+    The result is zero or less when the filter cannot rule anything out. It
+    only holds for the ratios bounded by their matching characters, see
+    :func:`search.utils.is_bounded`.
+    """
+    total = length + other
+    # a margin so that rounding never asks for one more matching character
+    matching = max(math.ceil(threshold * total / 2 - 1e-9), 0)
+    edits = max(total - 2 * matching, 0)
+    return max(length, other) - size + 1 - size * edits
+
+
+def _least_common(length, threshold, size, longest=None):
+    """
+    Return the least :func:`min_common` of a string of `length` characters
+    and any other one, up to `longest` characters, whose ratio with it can
+    reach `threshold`.
+    """
+    if threshold <= 0:
+        return -math.inf
+    longest = math.floor(length * (2 - threshold) / threshold) + 1 \
+        if longest is None else longest
+    least = math.inf
+    for other in range(1, longest + 1):
+        # the ratio cannot be higher than the shortest length allows
+        if 2 * min(length, other) < threshold * (length + other) - 1e-9:
+            continue
+        least = min(least, min_common(length, other, threshold, size))
+    return least
+
+
+class Column:
+    """
+    Column of strings encoded in q-gram postings, as arrays of the rows
+    containing each q-gram and how many times they contain it, together
+    with the number of tokens of each row.
+
+        >>> column = Column(['sherlock holmes', 'doctor watson'])
+        >>> column.scores('holmes')
+        array('d', [1.0, 0.0])
+
+    Arguments:
+        strings (iterable): the strings in the column, one for each row.
+        size (int): length of the q-grams.
+        analyzer (search.analysis.Analyzer): the analyzer tokenizing the
+            strings and the queries, the default one if not given.
+    """
+
+    def __init__(self, strings, size=config.QGRAM_SIZE, analyzer=None):
+        self.size = size
+        self.analyzer = analyzer
+        # number of q-grams of each row
+        self.lengths = array('I')
+        # number of unique tokens of each row
+        self.counts = array('I')
+        # q-gram -> (rows containing it, occurrences in each row)
+        self.postings = {}
+
+        for string in strings:
+            self.append(string)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def append(self, string):
+        """Encode `string` as a new row at the end of the column."""
+        row = len(self.lengths)
+        analysis = analyze(string, self.analyzer)
+        grams = profile(analysis, self.size)
+        self.lengths.append(sum(grams.values()))
+        self.counts.append(analysis.length)
+        for gram, count in grams.items():
+            rows, counts = self.postings.setdefault(
+                gram, (array('I'), array('I')))
+            rows.append(row)
+            counts.append(count)
+
+    def overlaps(self, query):
+        """
+        Return the number of q-grams each row has in common with `query`, as
+        a dictionary of the rows having any, together with the number of
+        q-grams of the query.
+        """
+        grams = profile(query, self.size, self.analyzer)
+        overlaps = {}
+        get = overlaps.get
+        for gram, query_count in grams.items():
+            rows, counts = self.postings.get(gram, ((), ()))
+            if query_count == 1:
+                # as most q-grams are, so each row has it once in common
+                for row in rows:
+                    overlaps[row] = get(row, 0) + 1
+                continue
+            for row, count in zip(rows, counts):
+                overlaps[row] = get(row, 0) + (
+                    count if count < query_count else query_count)
+        return overlaps, sum(grams.values())
+
+    def scores(self, query):
+        """
+        Return the q-gram profile similarity between `query` and each row of
+        the column, as values between 0 and 1.
+
+        The similarity is the fraction of the query q-grams found in the row,
+        so that long rows containing the query are not penalized, the same
+        way the matchers do not penalize long strings containing the query.
+        """
+        overlaps, query_length = self.overlaps(query)
+        scores = array('d', [0.0]) * len(self)
+        for row, overlap in overlaps.items():
+            scores[row] = overlap / query_length
+        return scores
+
+    def plausible(self, query, threshold, similar=None):
+        """
+        Return the sorted list of the rows that the q-gram count filter (see
+        :func:`min_common`) cannot rule out to be rated at least `threshold`
+        against `query` by :func:`search.matchers.lazy_match`, with the
+        tokens considered in common by :func:`search.utils.sorted_intersect`
+        when their ratio is at least `similar` (:any:`config.THRESHOLD` by
+        default).
+
+        A matching row needs enough q-grams in common with the query for at
+        least one of the ways the matchers can rate it that high: a query
+        token and a similar row token, a query token and a segment of the
+        joined row tokens (for the short queries and rows), or the joined
+        query tokens and the joined row tokens. The q-grams of the joined
+        tokens spanning two of them are not in the profiles, so each row
+        gets a margin of ``size - 1`` q-grams for each of its tokens but the
+        first. The rows with less than two tokens are rated on their whole
+        strings, that the profiles say nothing about, so they are always
+        kept.
+
+        The filter rules out fewer rows the lower the thresholds are: with
+        the default ones it rarely rules out any.
+        """
+        similar = config.THRESHOLD if similar is None else similar
+        query = analyze(query, self.analyzer)
+        tokens = query.sorted_tokens
+        if not tokens:
+            return list(range(len(self)))
+
+        size = self.size
+        # a query token and a similar token
+        common = min(_least_common(len(t), similar, size) for t in tokens)
+        # a query token and a segment, or the whole joined tokens if shorter
+        segment = math.inf
+        if len(tokens) < 5:
+            segment = min(
+                _least_common(len(t), threshold, size, len(t))
+                for t in tokens)
+        # the joined tokens, without the q-grams spanning the query tokens
+        joined = _least_common(len(query.joined), threshold, size) - \
+            (size - 1) * (len(tokens) - 1)
+
+        overlaps, _ = self.overlaps(query)
+        rows = []
+        for row, count in enumerate(self.counts):
+            if count > 1:
+                spanning = (size - 1) * (count - 1)
+                needed = min(common, joined - spanning)
+                if count < 5:
+                    needed = min(needed, segment - spanning)
+                if overlaps.get(row, 0) < needed:
+                    continue
+            rows.append(row)
+        return rows
@@ -0,0 +1,241 @@
+"""
+Caching utilities
+
+Contains the bounded caches used by the engine to avoid recomputing values
+that do not change between searches.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+
+from search import utils
+
+
+class LRUCache:
+    """
+    Thread safe mapping that holds at most `maxsize` items, evicting the least
+    recently used one when full. Keeps count of the lookups that found
+    (`hits`) or did not find (`misses`) a value.
+
+        >>> cache = LRUCache(2)
+        >>> cache.set('a', 1)
+        >>> cache.get('a')
+        1
+
+    Arguments:
+        maxsize (int): maximum number of items to hold. if ``-1`` the cache
+            is unbounded.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the value for `key`, marking it as recently used."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store `value` for `key`, evicting the oldest items if needed."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.maxsize >= 0:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove every item and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+class RatioCache(LRUCache):
+    """
+    Memoized version of a `ratio` function, that can be passed to the
+    matchers in its place. Keeps the ratio of the last `maxsize` pairs of
+    strings compared, so that the same words found across the documents of
+    a corpus are compared only once
+
+        >>> ratio = RatioCache(utils.ratio, 100000)
+        >>> matchers.lazy_match('sherlock holmes', 'holmes', ratio)
+        >>> ratio.hits, ratio.misses
+
+    The strings are interned, as the same tokens are repeated many times.
+    When pickled, as for the worker processes, only the wrapped `ratio` and
+    `maxsize` are kept and the cache starts empty.
+
+    Arguments:
+        ratio (callable): the function comparing two strings
+        maxsize (int): maximum number of pairs to hold. if ``-1`` the cache
+            is unbounded.
+    """
+
+    def __init__(self, ratio, maxsize):
+        super().__init__(maxsize)
+        self.ratio = ratio
+        # the same bounds as the wrapped ratio, see `utils.is_bounded`
+        self.bounded = utils.is_bounded(ratio)
+
+    def __call__(self, query, string):
+        key = sys.intern(query), sys.intern(string)
+        value = self.get(key)
+        if value is None:
+            value = self.ratio(query, string)
+            self.set(key, value)
+        return value
+
+    def __reduce__(self):
+        return type(self), (self.ratio, self.maxsize)
+
+    @property
+    def hit_rate(self):
+        """Fraction of the calls that found the ratio in the cache."""
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.
+
+
+# source of the dataset uids, see `new_uid`
+_uids = count()
+
+
+def new_uid():
+    """
+    Return a new id, unique in the process, for a dataset to be told apart
+    from the others by :func:`fingerprint` even after it is released.
+    """
+    return next(_uids)
+
+
+def fingerprint(dataset):
+    """
+    Default dataset fingerprint for the :class:`ResultCache`, that is the
+    ``uid`` of the dataset (see :func:`new_uid`) together with its
+    ``version`` attribute, for the datasets that have both (such as
+    :class:`search.index.SearchIndex`). Returns ``None`` for any other
+    dataset, that will not be cached.
+    """
+    uid = getattr(dataset, 'uid', None)
+    version = getattr(dataset, 'version', None)
+    if uid is None or version is None:
+        return None
+    return uid, version
+
+
+class ResultCache(LRUCache):
+    """
+    Cache of search results, to be used by :class:`search.core.SearchEngine`
+
+        >>> search_engine = SearchEngine(['name'], cache=ResultCache(1000))
+
+    Results are stored for each query, searched attributes and weights, ratio
+    function and dataset fingerprint, together with the threshold and limit
+    they were searched with, so that a cached result can also serve searches
+    with a smaller limit or, if the cached result is complete, a higher
+    threshold, without rating the dataset again.
+
+    .. note::
+        Queries are used as they are, since some matchers compare the raw
+        strings and so even a different case can change the results.
+
+    Arguments:
+        maxsize (int): maximum number of results to hold.
+        ttl (float): seconds after which a result expires. if ``None``
+            results never expire.
+        fingerprint (callable): given a dataset returns a hashable value that
+            changes when the dataset does, or ``None`` if the dataset should
+            not be cached. Defaults to :func:`fingerprint`.
+    """
+
+    def __init__(self, maxsize, ttl=None, fingerprint=fingerprint):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.fingerprint = fingerprint
+
+    def key(self, query, dataset, attributes, weights, ratio, analyzer=None):
+        """
+        Return the cache key for a search, or ``None`` if the dataset
+        cannot be cached.
+        """
+        version = self.fingerprint(dataset)
+        if version is None:
+            return None
+        return (str(query), tuple(attributes), tuple(weights), ratio,
+                analyzer, version)
+
+    def lookup(self, key, threshold, limit):
+        """
+        Return the cached results for `key` searched with `threshold` and
+        `limit`, or ``None`` if there are none that can be used.
+        """
+        with self._lock:
+            cached = self._data.get(key)
+            if cached is not None and self._expired(cached):
+                del self._data[key]
+                cached = None
+
+            entries = None
+            if cached is not None:
+                entries = self._serve(cached, threshold, limit)
+
+            if entries is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+        return [entry[2] for entry in entries]
+
+    @staticmethod
+    def _expired(cached):
+        expires = cached[0]
+        return expires is not None and expires <= time.monotonic()
+
+    @staticmethod
+    def _serve(cached, threshold, limit):
+        """
+        Return the cached entries matching `threshold` and `limit`, or
+        ``None`` if the cached result is not broad enough.
+        """
+        _, cached_threshold, cached_limit, entries = cached
+        complete = cached_limit <= 0 or len(entries) < cached_limit
+
+        if complete and threshold >= cached_threshold:
+            # every result over the cached threshold is there, so the ones
+            # over the requested threshold are too, in the same order
+            entries = [entry for entry in entries if entry[3] >= threshold]
+        elif threshold != cached_threshold or not 0 < limit <= cached_limit:
+            return None
+
+        return entries[:limit] if limit > 0 else entries
+
+    def store(self, key, threshold, limit, entries):
+        """
+        Store the result `entries` (see :meth:`search.ranking.TopK.entries`)
+        for `key`, searched with `threshold` and `limit`.
+        """
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        self.set(key, (expires, threshold, limit, entries))
@@ -22,3 +22,26 @@ STR_SPLIT_REGEX = r'\W+'
 
 #: words marked as stopwords will be excluded by the tokenizer functions
 STOP_WORDS = []
+
+#: default max edit distance looked up by :class:`search.typos.TypoIndex`
+MAX_EDIT_DISTANCE = 2
+
+#: number of segments of a :class:`search.segments.SegmentedIndex` over
+#: which the newest ones are merged
+MAX_SEGMENTS = 8
+
+#: max number of analysed strings kept in memory between searches
+ANALYSIS_CACHE_SIZE = 50000
+
+#: name of the default ratio backend, see :any:`search.backends.BACKENDS`
+RATIO_BACKEND = 'difflib'
+
+#: max number of string pairs whose ratio is kept by each
+#: :class:`search.cache.RatioCache`, ``0`` to disable it
+RATIO_CACHE_SIZE = 100000
+
+#: size of the q-grams used by :class:`search.batch.Column` profiles
+QGRAM_SIZE = 2
+
+#: number of objects rated together by each step of an asynchronous search
+ASYNC_BATCH_SIZE = 256
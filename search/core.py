@@ -3,8 +3,21 @@ Search API core module
 
 Contains the main functions to perform a search.
 """
+import asyncio
+import threading
+import time
+from functools import partial
+
 from search import utils, config
-from search.matchers import lazy_match as matcher
+from search.backends import get_backend
+from search.cache import RatioCache, fingerprint
+from search.corpus import Corpus, rows
+from search.analysis import analyze, compile_query, default
+from search.index import SearchIndex
+from search.parallel import SharedCorpus, WorkerPool
+from search.ranking import collect, rate, TopK
+from search.segments import SegmentedIndex
+from search.stats import SearchStats
 
 
 class SearchEngine:
@@ -22,16 +35,81 @@ class SearchEngine:
         >>> search_engine = SearchEngine(['attr_name'], limit=10)
         >>> result = search_engine.search('john doe')
 
+    The function used to compare strings can be chosen through `backend`,
+    either with the name of one of the :any:`search.backends.BACKENDS` or
+    passing the ratio function itself
+
+        >>> search_engine = SearchEngine(['attr_name'], backend='indel')
+
+    With ``workers > 1`` searches are split across a persistent pool of
+    processes (see :mod:`search.parallel`), that should be released with
+    :meth:`close`, or using the engine as a context manager
+
+        >>> with SearchEngine(['attr_name'], workers=4) as search_engine:
+        ...     result = search_engine.search('john doe', [people])
+
+    Datasets other than a :class:`search.parallel.SharedCorpus` are copied
+    in shared memory for the workers: a :class:`search.corpus.Corpus` is
+    copied once and reused until it changes, any other dataset on every
+    search.
+
+    Results can be cached passing a :class:`search.cache.ResultCache` as
+    `cache`, that will be used by :meth:`search` (and calling the engine).
+
+    The ratios of the strings compared are kept between searches by a
+    :class:`search.cache.RatioCache` of `ratio_cache` pairs, that can be
+    disabled with ``ratio_cache=0``. Its counters are on :any:`ratio`
+
+        >>> search_engine.ratio.hit_rate
+        0.93
+
+    With ``instrument=True`` each :meth:`search` records a
+    :class:`search.stats.SearchStats`, available as :any:`last_stats` and
+    passed to the `on_stats` callback, if given
+
+        >>> search_engine = SearchEngine(['attr_name'], instrument=True)
+        >>> result = search_engine.search('john doe', [people])
+        >>> search_engine.last_stats.branches
+        Counter({'best_token_ratio': 12, 'token_sort_ratio': 3})
+
+    Instrumentation slows down the search, and it is not available for the
+    searches split across worker processes, that leave only `elapsed` set.
+
+    Queries and attribute values are tokenized by the given
+    :class:`search.analysis.Analyzer`, that should be the same the searched
+    indexes were built with (both use the default one if not given)
+
+        >>> analyzer = Analyzer(min_length=1, stop_words=['the', 'and'])
+        >>> search_engine = SearchEngine(['attr_name'], analyzer=analyzer)
+
     For actual documentation on the search functionality and parameters refer
     to the :any:`SearchEngine.search` method documentation.
     """
 
     def __init__(self, attributes,
-                 limit=-1, threshold=config.THRESHOLD, weights=None):
+                 limit=-1, threshold=config.THRESHOLD, weights=None,
+                 backend=None, workers=None, cache=None, instrument=False,
+                 on_stats=None, ratio_cache=config.RATIO_CACHE_SIZE,
+                 analyzer=None):
         self.attributes = attributes
         self.limit = limit
         self.threshold = threshold
         self.weights = weights
+        self.ratio = get_backend(backend)
+        if ratio_cache:
+            self.ratio = RatioCache(self.ratio, ratio_cache)
+        self.workers = workers
+        self.cache = cache
+        self.analyzer = analyzer or default
+        self.instrument = instrument or on_stats is not None
+        self.on_stats = on_stats
+        #: :class:`search.stats.SearchStats` of the last instrumented search
+        self.last_stats = None
+        self._pool = None
+        # (fingerprint, attributes) and shared copy of the last dataset
+        # searched in parallel, see :meth:`_search_parallel`
+        self._shared = None
+        self._shared_lock = threading.Lock()
 
         if not self.weights or len(attributes) != len(weights):
             self.weights = utils.generate_weights(attributes)
@@ -48,6 +126,25 @@ class SearchEngine:
             weights=weights,
         )
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the worker processes, if any were started, and release the
+        shared copy of the last dataset they searched.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        with self._shared_lock:
+            if self._shared is not None:
+                self._shared[1].close()
+                self._shared = None
+
     def search(
             self, query, dataset, attributes=None, limit=None,
             threshold=None, weights=None):
@@ -71,7 +168,16 @@ class SearchEngine:
             query (str): String to search for
             attributes (list): The names of thetable columns to search into.
             dataset (iterable): iterable of `objects` to lookup. All objects
-                in the dataset **must** have the specified attribute(s)
+                in the dataset **must** have the specified attribute(s).
+                A :class:`search.index.SearchIndex` can be passed too, in
+                which case only its candidates for the query are scored
+                (for a :class:`search.segments.SegmentedIndex`, those of a
+                snapshot taken at the start of the search),
+                or a :class:`search.corpus.Corpus`, whose values are read
+                from its columns instead of the objects.
+                When searching with more than one worker, passing a
+                :class:`search.parallel.SharedCorpus` avoids copying the
+                dataset in shared memory for each search.
             limit (int): max number of results to return. if ``-1`` will return
                 everything.
             threshold (float): paragon for validating match results.
@@ -109,38 +215,364 @@ class SearchEngine:
         limit = limit or self.limit
         threshold = threshold or self.threshold
 
-        matches = []
-        if not weights or len(weights) != len(attributes):
-            # list of integers of the same length of `attributes` as in
-            # [3, 2, 1] for attributes = ['a', 'b', 'c']
-            weights = list(range(len(attributes), 0, -1))
+        weights = self._weights(attributes, weights)
+
+        stats = SearchStats() if self.instrument else None
+        start = time.perf_counter()
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(
+                query, dataset, attributes, weights, self.ratio,
+                self.analyzer)
+            if key is not None:
+                cached = self.cache.lookup(key, threshold, limit)
+                if cached is not None:
+                    if stats is not None:
+                        stats.cached = True
+                        self._report(stats, start)
+                    return cached
+
+        # analyse the query once, instead of once for each object attribute
+        query = compile_query(query, self.analyzer)
+
+        if isinstance(dataset, SegmentedIndex):
+            dataset = dataset.snapshot()
+        if isinstance(dataset, SearchIndex):
+            dataset = dataset.candidates(
+                query, attributes, self.ratio, threshold)
+
+        if self.workers and self.workers > 1:
+            results = self._search_parallel(
+                query, dataset, attributes, weights, threshold, limit)
+        elif stats is not None:
+            rows = stats.rows(dataset, attributes)
+            results = collect(
+                query, rows, weights, threshold, limit, self.ratio,
+                stats=stats)
+        else:
+            rows = self._rows(dataset, attributes)
+            results = collect(
+                query, rows, weights, threshold, limit, self.ratio)
+
+        if key is not None:
+            self.cache.store(key, threshold, limit, results.entries())
+
+        if stats is not None:
+            self._report(stats, start)
+
+        return results.items()
+
+    def _report(self, stats, start):
+        """Complete `stats` of the search begun at `start` and publish it."""
+        stats.elapsed = time.perf_counter() - start
+        self.last_stats = stats
+        if self.on_stats is not None:
+            self.on_stats(stats)
+
+    def search_many(
+            self, queries, dataset, attributes=None, limit=None,
+            threshold=None, weights=None):
+        """
+        Search `dataset` for each one of the `queries`, walking through the
+        dataset only once. Each object attribute is read and analysed once
+        and then matched against all the queries, so this is faster than
+        calling :meth:`search` for each query, with the same results.
 
-        weights = utils.scale_to_one(weights)
-        weights = {attr: w for attr, w in zip(attributes, weights)}
+        Arguments:
+            queries (iterable): Strings to search for
+            dataset (iterable): iterable of `objects` to lookup, or a
+                :class:`search.index.SearchIndex`.
+            attributes (list): The names of the attributes to search into.
+            limit (int): max number of results to return for each query.
+                if ``-1`` will return everything.
+            threshold (float): paragon for validating match results.
+            weights (list): matching `attributes` argument, describes the
+                attributes weights (see :meth:`search`).
 
-        for obj in dataset:
-            partial_matches = []
+        Returns:
+            list: one list of results for each query, in the same order of
+            `queries`, as returned by :meth:`search`.
 
-            for attr in attributes:
-                attrval = getattr(obj, attr)
+        Example:
+            >>> search_engine = SearchEngine(['name'], limit=10)
+            >>> john, jane = search_engine.search_many(
+            ...     ['john', 'jane'], Item.select())
+        """
+        attributes = attributes or self.attributes
+        weights = self._weights(attributes, weights or self.weights)
+        limit = limit or self.limit
+        threshold = threshold or self.threshold
+        max_weight = max(weights)
+
+        queries = [compile_query(query, self.analyzer) for query in queries]
+        results = [TopK(limit) for _ in queries]
+        min_matches = [threshold] * len(queries)
+
+        # ids of the objects each query should rate, if searching an index
+        wanted = None
+        if isinstance(dataset, SegmentedIndex):
+            dataset = dataset.snapshot()
+        if isinstance(dataset, SearchIndex):
+            wanted = [
+                set(dataset.candidate_ids(
+                    query, attributes, self.ratio, threshold))
+                for query in queries
+            ]
+            # only the candidates of some query are read and analysed
+            ids = sorted(set().union(*wanted))
+            if dataset.corpus is not None:
+                objects = zip(ids, dataset.corpus.rows(attributes, ids))
+            else:
+                objects = zip(ids, rows(
+                    (dataset.documents[i] for i in ids), attributes))
+        else:
+            objects = enumerate(rows(dataset, attributes))
+
+        for seq, (obj, values) in objects:
+            values = [analyze(value, self.analyzer) for value in values]
+
+            for i, query in enumerate(queries):
+                if wanted is not None and seq not in wanted[i]:
+                    continue
+
+                match, rating = rate(
+                    query, values, weights, self.ratio,
+                    min_score=min_matches[i])
+                if match >= min_matches[i] and \
+                        results[i].push(rating, seq, obj, match):
+                    if results[i].full:
+                        min_matches[i] = max(
+                            threshold, results[i].cutoff - max_weight)
+
+        return [result.items() for result in results]
+
+    async def async_search(
+            self, query, dataset, attributes=None, limit=None,
+            threshold=None, weights=None, batch_size=config.ASYNC_BATCH_SIZE,
+            executor=None):
+        """
+        Coroutine version of :meth:`search`, for applications running an
+        :mod:`asyncio` event loop, returning the same results.
 
-                match = matcher(query, attrval)
-                partial_matches.append({'attr': attr, 'match': match})
+        The `dataset` can be either an asynchronous iterable (such as an
+        async ORM cursor) or a plain one. Objects are read in batches of
+        `batch_size` and each batch is rated in `executor` (the loop default
+        one if ``None``) while the next one is read, so that the event loop
+        is never blocked for more than a batch.
+        Cancelling the search stops reading the dataset.
 
-            # get the highest match for each attribute and multiply it by the
-            # attribute weight, so we can get the weighted average to return
-            match = max(partial_matches, key=lambda m: m['match'])
-            # match = match['match']  # * weights[match['attr']]
-            match, attr_weight = match['match'], weights[match['attr']]
-            rating = match + attr_weight
+        Arguments:
+            query (str): String to search for
+            dataset (iterable): iterable or asynchronous iterable of
+                `objects` to lookup, or a :class:`search.index.SearchIndex`.
+            attributes (list): The names of the attributes to search into.
+            limit (int): max number of results to return. if ``-1`` will
+                return everything.
+            threshold (float): paragon for validating match results.
+            weights (list): matching `attributes` argument, describes the
+                attributes weights (see :meth:`search`).
+            batch_size (int): number of objects rated at each step.
+            executor (concurrent.futures.Executor): where to rate batches.
+
+        Returns:
+            list: the same results of :meth:`search`.
+
+        Example:
+            >>> search_engine = SearchEngine(['name'], limit=10)
+            >>> results = await search_engine.async_search(
+            ...     'john', Item.select().iterator())
+        """
+        attributes = attributes or self.attributes
+        weights = self._weights(attributes, weights or self.weights)
+        limit = limit or self.limit
+        threshold = threshold or self.threshold
+        max_weight = max(weights)
+
+        query = compile_query(query, self.analyzer)
+
+        if isinstance(dataset, SegmentedIndex):
+            dataset = dataset.snapshot()
+        if isinstance(dataset, SearchIndex):
+            dataset = dataset.candidates(
+                query, attributes, self.ratio, threshold)
+
+        loop = asyncio.get_running_loop()
+        results = TopK(limit)
+
+        def merge(batch_results):
+            for rating, neg_seq, obj, match in batch_results.entries():
+                results.push(rating, -neg_seq, obj, match)
+
+        columnar = isinstance(dataset, Corpus)
+        if columnar:
+            dataset = dataset.rows(attributes)
+
+        pending = None
+        start = 0
+        try:
+            async for batch in _batches(dataset, batch_size):
+                # attributes are read in the loop, as objects coming from an
+                # async source may not be safe to use from other threads
+                rows = batch if columnar else [
+                    (obj, [getattr(obj, attr) for attr in attributes])
+                    for obj in batch
+                ]
+                if pending is not None:
+                    merge(await pending)
+
+                min_match = threshold
+                if results.full:
+                    min_match = max(threshold, results.cutoff - max_weight)
+
+                pending = loop.run_in_executor(executor, partial(
+                    collect, query, rows, weights, min_match, limit,
+                    self.ratio, start))
+                start += len(rows)
+
+            if pending is not None:
+                merge(await pending)
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+
+        return results.items()
+
+    def iter_search(
+            self, query, dataset, attributes=None, threshold=None,
+            weights=None, stop_after=None, good_enough=1.0):
+        """
+        Generator version of :meth:`search`, that yields the matching objects
+        as soon as they are found, while walking through the `dataset`.
+        Objects are yielded in the same order they have in the dataset, not
+        sorted by relevance, so that the dataset is only consumed as needed.
+
+        With `stop_after` the search stops, without consuming the rest of the
+        dataset, as soon as that many objects matching at least `good_enough`
+        have been yielded. Also the caller can stop iterating at any time.
 
-            if match >= threshold:
-                result_data = {'data': obj, 'match': match, 'rating': rating}
-                matches.append(result_data)
+        Arguments:
+            query (str): String to search for
+            dataset (iterable): iterable of `objects` to lookup, or a
+                :class:`search.index.SearchIndex`.
+            attributes (list): The names of the attributes to search into.
+            threshold (float): paragon for validating match results.
+            weights (list): matching `attributes` argument, describes the
+                attributes weights (see :meth:`search`).
+            stop_after (int): number of good enough matches after which the
+                search stops. if ``None`` the whole dataset is searched.
+            good_enough (float): match value for a match to count toward
+                `stop_after`, defaults to perfect matches only.
 
-        matches.sort(key=lambda m: m['rating'], reverse=True)
+        Yields:
+            tuple: ``(object, match)`` for each object matching over
+            `threshold`.
 
-        if limit > 0:
-            matches = matches[:limit]
+        Example:
+            >>> search_engine = SearchEngine(['name'])
+            >>> cursor = Item.select().iterator()
+            >>> for item, match in search_engine.iter_search(
+            ...         'john', cursor, stop_after=3):
+            ...     print(item, match)
+        """
+        attributes = attributes or self.attributes
+        weights = self._weights(attributes, weights or self.weights)
+        threshold = threshold or self.threshold
 
-        return [m['data'] for m in matches]
+        query = compile_query(query, self.analyzer)
+
+        if isinstance(dataset, SegmentedIndex):
+            dataset = dataset.snapshot()
+        if isinstance(dataset, SearchIndex):
+            dataset = dataset.candidates(
+                query, attributes, self.ratio, threshold)
+
+        good = 0
+        for obj, values in self._rows(dataset, attributes):
+            match, _ = rate(
+                query, values, weights, self.ratio, min_score=threshold)
+            if match < threshold:
+                continue
+
+            yield obj, match
+
+            if match >= good_enough:
+                good += 1
+                if stop_after is not None and good >= stop_after:
+                    return
+
+    def _search_parallel(self, query, dataset, attributes, weights,
+                         threshold, limit):
+        """
+        Search `dataset` splitting the work across the worker processes,
+        returning the collected :class:`search.ranking.TopK`.
+        """
+        if self._pool is None:
+            self._pool = WorkerPool(self.workers)
+
+        args = (query, attributes, weights, threshold, limit, self.ratio,
+                self.analyzer)
+        if isinstance(dataset, SharedCorpus) and \
+                set(attributes) <= set(dataset.attributes):
+            return self._pool.search(dataset, *args)
+
+        version = fingerprint(dataset)
+        if version is None:
+            # a plain iterable may change at any time, so it is copied for
+            # this search only
+            with SharedCorpus(dataset, attributes) as corpus:
+                return self._pool.search(corpus, *args, temporary=True)
+
+        # the copy of a versioned dataset is kept until it changes, or
+        # another one is searched, and never left attached to the workers
+        key = version, tuple(attributes)
+        with self._shared_lock:
+            if self._shared is None or self._shared[0] != key:
+                if self._shared is not None:
+                    self._shared[1].close()
+                self._shared = key, SharedCorpus(dataset, attributes)
+            return self._pool.search(self._shared[1], *args, temporary=True)
+
+    @staticmethod
+    def _rows(dataset, attributes):
+        """Yield each object with a generator of its attribute values."""
+        if isinstance(dataset, Corpus):
+            yield from dataset.rows(attributes)
+            return
+        for obj in dataset:
+            yield obj, (getattr(obj, attr) for attr in attributes)
+
+    @staticmethod
+    def _weights(attributes, weights):
+        """Return the list of the scaled weights for each attribute."""
+        if not weights or len(weights) != len(attributes):
+            # list of integers of the same length of `attributes` as in
+            # [3, 2, 1] for attributes = ['a', 'b', 'c']
+            weights = list(range(len(attributes), 0, -1))
+
+        return utils.scale_to_one(weights)
+
+
+async def _batches(dataset, size):
+    """
+    Asynchronously yield lists of at most `size` objects from `dataset`,
+    that can be either an iterable or an asynchronous iterable.
+    """
+    batch = []
+    if hasattr(dataset, '__aiter__'):
+        async for obj in dataset:
+            batch.append(obj)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    else:
+        for obj in dataset:
+            batch.append(obj)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+                # plain iterables never give control back to the loop
+                await asyncio.sleep(0)
+
+    if batch:
+        yield batch
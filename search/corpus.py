@@ -0,0 +1,120 @@
+"""
+Columnar corpus
+
+Contains the :class:`Corpus`, a container that reads the searched attributes
+of a dataset once and keeps only their values, one column for each
+attribute, so that searches never read the attributes of the objects again
+(which for ORM models may mean descriptors and lazy loads) and the objects
+themselves can be released, keeping only their ids.
+"""
+import sys
+
+from search.cache import new_uid
+
+
+class Corpus:
+    """
+    The values of the given `attributes` for each object of `dataset`, stored
+    in one list for each attribute, together with the item returned for each
+    object in the search results.
+
+    The corpus can be used anywhere a dataset is accepted by the engine
+
+        >>> corpus = Corpus(Item.select(), ['name', 'category'], key='id')
+        >>> search_engine = SearchEngine(['name', 'category'], limit=10)
+        >>> search_engine.search('aweso', corpus)
+        [12, 7]
+
+    returning the objects, or their `key` if given. Repeated string values
+    are stored only once.
+
+    .. note::
+        The corpus is a snapshot of the dataset at creation time, so changes to
+        the objects will not be reflected until the corpus is rebuilt, or the
+        objects are appended again.
+
+    Arguments:
+        dataset (iterable): iterable of `objects` to read.
+        attributes (list): names of the attributes to store.
+        key (str or callable): name of the attribute, or function of the
+            object, giving the item to keep in place of each object. if
+            ``None`` the objects themselves are kept.
+    """
+
+    def __init__(self, dataset, attributes, key=None):
+        self.attributes = list(attributes)
+        self.key = key
+        #: the item of each row, as returned by the searches
+        self.items = []
+        #: attribute -> list of its value for each row
+        self.columns = {attr: [] for attr in self.attributes}
+        # incremented on each change, see :class:`search.cache.ResultCache`
+        self.version = 0
+        self.uid = new_uid()
+
+        for obj in dataset:
+            self.append(obj)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def append(self, obj):
+        """Read the attributes of `obj` into a new row and return its id."""
+        item = obj
+        if callable(self.key):
+            item = self.key(obj)
+        elif self.key is not None:
+            item = getattr(obj, self.key)
+
+        values = [getattr(obj, attr) for attr in self.attributes]
+
+        self.items.append(item)
+        for attr, value in zip(self.attributes, values):
+            if type(value) is str:
+                value = sys.intern(value)
+            self.columns[attr].append(value)
+        self.version += 1
+        return len(self.items) - 1
+
+    def rows(self, attributes=None, ids=None):
+        """
+        Yield the item of each row with the list of its `attributes` values
+        (all of them by default), for the rows at `ids` or for every row.
+
+        Raises:
+            AttributeError: if one of the `attributes` is not in the corpus.
+        """
+        try:
+            columns = [self.columns[attr] for attr in attributes or
+                       self.attributes]
+        except KeyError as exc:
+            raise AttributeError(
+                'attribute {} is not in the corpus'.format(exc)) from None
+
+        if ids is None:
+            ids = range(len(self.items))
+        for i in ids:
+            yield self.items[i], [column[i] for column in columns]
+
+    def take(self, ids):
+        """Return a new :class:`Corpus` with only the rows at `ids`."""
+        corpus = Corpus((), self.attributes, self.key)
+        corpus.items = [self.items[i] for i in ids]
+        for attr, column in self.columns.items():
+            corpus.columns[attr] = [column[i] for i in ids]
+        corpus.version = len(corpus.items)
+        return corpus
+
+
+def rows(dataset, attributes):
+    """
+    Yield each object of `dataset` with the list of its `attributes` values,
+    read from the columns if `dataset` is a :class:`Corpus`.
+    """
+    if isinstance(dataset, Corpus):
+        return dataset.rows(attributes)
+    return (
+        (obj, [getattr(obj, attr) for attr in attributes]) for obj in dataset)
@@ -0,0 +1,331 @@
+"""
+Inverted index
+
+Contains an optional, in-memory index that can be built once from a dataset
+and passed to :class:`search.core.SearchEngine` in place of the dataset
+itself. Instead of scoring every object the engine will only score the
+`candidates` that could reach the threshold, leaving the actual matching to
+the usual matchers.
+"""
+from array import array
+
+from search import utils, config
+from search.analysis import analyze, default
+from search.batch import Column
+from search.cache import new_uid
+from search.corpus import Corpus
+from search.typos import TypoIndex, levenshtein
+
+
+class SearchIndex:
+    """
+    Inverted index of the tokens found in the given `attributes` of each
+    object in `dataset`, with the vocabulary grouped by token length.
+
+    The index can be used anywhere a dataset is accepted by the engine
+
+        >>> index = SearchIndex(Item.select(), ['name', 'category'])
+        >>> search_engine = SearchEngine(['name', 'category'], limit=10)
+        >>> results = search_engine.search('aweso', index)
+
+    and the engine will only score the objects that could match the query:
+    the ones containing a token similar enough to one of the query tokens to
+    be considered in common by :func:`search.utils.sorted_intersect`, and
+    the ones with a value whose upper bounds of the matchers ratios (see
+    :meth:`candidate_ids`) reach the threshold. The candidates are a
+    superset of the objects a full scan would find, so the results are the
+    same, in the same order. Candidates are returned in the same order they
+    had in the dataset.
+
+    If `dataset` is a :class:`search.corpus.Corpus`, the index reads the
+    values from it and keeps it as :any:`corpus`, and the candidates are
+    returned as a corpus too.
+
+    If `prefilter` is true, each attribute is also encoded in a
+    :class:`search.batch.Column` and the candidates are further restricted
+    to the objects with at least one attribute that the q-gram count filter
+    cannot rule out (see :meth:`search.batch.Column.plausible`). The filter
+    only discards objects that cannot reach the threshold, so the results
+    are still the same, but it rules out more of them the higher the
+    thresholds are: with the default ones it rarely rules out any.
+
+    If `typos` is given, the vocabulary is also stored in a
+    :class:`search.typos.TypoIndex` with that max edit distance, that
+    :meth:`fuzzy` uses to look up the tokens within some edits of a term.
+
+    .. note::
+        The index is a snapshot of the dataset at creation time, so changes to
+        the objects will not be reflected until the index is rebuilt.
+
+    Arguments:
+        dataset (iterable): iterable of `objects` to index.
+        attributes (list): names of the attributes to index.
+        prefilter (bool): whether to restrict the candidates with the
+            q-gram count filter of the batch columns.
+        typos (int): max edit distance of the typo tolerant vocabulary. if
+            ``None`` the vocabulary is not built.
+        analyzer (search.analysis.Analyzer): the analyzer tokenizing the
+            values, the default one if not given.
+    """
+
+    def __init__(self, dataset, attributes, prefilter=False, typos=None,
+                 analyzer=None):
+        self.attributes = list(attributes)
+        self.prefilter = prefilter
+        self.analyzer = analyzer or default
+        self.documents = []
+        #: the indexed :class:`search.corpus.Corpus`, if any
+        self.corpus = None
+        # token -> ids of the documents containing it
+        self.vocabulary = {}
+        # token length -> tokens that long, to look up similar tokens
+        self.by_length = {}
+        # attribute -> the value, the number of tokens and the joined tokens
+        # of each document, to bound the matchers ratios
+        self.values = {attr: [] for attr in self.attributes}
+        self.counts = {attr: array('I') for attr in self.attributes}
+        self.joined = {attr: [] for attr in self.attributes}
+        # incremented on each change, see :class:`search.cache.ResultCache`
+        self.version = 0
+        self.uid = new_uid()
+        # attribute -> column of its values, for the batch prefilter
+        self.columns = {}
+        if prefilter:
+            self.columns = {
+                attr: Column((), analyzer=self.analyzer)
+                for attr in self.attributes
+            }
+        # typo tolerant vocabulary, see :meth:`fuzzy`
+        self.typos = None
+        if typos is not None:
+            self.typos = TypoIndex(max_distance=typos)
+
+        if isinstance(dataset, Corpus):
+            # the corpus rows are the index documents
+            self.corpus = dataset
+            self.documents = dataset.items
+            self.values = {
+                attr: dataset.columns[attr] for attr in self.attributes
+            }
+            for doc_id, (_, values) in enumerate(
+                    dataset.rows(self.attributes)):
+                self._index(doc_id, values)
+        else:
+            for obj in dataset:
+                self.add(obj)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def add(self, obj):
+        """Append `obj` to the index and return its document id."""
+        if self.corpus is not None:
+            doc_id = self.corpus.append(obj)
+            values = [self.corpus.columns[attr][doc_id]
+                      for attr in self.attributes]
+        else:
+            doc_id = len(self.documents)
+            self.documents.append(obj)
+            values = [getattr(obj, attr) for attr in self.attributes]
+            for attr, value in zip(self.attributes, values):
+                self.values[attr].append(value)
+
+        self._index(doc_id, values)
+        return doc_id
+
+    def _index(self, doc_id, values):
+        """Index the attribute `values` of the document `doc_id`."""
+        self.version += 1
+
+        tokens = set()
+        for attr, value in zip(self.attributes, values):
+            analysis = analyze(value, self.analyzer)
+            tokens.update(analysis.sorted_tokens)
+            self.counts[attr].append(analysis.length)
+            self.joined[attr].append(analysis.joined)
+            if self.columns:
+                self.columns[attr].append(value)
+
+        for token in tokens:
+            if token not in self.vocabulary:
+                self.vocabulary[token] = []
+                self.by_length.setdefault(len(token), []).append(token)
+                if self.typos is not None:
+                    self.typos.add(token)
+            self.vocabulary[token].append(doc_id)
+
+    def lookup(self, token, ratio=utils.ratio):
+        """
+        Return the set of indexed tokens equal to `token` or having a `ratio`
+        with it of at least :any:`config.THRESHOLD`, that is the ones
+        :func:`search.utils.sorted_intersect` considers in common with it.
+
+        Every token is checked, but with the ratios bounded by their matching
+        characters (see :func:`search.utils.is_bounded`) the ones whose
+        length or characters cannot reach the threshold are not rated.
+        """
+        threshold = config.THRESHOLD
+        bounded = utils.is_bounded(ratio)
+        tokens = {token} if token in self.vocabulary else set()
+        for length, others in self.by_length.items():
+            # same as the real_quick_ratio of any token that long
+            if bounded and \
+                    2.0 * min(length, len(token)) / (length + len(token)) < \
+                    threshold:
+                continue
+            for other in others:
+                if bounded and utils.quick_ratio(token, other) < threshold:
+                    continue
+                if ratio(token, other) >= threshold:
+                    tokens.add(other)
+        return tokens
+
+    def fuzzy(self, term, distance=None):
+        """
+        Return the sorted list of the ids of the documents containing a token
+        within `distance` edits of `term`, by default the max distance of the
+        typo tolerant vocabulary, or :any:`config.MAX_EDIT_DISTANCE`.
+
+        Without a typo tolerant vocabulary (see `typos`) every token of the
+        index is compared with `term`.
+        """
+        if distance is None:
+            distance = config.MAX_EDIT_DISTANCE
+            if self.typos is not None:
+                distance = self.typos.max_distance
+
+        if self.typos is not None:
+            tokens = self.typos.lookup(term, distance)
+        else:
+            tokens = [
+                token for token in self.vocabulary
+                if levenshtein(term, token, distance) <= distance
+            ]
+
+        doc_ids = set()
+        for token in tokens:
+            doc_ids.update(self.vocabulary[token])
+        return sorted(doc_ids)
+
+    def candidates(self, query, attributes=None, ratio=utils.ratio,
+                   threshold=None):
+        """
+        Return the list of indexed objects that should be scored against
+        `query`, in the order they were added to the index.
+
+        If the query does not produce any token, if some of the requested
+        `attributes` were not indexed, or if `ratio` is not bounded by its
+        matching characters (see :func:`search.utils.is_bounded`), every
+        object is returned, since the index cannot be used to discard
+        anything.
+
+        Arguments:
+            query (str): the search query, or its compiled version
+            attributes (list): the attributes that will be searched, defaults
+                to the indexed ones.
+            ratio (callable): the ratio function used by the matchers.
+            threshold (float): the minimum match of the results,
+                :any:`config.THRESHOLD` if not given.
+
+        Returns:
+            list: the objects that may match the query, or a
+            :class:`search.corpus.Corpus` of them if the index was built
+            from one.
+        """
+        doc_ids = self.candidate_ids(query, attributes, ratio, threshold)
+        if self.corpus is not None:
+            return self.corpus.take(doc_ids)
+        return [self.documents[i] for i in doc_ids]
+
+    def candidate_ids(self, query, attributes=None, ratio=utils.ratio,
+                      threshold=None):
+        """
+        Same as :meth:`candidates`, but returns the sorted list of the ids of
+        the candidates instead of the objects.
+
+        The candidates are the documents containing one of the tokens of
+        :meth:`lookup`, since the query and the value then have tokens in
+        common, and the documents with a value that could reach `threshold`
+        through any of the matchers :func:`search.matchers.dispatch` chooses
+        without tokens in common, given the upper bounds of their ratios:
+        the :func:`search.utils.quick_ratio` of the whole strings, or of the
+        joined tokens, and the :func:`search.utils.best_partial_bound` of the
+        query tokens on the joined tokens of short values.
+        """
+        if attributes and not set(attributes) <= set(self.attributes):
+            return list(range(len(self.documents)))
+
+        query = analyze(query, self.analyzer)
+        if not query.length or not utils.is_bounded(ratio):
+            return list(range(len(self.documents)))
+
+        if threshold is None:
+            threshold = config.THRESHOLD
+        # a margin so that rounding never discards a value matching as much
+        minimum = threshold - 1e-9
+
+        doc_ids = set()
+        for token in query.sorted_tokens:
+            for other in self.lookup(token, ratio):
+                doc_ids.update(self.vocabulary[other])
+
+        for attr in attributes or self.attributes:
+            values, counts, joined = \
+                self.values[attr], self.counts[attr], self.joined[attr]
+            for doc_id, count in enumerate(counts):
+                if doc_id not in doc_ids and _reachable(
+                        query, values, count, joined, doc_id, minimum):
+                    doc_ids.add(doc_id)
+
+        if self.columns:
+            doc_ids &= self.plausible(query, attributes, threshold)
+
+        return sorted(doc_ids)
+
+    def plausible(self, query, attributes=None, threshold=None):
+        """
+        Return the set of document ids that have at least one attribute that
+        the q-gram count filter cannot rule out to match `query` at least
+        `threshold` (:any:`config.THRESHOLD` by default).
+        """
+        threshold = config.THRESHOLD if threshold is None else threshold
+        query = analyze(query, self.analyzer)
+        doc_ids = set()
+        for attr in attributes or self.attributes:
+            column = self.columns[attr]
+            doc_ids.update(column.plausible(query, threshold))
+        return doc_ids
+
+
+def _reachable(query, values, count, joined, doc_id, minimum):
+    """
+    Tell if the value of the document `doc_id`, with `count` tokens, could be
+    rated at least `minimum` against the analysed `query` without tokens in
+    common, by the matcher :func:`search.matchers.dispatch` would choose.
+    """
+    if count == 1 or (count == 0 and query.length == 1):
+        # simple_ratio rates the whole strings
+        query_string, string = str(query), str(values[doc_id])
+        if utils.real_quick_ratio(query_string, string) >= minimum and \
+                utils.quick_ratio(query_string, string) >= minimum:
+            return True
+    if count == 0:
+        # intersect_token_ratio rates the empty common and value tokens
+        # against each other for the longest queries
+        return query.length >= 5
+
+    string = joined[doc_id]
+    if count < 5 and query.length < 5:
+        # best_token_ratio and token_sort_ratio rate the query tokens
+        # against the segments of the joined tokens
+        for token in query.sorted_tokens:
+            if utils.best_partial_bound(token, string, minimum) >= \
+                    minimum:
+                return True
+
+    # intersect_token_ratio rates the joined tokens against each other
+    return utils.real_quick_ratio(query.joined, string) >= minimum and \
+        utils.quick_ratio(query.joined, string) >= minimum
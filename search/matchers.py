@@ -6,74 +6,105 @@ value between 0 and 1, where 0 is completely different and 1 represent complete
 equality (as in "hello world", "hello world")
 """
 from search import utils, config
+from search.analysis import analyze
 
 
 # =====================================================================
 # String similarity functions
 # ---------------------------------------------------------------------
 # A set of functions that calculate the edit distance between two
-# strings
-
-def simple_ratio(query, string):
-    return utils.ratio(query, string)
-
-
-def best_token_ratio(query, string):
-    query = utils.sorted_unique_tokens(query)
-    string = utils.sorted_unique_tokens(string)
-    string = utils.stringify_tokens(string)
+# strings. Each function accepts either strings or their already
+# computed :class:`search.analysis.Analysis`, the `ratio` function
+# to use (see :mod:`search.backends`) and the `min_score` the caller
+# needs: whenever the bounds of the ratios (see
+# :func:`search.utils.real_quick_ratio`) show that the result is below
+# it, the remaining work is skipped and a value below `min_score` is
+# returned instead of the exact one. The bounds only hold for the
+# ratios that declare them (see :func:`search.utils.is_bounded`), with
+# any other one the exact value is always returned.
+
+def simple_ratio(query, string, ratio=utils.ratio, min_score=0):
+    query, string = str(query), str(string)
+    if min_score and utils.is_bounded(ratio):
+        bound = utils.real_quick_ratio(query, string)
+        if bound >= min_score:
+            bound = utils.quick_ratio(query, string)
+        if bound < min_score:
+            utils.skipped('matches')
+            return bound
+    return ratio(query, string)
+
+
+def best_token_ratio(query, string, ratio=utils.ratio, min_score=0):
+    query = analyze(query).sorted_tokens
+    string = analyze(string).joined
 
     prob = 0
     for segment in query:
-        match = utils.best_partial_ratio(segment, string)
+        # only the segments that could beat the best one are rated
+        match = utils.best_partial_ratio(
+            segment, string, ratio, max(min_score, prob))
         prob = match if match > prob else prob
         if prob == 1:
             break
     return prob
 
 
-def token_sort_ratio(query, string):
+def token_sort_ratio(query, string, ratio=utils.ratio, min_score=0):
     """
     generate tokens from query and string, then for each query token
     find the best partial ratio on the string and get the average value
     """
-    query_tokens = utils.sorted_unique_tokens(query)
-    string_tokens = utils.sorted_unique_tokens(string)
-    # generate and sort a set of strings, removing duplicates, then
-    # join them together again as they are (no spaces or punctuation)
-    tokenized_string = utils.stringify_tokens(string_tokens)
-
+    query_tokens = analyze(query).sorted_tokens
+    # sorted set of strings, without duplicates, joined together again
+    # as they are (no spaces or punctuation)
+    tokenized_string = analyze(string).joined
+
+    # the sum of the matches needed to reach `min_score`, minus a margin so
+    # that rounding never discards an average equal to it
+    needed = min_score * len(query_tokens) - 1e-9
+    total = 0
     matches = {}
-    for q_token in query_tokens:
-        # loop every token in the query, adding a default similarity == 0
-        # to the matches dictionary
-        matches[q_token] = 0
-        # loop for every word in the searched string
-        for token in utils.shifter(tokenized_string, len(q_token)):
-            # and call the slider on each of them, getting the similariy
-            # for every extracted token
-            match = utils.ratio(q_token, token)
-            if match > matches[q_token]:
-                matches[q_token] = match
-                if match == 1:
-                    break
+    for i, q_token in enumerate(query_tokens):
+        remaining = len(query_tokens) - i - 1
+        # best similarity of the query token with every segment of the
+        # string as long as the token, as long as the remaining tokens,
+        # matching completely, could still bring the average to min_score
+        token_min = needed - total - remaining
+        matches[q_token] = utils.best_partial_ratio(
+            q_token, tokenized_string, ratio, max(token_min, 0))
+        total += matches[q_token]
+        if matches[q_token] < token_min:
+            utils.skipped('matches')
+            return (total + remaining) / len(query_tokens)
 
     return utils.average(matches.values())
 
 
-def intersect_token_ratio(query, string):
+def intersect_token_ratio(query, string, ratio=utils.ratio, min_score=0):
     """
     Perform a match utilizing the intersection method.
     """
-    query = utils.sorted_unique_tokens(query)
-    string = utils.sorted_unique_tokens(string)
-    common, diff_q, diff_s = utils.sorted_intersect(query, string)
+    query, string = analyze(query), analyze(string)
+    if query.length and not utils.difference_sorted(query.ids, string.ids):
+        # every query token is in the string, so they are all in common and
+        # the common tokens equal the common plus the query ones
+        return ratio(query.joined, query.joined)
+
+    query, string = query.sorted_tokens, string.sorted_tokens
+    common, diff_q, diff_s = utils.sorted_intersect(query, string, ratio)
     t0 = ''.join(common)            # common elements for query and string
     t1 = ''.join(common + diff_q)   # common plus the diff elements on query
     t2 = ''.join(common + diff_s)   # common plus diff elements on string
     best = 0
+    bounded = utils.is_bounded(ratio)
     for (q, s) in ((t0, t1), (t1, t2), (t0, t2)):
-        match = utils.ratio(q, s)
+        bound = utils.real_quick_ratio(q, s) if bounded else 1
+        if bound <= best or bound < min_score:
+            # cannot beat the best pair, or reach min_score
+            utils.skipped('pairs')
+            continue
+        match = ratio(q, s)
         if match > best:
             best = match
             if best == 1:
@@ -89,35 +120,53 @@ def intersect_token_ratio(query, string):
 # the equality of the two strings
 
 
-def lazy_match(query, string):
+def dispatch(query, string):
+    """
+    Choose the matcher :func:`lazy_match` uses for the two analysed strings,
+    depending on how many tokens they have.
 
-    query_tokens = utils.tokenize_set(query)
-    string_tokens = utils.tokenize_set(string)
-    shortest, longest = sorted((query_tokens, string_tokens))
-    len_short, len_long = len(shortest), len(longest)
+    Returns:
+        callable: the matcher function, or ``None`` if neither string has
+        any token, in which case they do not match at all.
+    """
+    # the query is the shortest unless the string tokens are a subset of it
+    len_short, len_long = query.length, string.length
+    if len_long < len_short and \
+            not utils.difference_sorted(string.ids, query.ids):
+        len_short, len_long = len_long, len_short
 
     # If the longest has no length it's useless to continue
     if len_long == 0:
-        return 0
+        return None
 
     if len_long == 1:
         # len_short == 1 too, so 1 word against 1 word
-        return simple_ratio(query, string)
+        return simple_ratio
     if len_short == 1 and len_long < 4:
         # at most one word against a short string
-        return best_token_ratio(query, string)
+        return best_token_ratio
 
     if len_short < 3 and len_long < 5:
         # if the length of the short is enough, try with a
-        return token_sort_ratio(query, string)
+        return token_sort_ratio
 
     else:
         # in any other condition, such as short query against long string
         # use intersect_ratio
-        return intersect_token_ratio(query, string)
+        return intersect_token_ratio
+
+
+def lazy_match(query, string, ratio=utils.ratio, min_score=0):
+    query = analyze(query)
+    string = analyze(string, query.analyzer)
+
+    matcher = dispatch(query, string)
+    if matcher is None:
+        return 0
+    return matcher(query, string, ratio, min_score)
 
 
-def similarity(query, string):
+def similarity(query, string, ratio=utils.ratio):
     """
     Calculate the match for the given `query` and `string`.
 
@@ -128,6 +177,7 @@ def similarity(query, string):
     Arguments:
         query (str): search query
         string (str): string to test against
+        ratio (callable): ratio function to compare the segments with
 
     Returns:
         float: normalized value indicating the probability of match, where
@@ -135,8 +185,8 @@ def similarity(query, string):
     """
 
     # split the two strings cleaning out some stuff
-    query = utils.tokenize(query)
-    string = utils.tokenize(string)
+    query = analyze(query).tokens
+    string = analyze(string).tokens
 
     # if one of the two strings is falsy (no content, or was passed with items
     # short enough to be trimmed out), return 0 here to avoid ZeroDivisionError
@@ -150,7 +200,7 @@ def similarity(query, string):
     # generate a matrix from the two strings and loop on every couple
     for string1, string2 in ((s1, s2) for s1 in long_ for s2 in short):
         # get the jaro winkler equality between the two strings
-        match = utils.ratio(string1, string2)
+        match = ratio(string1, string2)
         # calculate the distance factor for the position of the segments
         # on their respective lists
         positional = position_similarity(string1, string2, long_, short)
@@ -0,0 +1,207 @@
+"""
+Parallel search
+
+Contains the :class:`SharedCorpus`, that copies the searched attribute
+values of a dataset once in a block of shared memory, and the
+:class:`WorkerPool`, a persistent pool of processes that search partitions of
+a shared corpus, so that a single search can use more than one core without
+pickling the dataset for every call.
+
+Used by :class:`search.core.SearchEngine` when created with ``workers > 1``
+
+    >>> search_engine = SearchEngine(['name'], limit=10, workers=4)
+    >>> with SharedCorpus(Item.select(), ['name']) as corpus:
+    ...     results = search_engine.search('john doe', corpus)
+    >>> search_engine.close()
+
+The worker processes keep the last :any:`ATTACHED_CORPORA` shared corpora
+they searched attached, so that searching the same one again does not map
+it again. Any other dataset is copied in a temporary shared corpus by the
+engine, that the workers detach from at the end of the search: a
+:class:`search.corpus.Corpus` is copied once and reused as long as it does
+not change, but any other dataset is copied on every search, so a dataset
+searched more than once should be passed as a :class:`SharedCorpus` (or a
+corpus).
+"""
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from search.analysis import compile_query
+from search.corpus import rows
+from search.ranking import collect, TopK
+
+#: max number of shared corpora each worker process keeps attached, among
+#: the ones not searched as temporary
+ATTACHED_CORPORA = 4
+
+# name -> attached corpus, in the worker processes
+_attached = OrderedDict()
+
+
+class SharedCorpus:
+    """
+    The values of the given `attributes` for each object of `dataset`,
+    stored as UTF-8 strings in a block of shared memory that the worker
+    processes can attach to by name.
+
+    The block starts with the ``(rows * attributes) + 1`` offsets of each
+    value, as unsigned 64 bit integers, followed by the values themselves.
+    The original objects stay in the creating process, in :any:`documents`,
+    and the corpus can still be used as an iterable of them.
+
+    The shared memory is released with :meth:`close`, or using the corpus as
+    a context manager.
+
+    Arguments:
+        dataset (iterable): iterable of `objects` to share.
+        attributes (list): names of the attributes to share.
+    """
+
+    def __init__(self, dataset, attributes):
+        self.documents = []
+        self.attributes = list(attributes)
+
+        offsets = array('Q', [0])
+        chunks = []
+        for obj, values in rows(dataset, self.attributes):
+            self.documents.append(obj)
+            for value in values:
+                chunks.append(str(value).encode('utf-8'))
+                offsets.append(offsets[-1] + len(chunks[-1]))
+
+        header = offsets.tobytes()
+        size = len(header) + offsets[-1]
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._shm.buf[:len(header)] = header
+        self._shm.buf[len(header):size] = b''.join(chunks)
+
+        #: what the workers need to attach to the corpus
+        self.spec = (self._shm.name, len(self.documents), len(self.attributes))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the shared memory block."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+class _AttachedCorpus:
+    """Read only view of a :class:`SharedCorpus` from a worker process."""
+
+    def __init__(self, spec):
+        name, rows, attributes = spec
+        self.attributes = attributes
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.offsets = array('Q')
+        header = 8 * (rows * attributes + 1)
+        self.offsets.frombytes(bytes(self.shm.buf[:header]))
+        self.start = header
+
+    def value(self, row, attr):
+        """Return the value of the attribute at index `attr` of `row`."""
+        i = row * self.attributes + attr
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        data = self.shm.buf[self.start + start:self.start + stop]
+        return bytes(data).decode('utf-8')
+
+    def close(self):
+        self.shm.close()
+
+
+def _attach(spec):
+    """Return the attached corpus for `spec`, attaching it if needed."""
+    name = spec[0]
+    corpus = _attached.get(name)
+    if corpus is None:
+        corpus = _attached[name] = _AttachedCorpus(spec)
+        while len(_attached) > ATTACHED_CORPORA:
+            _attached.popitem(last=False)[1].close()
+    _attached.move_to_end(name)
+    return corpus
+
+
+def _search_partition(spec, query, indexes, weights, threshold, limit, ratio,
+                      start, stop, analyzer=None, temporary=False):
+    """
+    Search the rows from `start` to `stop` of a shared corpus, returning
+    the collected ``(rating, -row, row, match)`` tuples, best first. A
+    `temporary` corpus is detached once searched, instead of being kept
+    attached for the next searches.
+    """
+    corpus = _AttachedCorpus(spec) if temporary else _attach(spec)
+    try:
+        query = compile_query(query, analyzer)
+        rows = (
+            (row, [corpus.value(row, attr) for attr in indexes])
+            for row in range(start, stop)
+        )
+        results = collect(
+            query, rows, weights, threshold, limit, ratio, start)
+        return results.entries()
+    finally:
+        if temporary:
+            corpus.close()
+
+
+class WorkerPool:
+    """
+    Persistent pool of `workers` processes searching a :class:`SharedCorpus`
+    in parallel. Each process searches a partition of the corpus and the
+    partial results are merged in the same order a serial search returns.
+
+    The ratio function must be importable by the worker processes, that is
+    it must be defined at module level (as the ones in
+    :mod:`search.backends`), and so the functions of the analyzer.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def search(self, corpus, query, attributes, weights, threshold, limit,
+               ratio, analyzer=None, temporary=False):
+        """
+        Search `corpus` for `query`, with the same arguments of
+        :func:`search.ranking.collect`, returning the merged
+        :class:`search.ranking.TopK` of the matching objects. The query is
+        compiled again by each worker with `analyzer`, the default one if
+        not given.
+
+        The workers keep the corpus attached for the next searches, unless
+        it is `temporary`, as the copies the engine makes and releases.
+        """
+        indexes = [corpus.attributes.index(attr) for attr in attributes]
+        size = -(-len(corpus) // self.workers) or 1
+
+        futures = [
+            self._executor.submit(
+                _search_partition, corpus.spec, str(query), indexes, weights,
+                threshold, limit, ratio, start, min(start + size, len(corpus)),
+                analyzer, temporary)
+            for start in range(0, len(corpus), size)
+        ]
+
+        results = TopK(limit)
+        for future in futures:
+            for rating, _, row, match in future.result():
+                results.push(rating, row, corpus.documents[row], match)
+        return results
+
+    def close(self):
+        """Shut down the worker processes."""
+        self._executor.shutdown()
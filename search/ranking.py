@@ -0,0 +1,167 @@
+"""
+Ranking of the search results
+
+Contains the functions to rate the objects of a dataset against a query and
+to collect the best ones, shared by every way of searching a dataset.
+"""
+import heapq
+from contextlib import nullcontext
+
+from search import utils
+from search.matchers import lazy_match
+
+
+def rate(query, values, weights, ratio=utils.ratio, matcher=lazy_match,
+         min_score=0):
+    """
+    Match `query` against each of the attribute `values` of an object and
+    return the highest match with its rating, that is the match plus the
+    weight of the attribute it was found on.
+
+    Each attribute only needs to beat the best one so far, and all of them
+    to reach `min_score`, so the matchers skip the work that cannot: if the
+    returned match is below `min_score` it is not the exact one.
+
+    Arguments:
+        query (str): the query, or its compiled version
+        values (iterable): the values of the searched attributes
+        weights (list): the weight of each attribute, in the same order
+        ratio (callable): ratio function used by the matchers
+        matcher (callable): the matcher function
+        min_score (float): the minimum match needed
+
+    Returns:
+        tuple: ``(match, rating)`` of the best attribute.
+    """
+    best, best_weight = None, None
+    for value, weight in zip(values, weights):
+        # a match equal to the best one does not replace it either
+        match = matcher(
+            query, value, ratio,
+            min_score if best is None else max(min_score, best))
+        if best is None or match > best:
+            best, best_weight = match, weight
+
+    return best, best + best_weight
+
+
+def collect(query, rows, weights, threshold, limit, ratio=utils.ratio,
+            start=0, stats=None, prune=True):
+    """
+    Rate each row against `query` and collect the ones matching over
+    `threshold` in a :class:`TopK`.
+
+    Each row is rated with the match it needs to be collected as the
+    minimum score (see :func:`rate`), that is `threshold` until `limit`
+    items are collected, and then the match needed to beat the lowest
+    of them.
+
+    Arguments:
+        query (str): the query, or its compiled version
+        rows (iterable): ``(item, values)`` tuples, where `values` are the
+            attribute values to rate and `item` what to collect.
+        weights (list): the weight of each attribute, in the same order
+        threshold (float): minimum match for an item to be collected
+        limit (int): max number of items to collect, ``-1`` for all of them
+        ratio (callable): ratio function used by the matchers
+        start (int): position of the first row inside the whole dataset
+        stats (search.stats.SearchStats): where to record what happens, if
+            the search is instrumented.
+        prune (bool): if ``False`` every row is rated exactly, without a
+            minimum score.
+
+    Returns:
+        TopK: the collected items
+    """
+    max_weight = max(weights)
+    results = TopK(limit)
+    min_match = threshold
+
+    matcher = lazy_match
+    skips = nullcontext()
+    if stats is not None:
+        ratio, matcher = stats.ratio(ratio), stats.lazy_match
+        skips = utils.recording_skips(stats.skipped)
+
+    with skips:
+        for seq, (item, values) in enumerate(rows, start):
+            match, rating = rate(
+                query, values, weights, ratio, matcher,
+                min_match if prune else 0)
+            if stats is not None:
+                stats.scanned += 1
+                stats.accepted += match >= threshold
+                stats.rejected += match < min_match
+
+            if match >= min_match and results.push(rating, seq, item, match):
+                if results.full:
+                    # once we have `limit` results, a match that cannot
+                    # reach the lowest rating can be discarded right away
+                    min_match = max(threshold, results.cutoff - max_weight)
+
+    return results
+
+
+class TopK:
+    """
+    Collects the results of a search as compact ``(rating, -seq, item, match)``
+    tuples, where `seq` is the position of the item in the dataset, so that
+    results with the same rating keep the order they had in the dataset.
+
+    When a positive `limit` is given only the best `limit` results are kept,
+    in a min-heap, so that collecting `n` results costs ``O(n log limit)``
+    time and ``O(limit)`` memory instead of sorting all of them.
+
+    Arguments:
+        limit (int): max number of results to keep. if ``-1`` all the results
+            are kept.
+    """
+    __slots__ = ('limit', '_entries')
+
+    def __init__(self, limit=-1):
+        self.limit = limit
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def full(self):
+        """``True`` if `limit` results have already been collected."""
+        return 0 < self.limit <= len(self._entries)
+
+    @property
+    def cutoff(self):
+        """
+        Lowest rating currently kept when :any:`full`, ``None`` otherwise.
+        New results must have a higher rating to be kept.
+        """
+        return self._entries[0][0] if self.full else None
+
+    def push(self, rating, seq, item, match=None):
+        """
+        Add `item` with the given `rating` and dataset position `seq`,
+        together with the `match` it was rated from.
+
+        Returns:
+            bool: ``True`` if the item was kept.
+        """
+        entry = (rating, -seq, item, match)
+        if self.limit <= 0:
+            self._entries.append(entry)
+        elif len(self._entries) < self.limit:
+            heapq.heappush(self._entries, entry)
+        elif entry > self._entries[0]:
+            heapq.heapreplace(self._entries, entry)
+        else:
+            return False
+        return True
+
+    def entries(self):
+        """Return the ``(rating, -seq, item, match)`` tuples, best first."""
+        # `seq` is unique, so the items themselves are never compared
+        return sorted(self._entries, reverse=True)
+
+    def items(self):
+        """Return the collected items, best first."""
+        return [entry[2] for entry in self.entries()]
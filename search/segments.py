@@ -0,0 +1,411 @@
+"""
+Incremental index
+
+Contains the :class:`SegmentedIndex`, an index of a changing collection
+that supports adding, updating and removing documents by key without being
+rebuilt. The index is split in segments, each one a
+:class:`search.index.SearchIndex`:
+
+* new documents are appended to a small buffer segment, so that each write
+  only costs the indexing of the document itself;
+* removed (and replaced) documents are marked with a tombstone, recording the
+  write that deleted them, rather than being removed from their segment;
+* each search works on an :class:`IndexSnapshot`, that seals the buffer (it
+  will not change anymore) and only sees the documents alive at that time,
+  whatever is written while the search runs;
+* when there are too many segments, the newest ones are merged in a
+  background thread, dropping the removed documents.
+"""
+import threading
+from bisect import bisect_right
+from collections.abc import Sequence
+from itertools import chain
+
+from search import config, utils
+from search.analysis import default
+from search.cache import new_uid
+from search.corpus import Corpus
+from search.index import SearchIndex
+
+
+class Segment:
+    """
+    A :class:`search.index.SearchIndex` with the key of each of its documents
+    and the tombstones of the removed ones, as a mapping of their document
+    id to the version of the index that removed them.
+    """
+    __slots__ = ('index', 'keys', 'deleted')
+
+    def __init__(self, index, keys=()):
+        self.index = index
+        self.keys = list(keys)
+        self.deleted = {}
+
+    def __len__(self):
+        return len(self.index.documents)
+
+    def alive(self, doc_id, version):
+        """Tell if the document `doc_id` exists at `version` of the index."""
+        deleted = self.deleted.get(doc_id)
+        return deleted is None or deleted > version
+
+
+class _Chain(Sequence):
+    """
+    A list for each segment, one after the other, as the documents of the
+    segments or the values of their corpora.
+    """
+
+    def __init__(self, lists, offsets):
+        self.lists = lists
+        self.offsets = offsets
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        segment = bisect_right(self.offsets, i) - 1
+        return self.lists[segment][i - self.offsets[segment]]
+
+    def __iter__(self):
+        return chain.from_iterable(self.lists)
+
+
+class _ChainedCorpus(Corpus):
+    """Read only :class:`search.corpus.Corpus` of the corpora of segments."""
+
+    def __init__(self, segments, offsets):
+        corpus = segments[0].index.corpus
+        self.attributes = corpus.attributes
+        self.key = corpus.key
+        self.items = _Chain(
+            [segment.index.corpus.items for segment in segments], offsets)
+        self.columns = {
+            attr: _Chain([
+                segment.index.corpus.columns[attr] for segment in segments
+            ], offsets)
+            for attr in self.attributes
+        }
+        self.version = offsets[-1]
+        self.uid = new_uid()
+
+    def append(self, obj):
+        raise TypeError('an index snapshot is read only')
+
+
+class IndexSnapshot(SearchIndex):
+    """
+    Read only view of the documents alive at a given `version` of a
+    :class:`SegmentedIndex`, that can be used as a
+    :class:`search.index.SearchIndex`. Document ids count the documents of
+    all the `segments`, removed ones included.
+    """
+
+    def __init__(self, segments, version, attributes, analyzer=None):
+        self.attributes = list(attributes)
+        self.prefilter = False
+        self.analyzer = analyzer or default
+        self.corpus = None
+        self.columns = {}
+        self.typos = None
+        self.segments = segments
+        self.version = version
+        self.uid = new_uid()
+
+        self.offsets = [0]
+        for segment in segments:
+            self.offsets.append(self.offsets[-1] + len(segment))
+        self.documents = _Chain(
+            [segment.index.documents for segment in segments], self.offsets)
+        if segments and segments[0].index.corpus is not None:
+            # the candidates are read from the corpora of the segments
+            self.corpus = _ChainedCorpus(segments, self.offsets)
+
+    def __len__(self):
+        return sum(1 for _ in self._alive())
+
+    def __iter__(self):
+        return (self.documents[i] for i in self._alive())
+
+    def _alive(self, segment_ids=None):
+        """Yield the ids of the alive documents, among `segment_ids`."""
+        for segment, offset in zip(self.segments, self.offsets):
+            ids = range(len(segment)) if segment_ids is None else \
+                segment_ids[offset]
+            for doc_id in ids:
+                if segment.alive(doc_id, self.version):
+                    yield offset + doc_id
+
+    def add(self, obj):
+        raise TypeError('an index snapshot is read only')
+
+    def candidate_ids(self, query, attributes=None, ratio=utils.ratio,
+                      threshold=None):
+        return list(self._alive({
+            offset: segment.index.candidate_ids(
+                query, attributes, ratio, threshold)
+            for segment, offset in zip(self.segments, self.offsets)
+        }))
+
+    def fuzzy(self, term, distance=None):
+        return list(self._alive({
+            offset: segment.index.fuzzy(term, distance)
+            for segment, offset in zip(self.segments, self.offsets)
+        }))
+
+
+class SegmentedIndex:
+    """
+    Index of a changing collection of objects, each identified by its `key`
+
+        >>> index = SegmentedIndex(Item.select(), ['name'], key='id')
+        >>> index.add(Item(id=12, name='awesome item'))
+        >>> index.update(Item(id=12, name='awesome thing'))
+        >>> index.remove(12)
+
+    The index can be passed to :class:`search.core.SearchEngine` as any
+    dataset, and each search will use a consistent :meth:`snapshot`.
+    Writes are thread safe, and searches can run while writing.
+
+    If `dataset` is a :class:`search.corpus.Corpus`, the segments store their
+    values in corpora too, and the searches return its items. The rows of a
+    corpus with a key are identified by their item, so `key` should give the
+    same value for the objects written later.
+
+    Arguments:
+        dataset (iterable): iterable of the initial `objects`.
+        attributes (list): names of the attributes to index.
+        key (str or callable): name of the attribute, or function of the
+            object, giving the key identifying each object.
+        typos (int): max edit distance of the typo tolerant vocabulary of
+            each segment index, see :class:`search.index.SearchIndex`.
+        max_segments (int): number of segments over which the newest ones are
+            merged in the background.
+        analyzer (search.analysis.Analyzer): the analyzer tokenizing the
+            values, the default one if not given.
+    """
+
+    def __init__(self, dataset, attributes, key, typos=None,
+                 max_segments=config.MAX_SEGMENTS, analyzer=None):
+        self.attributes = list(attributes)
+        self.key = key
+        self.typos = typos
+        self.analyzer = analyzer or default
+        self.max_segments = max_segments
+        # incremented on each write, see :class:`search.cache.ResultCache`
+        self.version = 0
+        self.uid = new_uid()
+        # key -> (segment, document id) of each alive object
+        self._locations = {}
+        self._lock = threading.Lock()
+        # held while merging, so that merges do not overlap
+        self._merging = threading.Lock()
+        self._compactor = None
+
+        # attributes and key of the corpora of the segments, if any
+        self._corpus = None
+        self.segments = ()
+        if isinstance(dataset, Corpus):
+            self._corpus = dataset.attributes, dataset.key
+            keys = [
+                item if dataset.key is not None else self._key(item)
+                for item in dataset.items
+            ]
+            self._buffer = self._segment(
+                ((dataset, row) for row in range(len(dataset))), keys)
+            for doc_id, key in enumerate(keys):
+                self._locate(key, self._buffer, doc_id)
+        else:
+            self._buffer = self._segment(())
+            for obj in dataset:
+                self._put(obj)
+        self._seal()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, key):
+        return key in self._locations
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def _segment(self, dataset, keys=()):
+        """
+        Return a new segment of the objects of `dataset`, or if the index
+        stores corpora, of the ``(corpus, row)`` pairs of `dataset`.
+        """
+        if self._corpus is not None:
+            corpus = Corpus((), *self._corpus)
+            for source, row in dataset:
+                corpus.items.append(source.items[row])
+                for attr, column in corpus.columns.items():
+                    column.append(source.columns[attr][row])
+            corpus.version = len(corpus.items)
+            dataset = corpus
+        return Segment(
+            SearchIndex(dataset, self.attributes, typos=self.typos,
+                        analyzer=self.analyzer),
+            keys)
+
+    def _key(self, obj):
+        if callable(self.key):
+            return self.key(obj)
+        return getattr(obj, self.key)
+
+    def _put(self, obj):
+        """Append `obj` to the buffer, replacing the one with the same key."""
+        key = self._key(obj)
+        self._buffer.keys.append(key)
+        self._locate(key, self._buffer, self._buffer.index.add(obj))
+
+    def _locate(self, key, segment, doc_id):
+        """Record a write of `key` at `doc_id` of `segment`."""
+        self.version += 1
+        location = self._locations.get(key)
+        if location is not None:
+            old_segment, old_id = location
+            old_segment.deleted[old_id] = self.version
+        self._locations[key] = segment, doc_id
+
+    def get(self, key, default=None):
+        """Return the object with the given `key`."""
+        location = self._locations.get(key)
+        if location is None:
+            return default
+        segment, doc_id = location
+        return segment.index.documents[doc_id]
+
+    def add(self, obj):
+        """
+        Add a new object to the index.
+
+        Raises:
+            ValueError: if an object with the same key is already indexed.
+        """
+        with self._lock:
+            if self._key(obj) in self._locations:
+                raise ValueError(
+                    'key {!r} is already indexed'.format(self._key(obj)))
+            self._put(obj)
+
+    def update(self, obj):
+        """
+        Replace the indexed object with the same key of `obj`.
+
+        Raises:
+            KeyError: if there is no object with that key.
+        """
+        with self._lock:
+            if self._key(obj) not in self._locations:
+                raise KeyError(self._key(obj))
+            self._put(obj)
+
+    def remove(self, key):
+        """
+        Remove the object with the given `key`.
+
+        Raises:
+            KeyError: if there is no object with that key.
+        """
+        with self._lock:
+            segment, doc_id = self._locations.pop(key)
+            self.version += 1
+            segment.deleted[doc_id] = self.version
+
+    def snapshot(self):
+        """
+        Return the :class:`IndexSnapshot` of the objects currently indexed,
+        that later writes will not change.
+        """
+        with self._lock:
+            self._seal()
+            return IndexSnapshot(
+                self.segments, self.version, self.attributes, self.analyzer)
+
+    def _seal(self):
+        """Make the buffer a segment, if it is not empty."""
+        if not len(self._buffer):
+            return
+        self.segments += (self._buffer,)
+        self._buffer = self._segment(())
+        if len(self.segments) > self.max_segments and (
+                self._compactor is None or not self._compactor.is_alive()):
+            self._compactor = threading.Thread(
+                target=self._background, daemon=True)
+            self._compactor.start()
+
+    def compact(self):
+        """
+        Merge every segment in a single one, dropping the removed objects.
+        Searches and writes can go on while merging.
+        """
+        self.wait_compaction()
+        with self._lock:
+            self._seal()
+        self._compact(True)
+
+    def wait_compaction(self, timeout=None):
+        """Wait for the running background compaction, if any, to end."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join(timeout)
+
+    def _background(self):
+        """Merge the newest segments until there are not too many."""
+        while len(self.segments) > self.max_segments:
+            self._compact(False)
+
+    def _compact(self, full):
+        """
+        Merge all the segments if `full`, otherwise the newest ones, as long
+        as they hold more documents than the segment before them.
+        """
+        with self._merging:
+            self._merge(full)
+
+    def _merge(self, full):
+        with self._lock:
+            segments = self.segments
+            version = self.version
+        if len(segments) < 2:
+            return
+
+        start = 0
+        if not full:
+            start = len(segments) - 2
+            total = len(segments[-1]) + len(segments[-2])
+            while start > 0 and len(segments[start - 1]) <= total:
+                start -= 1
+                total += len(segments[start])
+        merged = segments[start:]
+
+        # documents alive at `version` and where they come from
+        moved = [
+            (segment, doc_id)
+            for segment in merged
+            for doc_id in range(len(segment))
+            if segment.alive(doc_id, version)
+        ]
+        if self._corpus is not None:
+            documents = (
+                (segment.index.corpus, doc_id) for segment, doc_id in moved)
+        else:
+            documents = (
+                segment.index.documents[doc_id] for segment, doc_id in moved)
+        compacted = self._segment(
+            documents, (segment.keys[doc_id] for segment, doc_id in moved))
+
+        with self._lock:
+            for new_id, (segment, doc_id) in enumerate(moved):
+                # carry over what was written while merging
+                if doc_id in segment.deleted:
+                    compacted.deleted[new_id] = segment.deleted[doc_id]
+                key = segment.keys[doc_id]
+                if self._locations.get(key) == (segment, doc_id):
+                    self._locations[key] = compacted, new_id
+            # segments are only added at the end while merging
+            self.segments = segments[:start] + (compacted,) + \
+                self.segments[len(segments):]
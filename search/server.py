@@ -0,0 +1,341 @@
+"""
+Search server
+
+Contains the :class:`SearchServer`, that keeps an index file (see
+:mod:`search.storage`) loaded in a warm :class:`search.core.SearchEngine` and
+serves its searches over HTTP with JSON bodies, so that many processes can
+share it instead of each one preparing the corpus again. It can be started
+with::
+
+    python -m search.server items.idx --port 8000
+    python -m search.server items.idx --socket /tmp/search.sock
+
+and then queried with
+
+    POST /search  {"query": "aweso", "limit": 10}  ->  {"results": [12, 7]}
+
+The other endpoints are ``GET /health``, returning the number of objects
+served and how many times the index was loaded, and ``POST /reload``, that
+loads the index again. Loading another index file, from the ``"path"`` in
+the body, is only allowed if the server is started with
+``--allow-reload-path``, as any client could make it open any file.
+
+Connections are kept alive between requests, and requests sent one after
+the other without waiting for the responses (pipelining) are answered in
+order. Each connection is served by its own thread.
+
+Reloading does not interrupt the service: the new index is loaded while the
+old one keeps serving the searches, and then replaces it for the searches
+that start afterwards. Sending ``SIGHUP`` to the server reloads it too.
+"""
+import argparse
+import json
+import os
+import signal
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from search import config, storage
+from search.cache import ResultCache
+from search.core import SearchEngine
+
+
+class SearchServer:
+    """
+    Warm search engine over the index file at `path`, that can be reloaded
+    while serving searches.
+
+        >>> server = SearchServer('items.idx', limit=10)
+        >>> server.search('aweso')
+        [12, 7]
+        >>> server.serve(('127.0.0.1', 8000))
+
+    Arguments:
+        path (str): path of the index file, written by
+            :func:`search.storage.save`.
+        attributes (list): names of the attributes to search, all the
+            indexed ones by default.
+        limit (int): default max number of results of each search.
+        threshold (float): default minimum match of the results.
+        backend (str or callable): the ratio backend, see
+            :func:`search.backends.get_backend`.
+        cache (int): number of searches whose results are kept, ``0`` to
+            disable the :class:`search.cache.ResultCache`.
+        reload_path (bool): allow the ``/reload`` requests to give the path
+            of another index file to load.
+    """
+
+    def __init__(self, path, attributes=None, limit=-1,
+                 threshold=config.THRESHOLD, backend=None, cache=0,
+                 reload_path=False):
+        self.path = path
+        self.attributes = attributes
+        self.limit = limit
+        self.threshold = threshold
+        self.backend = backend
+        self.cache = cache
+        self.reload_path = reload_path
+        #: how many times the index was loaded
+        self.loads = 0
+        self._reloading = threading.Lock()
+        self._httpd = None
+        # index and engine searching it, replaced together on reload
+        self._state = None
+        self.reload()
+
+    @property
+    def index(self):
+        """The :class:`search.storage.MappedIndex` currently served."""
+        return self._state[0]
+
+    def reload(self, path=None):
+        """
+        Load the index file at `path` (the last loaded one by default) and
+        serve it in place of the current one, once loaded.
+
+        Raises:
+            ValueError: if the file is not a valid index, in which case the
+                current one is still served.
+        """
+        with self._reloading:
+            path = path or self.path
+            index = storage.load(path)
+
+            ratio = self.backend
+            if self._state is not None:
+                # keep the ratios computed so far, they do not depend on
+                # the index
+                ratio = self._state[1].ratio
+            engine = SearchEngine(
+                self.attributes or index.attributes, limit=self.limit,
+                threshold=self.threshold, backend=ratio,
+                cache=ResultCache(self.cache) if self.cache else None,
+                ratio_cache=config.RATIO_CACHE_SIZE if self._state is None
+                else 0)
+
+            self._state = index, engine
+            self.path = path
+            self.loads += 1
+
+    def search(self, query, limit=None, threshold=None, attributes=None):
+        """
+        Search the index currently served, see
+        :meth:`search.core.SearchEngine.search`.
+        """
+        index, engine = self._state
+        return engine.search(
+            query, index, attributes=attributes, limit=limit,
+            threshold=threshold)
+
+    def health(self):
+        """Return the status of the server, as a dictionary."""
+        return {
+            'status': 'ok',
+            'path': self.path,
+            'size': len(self.index),
+            'loads': self.loads,
+        }
+
+    def serve(self, address, verbose=False):
+        """
+        Serve the requests on `address`, a ``(host, port)`` tuple or the path
+        of a Unix socket, until :meth:`shutdown` is called. With `verbose`
+        every request is logged.
+        """
+        self._httpd = make_server(self, address, verbose)
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+            if isinstance(address, str):
+                os.unlink(address)
+
+    def shutdown(self):
+        """Stop serving, from another thread."""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+
+
+def _options(body):
+    """
+    Return the ``limit`` and ``threshold`` of the body of a search request,
+    as an integer and a float, or ``None`` if not given.
+
+    Raises:
+        ValueError: if they are not numbers, or strings of numbers, or if the
+            limit is below ``-1`` or the threshold is not between 0 and 1.
+    """
+    limit, threshold = body.get('limit'), body.get('threshold')
+    if limit is not None:
+        try:
+            if isinstance(limit, bool) or not isinstance(limit, (int, str)):
+                raise ValueError
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('the limit must be an integer') from None
+        if limit < -1:
+            raise ValueError('the limit must be -1 or more')
+    if threshold is not None:
+        try:
+            if isinstance(threshold, bool) or \
+                    not isinstance(threshold, (int, float, str)):
+                raise ValueError
+            threshold = float(threshold)
+        except ValueError:
+            raise ValueError('the threshold must be a number') from None
+        if not 0 <= threshold <= 1:
+            raise ValueError('the threshold must be between 0 and 1')
+    return limit, threshold
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP requests handler of the :class:`SearchServer` of the server."""
+    # keep the connections alive between requests
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(body, dict):
+            raise ValueError('the body must be a JSON object')
+        return body
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.server.search_server.health())
+        else:
+            self._send(404, {'error': 'not found: {}'.format(self.path)})
+
+    def do_POST(self):
+        search_server = self.server.search_server
+        try:
+            body = self._body()
+        except ValueError as error:
+            self._send(400, {'error': str(error)})
+            return
+
+        if self.path == '/search':
+            if not isinstance(body.get('query'), str):
+                self._send(400, {'error': 'a query string is needed'})
+                return
+            try:
+                limit, threshold = _options(body)
+            except ValueError as error:
+                self._send(400, {'error': str(error)})
+                return
+            try:
+                results = search_server.search(
+                    body['query'], limit, threshold, body.get('attributes'))
+            except AttributeError as error:
+                self._send(400, {'error': str(error)})
+                return
+            except Exception as error:
+                self._send(500, {'error': repr(error)})
+                return
+            self._send(200, {'results': results})
+
+        elif self.path == '/reload':
+            path = body.get('path')
+            if path is not None and not search_server.reload_path:
+                self._send(403, {'error': 'reloading another path is not '
+                                          'allowed'})
+                return
+            if path is not None and not isinstance(path, str):
+                self._send(400, {'error': 'the path must be a string'})
+                return
+            try:
+                search_server.reload(path)
+            except (OSError, ValueError) as error:
+                self._send(400, {'error': str(error)})
+                return
+            except Exception as error:
+                self._send(500, {'error': repr(error)})
+                return
+            self._send(200, search_server.health())
+
+        else:
+            self._send(404, {'error': 'not found: {}'.format(self.path)})
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(search_server, address, verbose=False):
+    """
+    Return the HTTP server of `search_server` listening on `address`, a
+    ``(host, port)`` tuple or the path of a Unix socket.
+    """
+    if isinstance(address, str):
+        httpd = _UnixHTTPServer(address, _RequestHandler)
+    else:
+        httpd = ThreadingHTTPServer(address, _RequestHandler)
+    httpd.search_server = search_server
+    httpd.verbose = verbose
+    return httpd
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m search.server',
+        description='Serve the searches of an index file over HTTP.')
+    parser.add_argument('path', help='index file, see search.storage')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--socket', help='serve on this Unix socket instead')
+    parser.add_argument('--attributes', nargs='+',
+                        help='attributes to search, all the indexed ones by '
+                             'default')
+    parser.add_argument('--limit', type=int, default=-1)
+    parser.add_argument('--threshold', type=float, default=config.THRESHOLD)
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--cache', type=int, default=0,
+                        help='number of searches whose results are kept')
+    parser.add_argument('--allow-reload-path', action='store_true',
+                        help='let the reload requests load another index '
+                             'file, given as their "path"')
+    parser.add_argument('--verbose', action='store_true',
+                        help='log every request')
+    args = parser.parse_args(argv)
+
+    search_server = SearchServer(
+        args.path, args.attributes, args.limit, args.threshold, args.backend,
+        args.cache, args.allow_reload_path)
+    address = args.socket or (args.host, args.port)
+
+    def reload(signum, frame):
+        # not in the signal handler itself, that interrupts the main thread
+        threading.Thread(target=search_server.reload, daemon=True).start()
+
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reload)
+
+    print('Serving {} on {}'.format(search_server.path, address), flush=True)
+    try:
+        search_server.serve(address, args.verbose)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+Sharded search
+
+Contains the :class:`ShardedSearch`, a coordinator that splits a collection
+in shards, each one searched by its own worker process, so that a collection
+too large for a single process can still be searched as a whole
+
+    >>> with ShardedSearch(Item.select(), ['name'], shards=4, key='id',
+    ...                    partition='hash', timeout=0.5) as search:
+    ...     results = search('john doe', limit=10)
+    >>> results.partial
+    False
+
+Each query is sent to every shard, that returns its best results with their
+rating and position in the collection, and the coordinator merges them in
+the same order a single :class:`search.core.SearchEngine` returns. The
+workers communicate through local pipes, standing in for the connections to
+remote nodes.
+
+A shard that does not answer within the `timeout` (or whose process died) is
+left out, and the results of the other shards are returned flagged as
+:any:`SearchResults.partial`. Its late answer is discarded.
+"""
+import time
+import zlib
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+from search import config, utils
+from search.analysis import compile_query
+from search.backends import get_backend
+from search.cache import RatioCache
+from search.corpus import rows
+from search.ranking import collect, TopK
+
+#: ways of assigning the objects to the shards
+PARTITIONS = ('range', 'hash')
+
+
+class SearchResults(list):
+    """
+    The results of a :class:`ShardedSearch`, best first.
+
+    Attributes:
+        partial (bool): ``True`` if some shards did not answer, in which
+            case their objects are missing from the results.
+        missing (list): numbers of the shards that did not answer.
+    """
+
+    def __init__(self, results=(), missing=()):
+        super().__init__(results)
+        self.missing = list(missing)
+        self.partial = bool(self.missing)
+
+
+def _serve_shard(conn, seqs, columns, backend, analyzer, ratio_cache):
+    """
+    Answer the searches received on `conn` over the rows of a shard, until
+    ``None`` is received.
+
+    Each request is a ``(request_id, query, weights, threshold, limit)``
+    tuple, answered with the request id and the collected
+    ``(rating, -seq, seq, match)`` tuples, best first, or the exception
+    raised searching.
+    """
+    ratio = get_backend(backend)
+    if ratio_cache:
+        ratio = RatioCache(ratio, ratio_cache)
+    values = list(zip(*columns))
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        request_id, query, weights, threshold, limit = request
+        try:
+            query = compile_query(query, analyzer)
+            results = collect(
+                query, zip(seqs, values), weights, threshold, limit, ratio)
+            answer = results.entries()
+        except Exception as error:
+            answer = error
+        conn.send((request_id, answer))
+    conn.close()
+
+
+class ShardedSearch:
+    """
+    Search coordinator of a collection split in `shards`, each one served by
+    a worker process holding the values of its objects.
+
+    Objects are assigned to the shards with `partition`:
+
+    * ``'range'``: the collection is split in `shards` consecutive ranges of
+      the same size.
+    * ``'hash'``: by the CRC32 of their `key`, so that the shard of an
+      object does not depend on the rest of the collection.
+
+    The objects stay in the coordinator, that sends the workers only the
+    values of the searched `attributes`.
+
+    Arguments:
+        dataset (iterable): iterable of `objects` to search.
+        attributes (list): names of the attributes to search.
+        shards (int): number of shards, and of worker processes.
+        key (str or callable): name of the attribute, or function of the
+            object, giving the key of each object, needed by the ``'hash'``
+            partition.
+        partition (str): one of the :any:`PARTITIONS`.
+        limit (int): default max number of results of each search.
+        threshold (float): default minimum match of the results.
+        weights (list): default weights of the `attributes`.
+        timeout (float): default seconds to wait for the shards to answer,
+            if ``None`` every shard is waited for.
+        backend (str or callable): the ratio backend, see
+            :func:`search.backends.get_backend`. Functions must be defined at
+            module level for the worker processes.
+        analyzer (search.analysis.Analyzer): the analyzer of the queries and
+            values, the default one if not given.
+        ratio_cache (int): size of the :class:`search.cache.RatioCache` of
+            each worker, ``0`` to disable it.
+
+    Raises:
+        ValueError: if `partition` is unknown, or is ``'hash'`` without a
+            `key`.
+    """
+
+    def __init__(self, dataset, attributes, shards, key=None,
+                 partition='range', limit=-1, threshold=config.THRESHOLD,
+                 weights=None, timeout=None, backend=None, analyzer=None,
+                 ratio_cache=config.RATIO_CACHE_SIZE):
+        if partition not in PARTITIONS:
+            raise ValueError('Unknown partition: {!r}'.format(partition))
+        if partition == 'hash' and key is None:
+            raise ValueError('the hash partition needs a key')
+
+        self.attributes = list(attributes)
+        self.key = key
+        self.partition = partition
+        self.limit = limit
+        self.threshold = threshold
+        self.weights = self._weights(weights)
+        self.timeout = timeout
+        self.documents = []
+        self._request_id = 0
+
+        # position in the collection and values of the objects of each shard
+        seqs = [[] for _ in range(shards)]
+        columns = [[[] for _ in self.attributes] for _ in range(shards)]
+        if partition == 'range' and not hasattr(dataset, '__len__'):
+            dataset = list(dataset)
+        size = -(-len(dataset) // shards) if partition == 'range' else None
+        for seq, (obj, values) in enumerate(rows(dataset, self.attributes)):
+            self.documents.append(obj)
+            if size is not None:
+                shard = seq // size
+            else:
+                shard = zlib.crc32(str(self._key(obj)).encode('utf-8')) % \
+                    shards
+            seqs[shard].append(seq)
+            for column, value in zip(columns[shard], values):
+                column.append(value)
+
+        self._connections = []
+        self._processes = []
+        for shard in range(shards):
+            conn, worker_conn = Pipe()
+            process = Process(
+                target=_serve_shard, daemon=True,
+                args=(worker_conn, seqs[shard], columns[shard], backend,
+                      analyzer, ratio_cache))
+            process.start()
+            worker_conn.close()
+            self._connections.append(conn)
+            self._processes.append(process)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __call__(self, query, limit=None, threshold=None, weights=None,
+                 timeout=None):
+        return self.search(query, limit, threshold, weights, timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def shards(self):
+        """Number of shards."""
+        return len(self._connections)
+
+    def _key(self, obj):
+        if callable(self.key):
+            return self.key(obj)
+        return getattr(obj, self.key)
+
+    def _weights(self, weights):
+        """
+        Return the list of the scaled weights for each attribute, as
+        :class:`search.core.SearchEngine` does.
+        """
+        if not weights or len(weights) != len(self.attributes):
+            return utils.generate_weights(self.attributes)
+        return utils.scale_to_one(weights)
+
+    def search(self, query, limit=None, threshold=None, weights=None,
+               timeout=None):
+        """
+        Search every shard for `query`, returning the :class:`SearchResults`
+        of the best `limit` objects over `threshold`. Arguments not given
+        default to the ones of the coordinator.
+
+        Raises:
+            Exception: the one raised by a shard searching, if any.
+        """
+        limit = limit or self.limit
+        threshold = threshold or self.threshold
+        weights = self._weights(weights) if weights else self.weights
+        if timeout is None:
+            timeout = self.timeout
+
+        self._request_id += 1
+        request = (self._request_id, str(query), weights, threshold, limit)
+        pending = {}
+        for shard, conn in enumerate(self._connections):
+            try:
+                conn.send(request)
+            except (BrokenPipeError, OSError):
+                continue
+            pending[conn] = shard
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = TopK(limit)
+        answered = set()
+        error = None
+        while pending:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+            ready = wait(list(pending), remaining)
+            if not ready:
+                break
+
+            for conn in ready:
+                try:
+                    request_id, answer = conn.recv()
+                except (EOFError, OSError):
+                    # the worker process died
+                    del pending[conn]
+                    continue
+                if request_id != self._request_id:
+                    # late answer to a search that already timed out
+                    continue
+                answered.add(pending.pop(conn))
+                if isinstance(answer, Exception):
+                    error = answer
+                    continue
+                for rating, _, seq, match in answer:
+                    results.push(rating, seq, self.documents[seq], match)
+
+        if error is not None:
+            raise error
+
+        missing = [
+            shard for shard in range(self.shards) if shard not in answered]
+        return SearchResults(results.items(), missing)
+
+    def close(self):
+        """Stop the worker processes."""
+        for conn in self._connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._connections:
+            conn.close()
+        self._connections, self._processes = [], []
@@ -0,0 +1,117 @@
+"""
+Search instrumentation
+
+Contains the :class:`SearchStats` collected by
+:class:`search.core.SearchEngine` when instrumentation is enabled, telling
+where the time of a search went.
+"""
+import time
+from collections import Counter, defaultdict
+
+from search import utils
+from search.analysis import analyze
+from search.corpus import Corpus
+from search.matchers import dispatch
+
+
+class SearchStats:
+    """
+    Counters and timings of a single search.
+
+    Attributes:
+        scanned (int): objects rated
+        accepted (int): objects matching over the threshold. Objects that
+            could not beat the results collected so far are not rated
+            exactly, and may be missing when the search has a limit.
+        rejected (int): objects rated under the match they needed to be
+            collected, whose rating stopped as soon as it could not reach it
+        ratio_calls (int): calls to the ratio function
+        skipped (Counter): work skipped thanks to the ratio bounds, by kind
+            (see :func:`search.utils.recording_skips`): ``'windows'`` and
+            ``'pairs'`` count the ratios not computed by the partial and
+            the intersect matchers, ``'matches'`` the matchers abandoned
+            as they could not reach their minimum score
+        branches (Counter): how many times :func:`search.matchers.lazy_match`
+            picked each matcher, by name (``'none'`` when neither string
+            had tokens)
+        matcher_time (dict): cumulative seconds spent in each matcher
+        attribute_time (float): cumulative seconds spent reading the
+            attributes of the objects
+        elapsed (float): total duration of the search, in seconds
+        cached (bool): ``True`` if the results came from the result cache
+    """
+
+    def __init__(self):
+        self.scanned = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.ratio_calls = 0
+        self.skipped = Counter()
+        self.branches = Counter()
+        self.matcher_time = defaultdict(float)
+        self.attribute_time = 0.
+        self.elapsed = 0.
+        self.cached = False
+
+    def __repr__(self):
+        return '<SearchStats scanned={} accepted={} elapsed={:.4f}s>'.format(
+            self.scanned, self.accepted, self.elapsed)
+
+    def as_dict(self):
+        """Return the stats as a dictionary of plain values."""
+        return {
+            'scanned': self.scanned,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'ratio_calls': self.ratio_calls,
+            'skipped': dict(self.skipped),
+            'branches': dict(self.branches),
+            'matcher_time': dict(self.matcher_time),
+            'attribute_time': self.attribute_time,
+            'elapsed': self.elapsed,
+            'cached': self.cached,
+        }
+
+    def ratio(self, ratio):
+        """Return `ratio` wrapped so that each call is counted."""
+        def counted(query, string):
+            self.ratio_calls += 1
+            return ratio(query, string)
+        counted.bounded = utils.is_bounded(ratio)
+        return counted
+
+    def lazy_match(self, query, string, ratio, min_score=0):
+        """
+        Same as :func:`search.matchers.lazy_match`, recording the picked
+        matcher and the time spent in it.
+        """
+        query = analyze(query)
+        string = analyze(string, query.analyzer)
+
+        matcher = dispatch(query, string)
+        if matcher is None:
+            self.branches['none'] += 1
+            return 0
+
+        name = matcher.__name__
+        self.branches[name] += 1
+        start = time.perf_counter()
+        match = matcher(query, string, ratio, min_score)
+        self.matcher_time[name] += time.perf_counter() - start
+        return match
+
+    def rows(self, dataset, attributes):
+        """
+        Yield each object of `dataset` with the list of its `attributes`
+        values, timing how long reading them takes. Reading the values of a
+        :class:`search.corpus.Corpus` is not timed, as they are already in
+        memory.
+        """
+        if isinstance(dataset, Corpus):
+            yield from dataset.rows(attributes)
+            return
+        for obj in dataset:
+            start = time.perf_counter()
+            values = [getattr(obj, attr) for attr in attributes]
+            self.attribute_time += time.perf_counter() - start
+            yield obj, values
@@ -0,0 +1,373 @@
+"""
+On-disk index
+
+Contains the functions to write a :class:`search.corpus.Corpus`, together
+with its :class:`search.index.SearchIndex`, to a single binary file and to
+open it again with :mod:`mmap`, without analysing the corpus again
+
+    >>> corpus = Corpus(Item.select(), ['name', 'category'], key='id')
+    >>> storage.save(corpus, 'items.idx')
+
+and then, in any process
+
+    >>> index = storage.load('items.idx')
+    >>> search_engine.search('aweso', index)
+    [12, 7]
+
+Opening a file only reads its header, and every process mapping the same file
+shares its pages, so that the index does not need to be built by each one of
+them.
+
+The file starts with :any:`MAGIC`, the :any:`FORMAT_VERSION` and the length
+of a JSON header describing the sections that follow, each one an array of
+native unsigned integers or of UTF-8 bytes, aligned to 8 bytes:
+
+* ``ids``: the items of the corpus, either as integers or as strings.
+* ``column:<attribute>``: the values of each attribute, as strings.
+* ``tokens``: the sorted vocabulary of the index.
+* ``vocabulary``: the ids of the documents containing each token.
+* ``lengths``: for each length, the ids of the tokens that long.
+* ``counts:<attribute>`` and ``joined:<attribute>``: the number of tokens
+  and the joined tokens of each value of the indexed attributes.
+
+Lists of strings are stored as two sections, the ``offsets`` of each string
+followed by the concatenated ``data``.
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+from search.analysis import default
+from search.cache import new_uid
+from search.corpus import Corpus
+from search.index import SearchIndex
+
+#: first bytes of every index file
+MAGIC = b'SRCHIDX\x00'
+
+#: version of the file format, changed whenever the layout does
+FORMAT_VERSION = 2
+
+# magic, format version and length of the JSON header
+_PREAMBLE = struct.Struct('<8sII')
+
+
+def _strings(strings):
+    """Return the offsets and data arrays encoding a list of strings."""
+    offsets = array('Q', [0])
+    chunks = []
+    for string in strings:
+        chunks.append(string.encode('utf-8'))
+        offsets.append(offsets[-1] + len(chunks[-1]))
+    return offsets, array('B', b''.join(chunks))
+
+
+def _postings(keys, values):
+    """Return the offsets and values arrays encoding a list for each key."""
+    offsets = array('Q', [0])
+    flat = array('I')
+    for key in keys:
+        flat.extend(values[key])
+        offsets.append(len(flat))
+    return offsets, flat
+
+
+def save(dataset, path):
+    """
+    Write `dataset` to the file at `path`.
+
+    Arguments:
+        dataset: a :class:`search.corpus.Corpus`, that will be indexed on all
+            its attributes, or a :class:`search.index.SearchIndex` built
+            from one.
+
+    Raises:
+        ValueError: if `dataset` is not a corpus or an index built from one
+            with the default analyzer, or if its items are not integers or
+            strings (see the `key` of the :class:`search.corpus.Corpus`).
+    """
+    if isinstance(dataset, SearchIndex):
+        index, corpus = dataset, dataset.corpus
+        if corpus is None:
+            raise ValueError('only indexes built from a Corpus can be saved')
+    elif isinstance(dataset, Corpus):
+        index, corpus = SearchIndex(dataset, dataset.attributes), dataset
+    else:
+        raise ValueError('only a Corpus or a SearchIndex can be saved')
+    if index.analyzer is not default:
+        raise ValueError('only indexes using the default analyzer can be '
+                         'saved')
+
+    items = list(corpus.items)
+    if all(type(item) is int for item in items):
+        ids = 'int'
+        sections = {'ids': array('q', items)}
+    elif all(type(item) is str for item in items):
+        ids = 'str'
+        sections = dict(zip(('ids:offsets', 'ids:data'), _strings(items)))
+    else:
+        raise ValueError('only integer or string items can be saved, build '
+                         'the Corpus with a key')
+
+    for attr in corpus.attributes:
+        values = (str(value) for value in corpus.columns[attr])
+        sections.update(zip(
+            ('column:{}:offsets'.format(attr), 'column:{}:data'.format(attr)),
+            _strings(values)))
+
+    tokens = sorted(index.vocabulary)
+    token_ids = {token: i for i, token in enumerate(tokens)}
+    sections.update(zip(('tokens:offsets', 'tokens:data'), _strings(tokens)))
+    sections.update(zip(
+        ('vocabulary:offsets', 'vocabulary:values'),
+        _postings(tokens, index.vocabulary)))
+
+    lengths = range(max(index.by_length, default=0) + 1)
+    sections.update(zip(
+        ('lengths:offsets', 'lengths:values'),
+        _postings(lengths, {
+            length: sorted(
+                token_ids[token] for token in index.by_length.get(length, ()))
+            for length in lengths
+        })))
+
+    for attr in index.attributes:
+        sections['counts:' + attr] = array('I', index.counts[attr])
+        sections.update(zip(
+            ('joined:{}:offsets'.format(attr), 'joined:{}:data'.format(attr)),
+            _strings(index.joined[attr])))
+
+    header = {
+        'byteorder': sys.byteorder,
+        'attributes': corpus.attributes,
+        'indexed': index.attributes,
+        'ids': ids,
+        'rows': len(items),
+        'sections': {},
+    }
+    offset = 0
+    for name, values in sections.items():
+        length = len(values) * values.itemsize
+        header['sections'][name] = [offset, length, values.typecode]
+        offset += -(-length // 8) * 8
+
+    meta = json.dumps(header).encode('utf-8')
+    start = -(-(_PREAMBLE.size + len(meta)) // 8) * 8
+
+    with open(path, 'wb') as fo:
+        fo.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(meta)))
+        fo.write(meta)
+        fo.write(bytes(start - _PREAMBLE.size - len(meta)))
+        for name, values in sections.items():
+            data = values.tobytes()
+            fo.write(data)
+            fo.write(bytes(-len(data) % 8))
+
+
+class _Strings(Sequence):
+    """List of strings stored as offsets and UTF-8 data."""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def find(self, string):
+        """
+        Return the position of `string` in the list, that must be sorted,
+        or ``-1`` if it is not there.
+        """
+        i = bisect_left(self, string)
+        if i < len(self) and self[i] == string:
+            return i
+        return -1
+
+
+class _Postings(Mapping):
+    """
+    Mapping from each string of the sorted `keys` to a slice of `values`.
+    """
+
+    def __init__(self, keys, offsets, values):
+        self._keys = keys
+        self._offsets = offsets
+        self._values = values
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __getitem__(self, key):
+        i = self._keys.find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._values[self._offsets[i]:self._offsets[i + 1]]
+
+
+class _Lengths(Mapping):
+    """
+    Mapping from each token length to the list of the `tokens` that long,
+    whose ids are the slice of `values` starting at the offset of the length.
+    """
+
+    def __init__(self, tokens, offsets, values):
+        self._tokens = tokens
+        self._offsets = offsets
+        self._values = values
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        return (
+            length for length in range(len(self._offsets) - 1)
+            if self._offsets[length] < self._offsets[length + 1]
+        )
+
+    def __getitem__(self, length):
+        if not 0 <= length < len(self._offsets) - 1 or \
+                self._offsets[length] == self._offsets[length + 1]:
+            raise KeyError(length)
+        values = self._values[self._offsets[length]:self._offsets[length + 1]]
+        return [self._tokens[value] for value in values]
+
+
+class MappedCorpus(Corpus):
+    """
+    Read only :class:`search.corpus.Corpus` whose items and columns are read
+    from a memory mapped index file, see :func:`load`.
+    """
+
+    def __init__(self, attributes, items, columns):
+        self.attributes = list(attributes)
+        self.key = None
+        self.items = items
+        self.columns = columns
+        self.version = 0
+        self.uid = new_uid()
+
+    def append(self, obj):
+        raise TypeError('a stored corpus is read only')
+
+
+class MappedIndex(SearchIndex):
+    """
+    Read only :class:`search.index.SearchIndex` of a :class:`MappedCorpus`,
+    whose tables are read from a memory mapped index file, see :func:`load`.
+    The prefilter and typo tolerant vocabulary of the saved index are not
+    stored, and neither is its analyzer: the index is searched with the
+    default one.
+    """
+
+    def __init__(self, corpus, attributes, vocabulary, by_length, counts,
+                 joined):
+        self.attributes = list(attributes)
+        self.prefilter = False
+        self.analyzer = default
+        self.corpus = corpus
+        self.documents = corpus.items
+        self.vocabulary = vocabulary
+        self.by_length = by_length
+        self.values = {attr: corpus.columns[attr] for attr in self.attributes}
+        self.counts = counts
+        self.joined = joined
+        self.version = 0
+        self.uid = new_uid()
+        self.columns = {}
+        self.typos = None
+
+    def add(self, obj):
+        raise TypeError('a stored index is read only')
+
+
+def load(path):
+    """
+    Open the index file at `path`, as written by :func:`save`, returning its
+    :class:`MappedIndex`. The corpus is available as its ``corpus``.
+
+    Raises:
+        ValueError: if the file is not an index, is truncated or malformed,
+            or was written with another format version or on a platform
+            with another byte order.
+    """
+    with open(path, 'rb') as fo:
+        buffer = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < _PREAMBLE.size:
+        raise ValueError('{} is not an index file'.format(path))
+    magic, version, length = _PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError('{} is not an index file'.format(path))
+    if version != FORMAT_VERSION:
+        raise ValueError('{} has format version {}, expected {}'.format(
+            path, version, FORMAT_VERSION))
+
+    try:
+        header = json.loads(buffer[_PREAMBLE.size:_PREAMBLE.size + length])
+        byteorder = header['byteorder']
+    except (ValueError, KeyError, TypeError) as error:
+        raise ValueError('{} has a malformed header'.format(path)) from error
+    if byteorder != sys.byteorder:
+        raise ValueError('{} was written with {} endian byte order'.format(
+            path, byteorder))
+
+    start = -(-(_PREAMBLE.size + length) // 8) * 8
+    view = memoryview(buffer)
+
+    def section(name):
+        offset, size, typecode = header['sections'][name]
+        if start + offset + size > len(buffer):
+            raise ValueError('{} is truncated'.format(path))
+        return view[start + offset:start + offset + size].cast(typecode)
+
+    def strings(name):
+        return _Strings(section(name + ':offsets'), section(name + ':data'))
+
+    try:
+        if header['ids'] == 'int':
+            items = section('ids')
+        else:
+            items = strings('ids')
+
+        corpus = MappedCorpus(header['attributes'], items, {
+            attr: strings('column:' + attr) for attr in header['attributes']
+        })
+        corpus.version = header['rows']
+
+        tokens = strings('tokens')
+        index = MappedIndex(
+            corpus, header['indexed'],
+            vocabulary=_Postings(
+                tokens, section('vocabulary:offsets'),
+                section('vocabulary:values')),
+            by_length=_Lengths(
+                tokens, section('lengths:offsets'),
+                section('lengths:values')),
+            counts={
+                attr: section('counts:' + attr) for attr in header['indexed']
+            },
+            joined={
+                attr: strings('joined:' + attr) for attr in header['indexed']
+            },
+        )
+    except (KeyError, TypeError) as error:
+        # missing or mistyped entries of the header
+        raise ValueError('{} has a malformed header: {!r}'.format(
+            path, error)) from error
+    index.version = header['rows']
+    return index
@@ -0,0 +1,130 @@
+"""
+Typo tolerant vocabulary
+
+Contains the :class:`TypoIndex`, a symmetric delete dictionary of the tokens
+of a corpus, that finds the tokens within a small edit distance of a term
+without comparing the term to every token: each token is stored under the
+strings obtained deleting up to `max_distance` of its characters, so that
+two tokens within that distance always share at least one of them, and only
+the tokens sharing one with the term need to be compared to it.
+"""
+from itertools import combinations
+
+from search import config
+
+
+def levenshtein(query, string, max_distance=None):
+    """
+    Return the Levenshtein distance between `query` and `string`, that is the
+    number of characters that need to be inserted, deleted or replaced to
+    change one into the other.
+
+    If `max_distance` is given, the computation stops as soon as the distance
+    is known to be over it, returning ``max_distance + 1``.
+
+    Example:
+        >>> levenshtein('holmes', 'homles')
+        2
+    """
+    if len(query) > len(string):
+        query, string = string, query
+    if max_distance is not None and len(string) - len(query) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(query) + 1))
+    for i, s_char in enumerate(string, 1):
+        current = [i]
+        for j, q_char in enumerate(query, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (q_char != s_char),
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def deletes(token, distance):
+    """
+    Return the set of strings obtained deleting up to `distance` characters
+    from `token`, including `token` itself.
+
+    Example:
+        >>> deletes('cat', 1)
+        {'cat', 'at', 'ct', 'ca'}
+    """
+    variants = {token}
+    for n in range(1, min(distance, len(token)) + 1):
+        for kept in combinations(range(len(token)), len(token) - n):
+            variants.add(''.join(token[i] for i in kept))
+    return variants
+
+
+class TypoIndex:
+    """
+    Dictionary of tokens that can be looked up by approximate spelling
+
+        >>> typos = TypoIndex(['sherlock', 'holmes', 'watson'])
+        >>> typos.lookup('homles')
+        {'holmes': 2}
+
+    Lookups compare the term only with the tokens sharing one of its deletes,
+    instead of the whole vocabulary, at the cost of storing every delete of
+    every token.
+
+    Arguments:
+        tokens (iterable): the tokens to store.
+        max_distance (int): the maximum edit distance that can be looked up.
+    """
+
+    def __init__(self, tokens=(), max_distance=config.MAX_EDIT_DISTANCE):
+        self.max_distance = max_distance
+        self.tokens = set()
+        # delete -> tokens producing it
+        self.deletes = {}
+
+        for token in tokens:
+            self.add(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.tokens
+
+    def add(self, token):
+        """Store `token`, if not stored yet."""
+        if token in self.tokens:
+            return
+        self.tokens.add(token)
+        for variant in deletes(token, self.max_distance):
+            self.deletes.setdefault(variant, []).append(token)
+
+    def lookup(self, term, distance=None):
+        """
+        Return the stored tokens within `distance` edits of `term` (the
+        index `max_distance` by default), as a dictionary of their distances.
+
+        Raises:
+            ValueError: if `distance` is over the index `max_distance`.
+        """
+        if distance is None:
+            distance = self.max_distance
+        if distance > self.max_distance:
+            raise ValueError('distance {} is over the index max of {}'.format(
+                distance, self.max_distance))
+
+        found = {}
+        for variant in deletes(term, distance):
+            for token in self.deletes.get(variant, ()):
+                if token in found or \
+                        abs(len(token) - len(term)) > distance:
+                    continue
+                found[token] = levenshtein(term, token, distance)
+
+        return {
+            token: edits for token, edits in found.items()
+            if edits <= distance
+        }
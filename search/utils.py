@@ -6,6 +6,8 @@ such as normalization, tokenization, averages, splitting and walking through
 the elements of the iterable/string.
 """
 import re
+import threading
+from contextlib import contextmanager
 from difflib import SequenceMatcher  # noqa
 
 from search import config
@@ -26,19 +28,190 @@ def ratio(query, string):
     return SequenceMatcher(None, query, string).ratio()
 
 
-def best_partial_ratio(query, string):
+# twice the matching characters over the total length, see `is_bounded`
+ratio.bounded = True
+
+
+def is_bounded(ratio):
+    """
+    Whether `ratio` is computed as twice the characters matching over the
+    total length of the strings, like every one of the
+    :any:`search.backends.BACKENDS`, and so cannot be higher than the bounds
+    of :func:`real_quick_ratio` and :func:`quick_ratio`. Ratio functions say
+    so with a true ``bounded`` attribute: the matchers skip work using those
+    bounds only for them, and rate everything exactly for any other one.
+    """
+    return getattr(ratio, 'bounded', False)
+
+
+def real_quick_ratio(query, string):
+    """
+    Upper bound of the ratio between query and string given only their
+    lengths, as they cannot have more matching characters than the shortest
+    one has. Same as :meth:`difflib.SequenceMatcher.real_quick_ratio`.
+    """
+    length = len(query) + len(string)
+    if length == 0:
+        return 1.0
+    return 2.0 * min(len(query), len(string)) / length
+
+
+def quick_ratio(query, string):
+    """
+    Upper bound of the ratio between query and string given the characters
+    they have in common, regardless of their order. Same as
+    :meth:`difflib.SequenceMatcher.quick_ratio`.
+    """
+    length = len(query) + len(string)
+    if length == 0:
+        return 1.0
+    return 2.0 * _common(query, string) / length
+
+
+def _common(query, string):
+    """Return how many characters `query` and `string` have in common."""
+    available = {}
+    for char in string:
+        available[char] = available.get(char, 0) + 1
+    common = 0
+    for char in query:
+        count = available.get(char, 0)
+        if count:
+            available[char] = count - 1
+            common += 1
+    return common
+
+
+# counter of the skipped work of the current thread, see `recording_skips`
+_skips = threading.local()
+
+
+@contextmanager
+def recording_skips(counter):
+    """
+    Count in `counter` (a :class:`collections.Counter`) the work skipped
+    thanks to the ratio bounds, by kind, while in the context::
+
+        >>> with recording_skips(counter):
+        ...     best_partial_ratio('holmes', 'sherlock holmes said')
+        >>> counter
+        Counter({'windows': 14})
+
+    Only the current thread is recorded.
+    """
+    previous = getattr(_skips, 'counter', None)
+    _skips.counter = counter
+    try:
+        yield counter
+    finally:
+        _skips.counter = previous
+
+
+def skipped(kind, count=1):
+    """Record that `count` computations of `kind` were skipped."""
+    counter = getattr(_skips, 'counter', None)
+    if counter is not None:
+        counter[kind] += count
+
+
+def _segments(query, string):
+    """
+    Return the start positions of the segments of `string` as long as
+    `query`, grouped by the number of characters they have in common with
+    `query`: the segments at ``starts[common]`` have ``common`` of them.
+    """
+    size = len(query)
+    wanted = {}
+    for char in query:
+        wanted[char] = wanted.get(char, 0) + 1
+
+    # slide a window through `string` keeping count of its characters and of
+    # how many of them are in common with the query
+    found = {}
+    common = 0
+    for char in string[:size]:
+        count = found[char] = found.get(char, 0) + 1
+        if count <= wanted.get(char, 0):
+            common += 1
+
+    starts = [[] for _ in range(size + 1)]
+    starts[common].append(0)
+    for i in range(1, len(string) - size + 1):
+        char = string[i - 1]
+        count = found[char]
+        found[char] = count - 1
+        if count <= wanted.get(char, 0):
+            common -= 1
+        char = string[i + size - 1]
+        count = found[char] = found.get(char, 0) + 1
+        if count <= wanted.get(char, 0):
+            common += 1
+        starts[common].append(i)
+    return starts
+
+
+def best_partial_bound(query, string, min_score=0):
+    """
+    Upper bound of :func:`best_partial_ratio` for the ratios bounded by their
+    matching characters (see :func:`is_bounded`), given the characters each
+    segment has in common with `query`, without rating any of them. If the
+    characters of the whole `string` show that the bound is below
+    `min_score`, a value below it is returned without looking at the
+    segments.
     """
-    Best partial ratio between query and string.
-    `String` is walked with the shifter function and each segment's length
-    is equal to the `query` length:
+    size = len(query)
+    if size == 0 or size >= len(string):
+        return quick_ratio(query, string)
+    # no segment has more characters in common than the whole string
+    bound = _common(query, string) / size
+    if bound < min_score:
+        return bound
+    starts = _segments(query, string)
+    for common in range(size, 0, -1):
+        if starts[common]:
+            return common / size
+    return 0.
+
+
+def best_partial_ratio(query, string, ratio=ratio, min_score=0):
     """
-    v = 0
-    for str_segment in shifter(string, len(query)):
-        m = ratio(query, str_segment)
-        v = m if m > v else m
-        if v == 1:
+    Best partial ratio between query and string, that is the best ratio
+    between `query` and each segment of `string` as long as `query` (see
+    :func:`shifter`).
+
+    Rather than rating every segment, each one is first bounded by the
+    characters it has in common with `query`: as two strings of length
+    ``n`` cannot have more than that many characters matching, their ratio
+    cannot be higher than ``common / n``. Segments are then rated from the
+    most promising one, until the bound of the next cannot beat the best
+    ratio found. The result is the same as rating every segment, for any
+    `ratio` based on the matching characters (see :func:`is_bounded`), any
+    other one rates every segment.
+    """
+    size = len(query)
+    if size == 0 or size >= len(string):
+        return ratio(query, string)
+    if not is_bounded(ratio):
+        return max(ratio(query, segment) for segment in shifter(string, size))
+
+    starts = _segments(query, string)
+    best = 0
+    rated = 0
+    for common in range(size, 0, -1):
+        bound = common / size
+        if bound <= best or bound < min_score:
             break
-    return v
+        for i in starts[common]:
+            rated += 1
+            match = ratio(query, string[i:i + size])
+            if match > best:
+                best = match
+                if best == 1:
+                    skipped('windows', len(string) - size + 1 - rated)
+                    return best
+
+    skipped('windows', len(string) - size + 1 - rated)
+    return best
 
 
 # =====================================================================
@@ -182,13 +355,34 @@ def stringify_tokens(tokens):
     return ''.join(tokens)
 
 
-def sorted_intersect(query_tokens, string_tokens):
+def difference_sorted(first, second):
+    """
+    Return the list of the values of the sorted sequence `first` that are not
+    in the sorted sequence `second`, merging them. Neither sequence can
+    contain duplicates.
+
+    Example:
+        >>> difference_sorted([1, 2, 4], [2, 3])
+        [1, 4]
+    """
+    rest = []
+    j = 0
+    for value in first:
+        while j < len(second) and second[j] < value:
+            j += 1
+        if j == len(second) or second[j] != value:
+            rest.append(value)
+    return rest
+
+
+def sorted_intersect(query_tokens, string_tokens, ratio=ratio):
     """
     return the sorted intersection and remainders of the two iterables
 
     Arguments:
         query_tokens(iterable): first elements group to intersect
         string_tokens(iterable): second elements group to intersect
+        ratio(callable): ratio function used to compare the elements
 
     Returns:
         tuple of lists:
@@ -201,10 +395,20 @@ def sorted_intersect(query_tokens, string_tokens):
         >> > sorted_intersect([1, 3, 2, 4], [3, 4, 5])
         [3, 4], [1, 2], [5]
     """
-    common = [
-        i for i in query_tokens for j in string_tokens
-        if ratio(i, j) >= config.THRESHOLD
-    ]
+    common = []
+    pruned = 0
+    bounded = is_bounded(ratio)
+    for i in query_tokens:
+        for j in string_tokens:
+            if i == j:
+                common.append(i)
+            elif bounded and real_quick_ratio(i, j) < config.THRESHOLD:
+                # too different in length to be similar enough
+                pruned += 1
+            elif ratio(i, j) >= config.THRESHOLD:
+                common.append(i)
+    if pruned:
+        skipped('pairs', pruned)
     rest_query = (el for el in query_tokens if el not in common)
     rest_string = (el for el in string_tokens if el not in common)
     return sorted(common), sorted(rest_query), sorted(rest_string)
@@ -0,0 +1,50 @@
+"""
+Testing module for the benchmark suite, run on a tiny corpus
+"""
+import json
+
+from benchmarks import corpus, run
+
+
+class TestBenchmarks:
+    def test_corpus_is_reproducible(self):
+        first = corpus.generate(20, seed=3)
+        second = corpus.generate(20, seed=3)
+        assert [(i.name, i.description) for i in first] == \
+            [(i.name, i.description) for i in second]
+        for item in first:
+            assert 1 <= len(item.name.split()) <= 5
+            assert 5 <= len(item.description.split()) <= 20
+
+        for shape, (low, high) in corpus.QUERY_SHAPES.items():
+            queries = corpus.queries(3, shape, seed=3)
+            assert queries == corpus.queries(3, shape, seed=3)
+            assert all(low <= len(q.split()) <= high for q in queries)
+
+    def test_report_and_compare(self, tmpdir):
+        report = run.run(20, queries=2, matcher_sample=5,
+                         shapes=['single', 'long'])
+        assert set(report['matchers']) == set(run.MATCHERS)
+        assert set(report['engine']) == {'single', 'long'}
+        json.dumps(report)
+
+        rows = run.compare(report, report)
+        assert rows and not any(regressed for *_, regressed in rows)
+
+        slower = json.loads(json.dumps(report))
+        slower['engine']['long']['docs_per_sec'] /= 2
+        slower['engine']['long']['latency_ms']['p50'] *= 2
+        regressed = {
+            '.'.join(path) for path, *_, regressed
+            in run.compare(slower, report) if regressed
+        }
+        assert regressed == {
+            'engine.long.docs_per_sec', 'engine.long.latency_ms.p50'}
+
+    def test_main(self, tmpdir):
+        output = str(tmpdir.join('report.json'))
+        args = ['--size', '10', '--queries', '1', '--matcher-sample', '2',
+                '--shapes', 'pair', '--output', output]
+        assert run.main(args) == 0
+        assert run.main(args + ['--baseline', output,
+                                '--tolerance', '100']) == 0
@@ -0,0 +1,175 @@
+"""
+Testing module for the analysis and caching utilities
+"""
+import pickle
+
+from search import analysis, config, core, matchers, utils
+from search.index import SearchIndex
+from tests.helpers import Item
+
+
+def singular(token):
+    """Stemmer dropping the final s"""
+    return token[:-1] if token.endswith('s') else token
+
+
+class TestAnalysis:
+    def test_analysis(self):
+        a = analysis.Analysis('Holmes, Sherlock Holmes and his friend.')
+        assert a.tokens == ['holmes', 'sherlock', 'holmes', 'friend']
+        assert a.token_set == {'holmes', 'sherlock', 'friend'}
+        assert a.sorted_tokens == ['friend', 'holmes', 'sherlock']
+        assert a.joined == 'friendholmessherlock'
+        assert a.length == 3
+        assert [analysis.tokens[i] for i in a.ids] == \
+            sorted(a.sorted_tokens, key=analysis.tokens.intern)
+        assert str(a) == 'Holmes, Sherlock Holmes and his friend.'
+
+    def test_token_dictionary(self):
+        dictionary = analysis.TokenDictionary()
+        assert list(dictionary.ids(['watson', 'holmes', 'watson'])) == [0, 1]
+        assert dictionary.intern('holmes') == 1
+        assert dictionary.intern('sherlock') == 2
+        assert (len(dictionary), dictionary[2]) == (3, 'sherlock')
+        assert dictionary.get('sherlock') == 2
+        assert dictionary.get('watsons') is None
+
+    def test_analyze_is_cached(self):
+        analysis.cache.clear()
+        first = analysis.analyze('sherlock holmes')
+        assert analysis.analyze('sherlock holmes') is first
+        assert analysis.analyze(first) is first
+        assert analysis.cache.hits == 1
+        assert analysis.cache.misses == 1
+
+    def test_matchers_accept_analysis(self):
+        query, string = 'sherlock holmes', 'holmes sherlock wrote'
+        for matcher in (matchers.simple_ratio, matchers.best_token_ratio,
+                        matchers.token_sort_ratio,
+                        matchers.intersect_token_ratio, matchers.lazy_match):
+            expected = matcher(query, string)
+            a_query, a_string = analysis.Analysis(query), \
+                analysis.Analysis(string)
+            assert matcher(a_query, a_string) == expected
+            compiled = analysis.compile_query(query)
+            assert matcher(compiled, string) == expected
+
+    def test_compile_query(self):
+        analysis.cache.clear()
+        compiled = analysis.compile_query('Sherlock Holmes')
+        assert compiled.sorted_tokens == ['holmes', 'sherlock']
+        assert analysis.compile_query(compiled) is compiled
+        assert analysis.analyze(compiled) is compiled
+        # queries do not end up in the analysis cache
+        assert 'Sherlock Holmes' not in analysis.cache
+
+    def test_query_tokens_not_interned(self):
+        holmes = analysis.tokens.intern('holmes')
+        size = len(analysis.tokens)
+        compiled = analysis.compile_query('holmes qwzxjkv vkjxzwq')
+        assert compiled.length == 3
+        assert list(compiled.ids) == [holmes, analysis.UNKNOWN]
+        assert len(analysis.tokens) == size
+        assert analysis.tokens.get('qwzxjkv') is None
+        # the unknown tokens are in no string, until one has them
+        string = 'holmes and qwzxjkv'
+        assert matchers.lazy_match(compiled, string) == \
+            matchers.lazy_match('holmes qwzxjkv vkjxzwq', string)
+        # the ids are looked up again once a string has the tokens
+        analysis.analyze('vkjxzwq qwzxjkv')
+        assert sorted(compiled.ids) == sorted(
+            analysis.tokens.get(token) for token in compiled.sorted_tokens)
+        assert analysis.UNKNOWN not in compiled.ids
+
+    def test_intersect_shortcut(self):
+        # every query token is in the string
+        for query, string in (('holmes watson', 'watson and holmes'),
+                              ('sherlock holmes', 'sherlock holmez holmes')):
+            query, string = analysis.Analysis(query), analysis.Analysis(string)
+            common, diff_q, diff_s = utils.sorted_intersect(
+                query.sorted_tokens, string.sorted_tokens)
+            expected = max(
+                utils.ratio(''.join(a), ''.join(b)) for a, b in (
+                    (common, common + diff_q),
+                    (common + diff_q, common + diff_s),
+                    (common, common + diff_s),
+                ))
+            assert matchers.intersect_token_ratio(query, string) == expected
+
+
+class TestAnalyzer:
+    def test_default(self):
+        string = 'Holmes, Sherlock Holmes and his friend.'
+        assert analysis.default.tokenize(string) == utils.tokenize(string)
+        assert analysis.Analysis(string).analyzer is analysis.default
+        assert pickle.loads(pickle.dumps(analysis.default)) is \
+            analysis.default
+
+    def test_follows_config(self, monkeypatch):
+        # as utils.tokenize, the default analyzer reads the configuration
+        # when used, not when imported
+        string = 'The Sign of the Four'
+        assert analysis.analyze(string).sorted_tokens == ['four', 'sign']
+        monkeypatch.setattr(config, 'STOP_WORDS', ['sign'])
+        assert analysis.default.tokenize(string) == utils.tokenize(string)
+        assert analysis.analyze(string).sorted_tokens == ['four']
+        config.STOP_WORDS.append('four')
+        assert analysis.analyze(string).sorted_tokens == []
+        monkeypatch.setattr(config, 'MIN_WORD_LENGTH', 2)
+        assert analysis.analyze(string).sorted_tokens == ['the']
+
+        # the given options stay as they are
+        analyzer = analysis.Analyzer(min_length=3, stop_words=['the'])
+        assert analyzer.tokenize(string) == ['sign', 'four']
+        monkeypatch.undo()
+        assert analysis.analyze(string).sorted_tokens == ['four', 'sign']
+
+    def test_tokenize(self):
+        analyzer = analysis.Analyzer(
+            min_length=1, stop_words=['the', 'of'], stemmer=singular)
+        assert analyzer.tokenize('The Sign of the Four Holmes') == \
+            ['sign', 'four', 'holme']
+        assert analysis.Analyzer(casefold=True).tokenize('Straße') == \
+            ['strasse']
+        assert analysis.Analyzer(normalization='NFKC').tokenize(
+            'ﬁnal ﬁx') == ['final']
+
+    def test_analyze_is_cached(self):
+        analyzer = analysis.Analyzer(min_length=2)
+        first = analyzer.analyze('the sign of four')
+        assert analyzer.analyze('the sign of four') is first
+        assert first.analyzer is analyzer
+        assert first.sorted_tokens == ['four', 'sign', 'the']
+        assert analyzer.cache.hits == 1
+        # each analyzer has its own cache
+        assert analysis.analyze('the sign of four') is not first
+
+    def test_compile(self):
+        analyzer = analysis.Analyzer(min_length=2)
+        compiled = analysis.compile_query('the', analyzer)
+        assert compiled.analyzer is analyzer
+        assert analysis.compile_query(compiled) is compiled
+        assert analyzer.compile(compiled) is compiled
+        assert analysis.default.compile(compiled) is not compiled
+        # strings are analysed with the analyzer of the query
+        assert matchers.lazy_match(compiled, 'the') == 1
+        assert matchers.lazy_match('the', 'the') == 0
+
+    def test_pickle(self):
+        analyzer = analysis.Analyzer(min_length=1, stemmer=singular)
+        analyzer.analyze('sherlock holmes')
+        copy = pickle.loads(pickle.dumps(analyzer))
+        assert copy.tokenize('the holmes') == ['the', 'holme']
+        assert len(copy.cache) == 0
+
+    def test_engine(self):
+        items = Item.setup()
+        analyzer = analysis.Analyzer(stemmer=singular)
+        search = core.SearchEngine(['words'], limit=5, analyzer=analyzer)
+        index = SearchIndex(items, ['words'], analyzer=analyzer)
+        assert 'holme' in index.vocabulary
+        assert 'holmes' not in index.vocabulary
+        results = search('holmes', items)
+        assert results
+        assert search('holmes', index) == results
+        assert items[0].words in analyzer.cache
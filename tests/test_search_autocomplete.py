@@ -0,0 +1,79 @@
+"""
+Testing module for the autocompletion
+"""
+from collections import namedtuple
+
+from search.analysis import Analyzer
+from search.autocomplete import AutocompleteSession, PrefixIndex, terms
+from search.corpus import Corpus
+from tests.helpers import Item
+
+Doc = namedtuple('Doc', ['name', 'category'])
+
+
+class TestAutocomplete:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.index = PrefixIndex(cls.items, ['words'])
+
+    def test_terms(self):
+        assert terms('Sherlock h') == ['h', 'sherlock']
+        assert terms('the the ') == ['the']
+        assert terms('') == []
+        analyzer = Analyzer(min_length=0, stop_words=['the'])
+        assert terms('The Hound', analyzer) == ['hound']
+
+    def test_analyzer(self):
+        analyzer = Analyzer(min_length=0, stop_words=['the'])
+        index = PrefixIndex([Doc('the hound', 'novel'),
+                             Doc('theatre', 'building')], ['name', 'category'],
+                            analyzer=analyzer)
+        assert 'the' not in index.vocabulary
+        assert index.search('the') == []
+        assert index.search('thea') == [index.documents[1]]
+        assert AutocompleteSession(index)('the h') == [index.documents[0]]
+
+    def test_complete(self):
+        index = PrefixIndex([Doc('sherlock holmes', 'detective'),
+                             Doc('shelf', 'furniture')], ['name', 'category'])
+        assert index.complete('she') == ['shelf', 'sherlock']
+        assert index.complete('z') == []
+        assert index.search('she') == [index.documents[1],
+                                       index.documents[0]]
+        assert index.search('she de') == [index.documents[0]]
+        assert index.search('s h') == [index.documents[0]]
+
+    def test_corpus(self):
+        docs = [Doc('sherlock holmes', 'detective'), Doc('shelf', 'furniture')]
+        corpus = Corpus(docs, ['name', 'category'], key='name')
+        index = PrefixIndex(corpus, ['name', 'category'])
+        assert index.search('she') == ['shelf', 'sherlock holmes']
+        assert index.search('she de') == ['sherlock holmes']
+
+        index.add(Doc('shepherd', 'dog'))
+        assert len(corpus) == 3
+        assert AutocompleteSession(index)('she do') == ['shepherd']
+
+    def test_search(self):
+        results = self.index.search('sherlock hol')
+        assert results
+        for item in results:
+            words = item.words.lower().split()
+            assert any(word.startswith('sherlock') for word in words)
+            assert any(word.startswith('hol') for word in words)
+
+    def test_limit(self):
+        everything = self.index.search('s')
+        for limit in (1, 5, 20):
+            assert self.index.search('s', limit) == everything[:limit]
+
+    def test_session(self):
+        session = AutocompleteSession(self.index, limit=5)
+        typed = 'sherlock holmes'
+        for i in range(1, len(typed) + 1):
+            assert session(typed[:i]) == self.index.search(typed[:i], 5)
+        # not an extension of the previous query
+        assert session('watson') == self.index.search('watson', 5)
+        assert session('wat') == self.index.search('wat', 5)
+        assert session('') == []
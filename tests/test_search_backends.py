@@ -0,0 +1,149 @@
+"""
+Testing module for the ratio backends, checking them against the reference
+difflib implementation on the phrases used for testing and on the benchmark
+corpus.
+"""
+import random
+import unicodedata
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks import corpus
+from search import backends, core, matchers, utils
+from tests.helpers import Item, PHRASES
+
+VOCABULARY = sorted({token for phrase in PHRASES for token in phrase})
+
+
+def reference_lcs(a, b):
+    """Textbook dynamic programming longest common subsequence length."""
+    row = [0] * (len(b) + 1)
+    for char in a:
+        prev = 0
+        for j, other in enumerate(b, 1):
+            prev, row[j] = row[j], (
+                prev + 1 if char == other else max(row[j], row[j - 1]))
+    return row[-1]
+
+
+def folded_ratio(query, string):
+    """Ratio of the two strings without their accents."""
+    def fold(string):
+        return ''.join(
+            char for char in unicodedata.normalize('NFKD', string)
+            if not unicodedata.combining(char))
+    return utils.ratio(fold(query), fold(string))
+
+
+class TestBackends:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        rnd = random.Random(42)
+        cls.pairs = [
+            (rnd.choice(VOCABULARY), rnd.choice(VOCABULARY))
+            for _ in range(2000)
+        ]
+
+    def test_lcs_length(self):
+        assert backends.lcs_length('holmes', 'hlomes') == 5
+        assert backends.lcs_length('', 'holmes') == 0
+        rnd = random.Random(1)
+        for _ in range(500):
+            a = ''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 70)))
+            b = ''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 70)))
+            assert backends.lcs_length(a, b) == reference_lcs(a, b)
+
+    def test_indel_ratio(self):
+        assert backends.indel_ratio('', '') == utils.ratio('', '') == 1
+        assert backends.indel_ratio('holmes', '') == 0
+        assert backends.indel_ratio('holmes', 'holmes') == 1
+        for a, b in self.pairs:
+            # the longest common subsequence is never shorter than the
+            # characters matched by difflib
+            assert backends.indel_ratio(a, b) >= utils.ratio(a, b)
+            if a == b or utils.ratio(a, b) >= .75:
+                assert backends.indel_ratio(a, b) == \
+                    pytest.approx(utils.ratio(a, b))
+
+    def test_get_backend(self):
+        assert backends.get_backend() is utils.ratio
+        assert backends.get_backend('indel') is backends.indel_ratio
+        assert backends.get_backend(len) is len
+        with pytest.raises(ValueError):
+            backends.get_backend('nope')
+
+    def test_bounded(self):
+        assert utils.is_bounded(utils.ratio)
+        assert all(map(utils.is_bounded, backends.BACKENDS.values()))
+        assert not utils.is_bounded(folded_ratio)
+
+    def test_unbounded_backend(self):
+        # the accents make the strings too different for the bounds of the
+        # matching characters, but not for the backend itself
+        dishes = [SimpleNamespace(words=words) for words in (
+            'crème brûlée', 'apple pie', 'crêpe suzette')]
+        search = core.SearchEngine(['words'], backend=folded_ratio)
+        assert search('brulee', dishes) == [dishes[0]]
+        assert search('creme brulee', dishes) == [dishes[0]]
+        assert search('crepes', dishes) == [dishes[2]]
+        assert core.SearchEngine(['words'], backend=folded_ratio,
+                                 ratio_cache=0)('brulee', dishes) == \
+            [dishes[0]]
+
+    @pytest.mark.parametrize('query,lengths', [
+        ('inconvene', (0, 1)),
+        ('laugh', (0, 1)),
+        ('sherlock holmes', (3, 5)),
+        ('holmes sherlock', (3, 5)),
+        ('watson', (3, 5)),
+        ('sherlock holmes', (12, 15)),
+        ('sherlock holmes', (0, -1)),
+        ('shelrock holms', (0, -1)),
+        ('miss violet hunter my friend and colleague', (0, -1)),
+    ])
+    def test_same_rankings(self, query, lengths):
+        # on these queries no object is rated differently near the top, see
+        # test_benchmark_queries for what holds in general
+        seq = Item.get_by_length(*lengths)
+        reference = core.SearchEngine(['words'], limit=10)
+        indel = core.SearchEngine(['words'], limit=10, backend='indel')
+        assert indel(query, seq) == reference(query, seq)
+
+    def test_benchmark_queries(self):
+        # indel is not a drop-in replacement: it never rates an object lower
+        # than difflib, but it can rate some higher, so it finds every
+        # difflib result and maybe a few more, and only the objects rated
+        # the same by both are sure to keep their order
+        items = corpus.generate(300, seed=3)
+        queries = [
+            query for shape in corpus.QUERY_SHAPES
+            for query in corpus.queries(6, shape, seed=3)
+        ]
+        reference = core.SearchEngine(['name'], limit=-1)
+        indel = core.SearchEngine(['name'], limit=-1, backend='indel')
+        differences = 0
+        for query in queries:
+            matches = {}
+            for item in items:
+                exact = matchers.lazy_match(query, item.name)
+                match = matchers.lazy_match(
+                    query, item.name, ratio=backends.indel_ratio)
+                assert match >= exact
+                matches[id(item)] = (exact, match)
+            for threshold in (.6, .75, .9):
+                expected = reference(query, items, threshold=threshold)
+                results = indel(query, items, threshold=threshold)
+                differences += results != expected
+                assert {id(item) for item in expected} <= \
+                    {id(item) for item in results}
+                assert all(matches[id(item)][1] >= threshold
+                           for item in results)
+
+                def same(seq):
+                    return [item for item in seq
+                            if len(set(matches[id(item)])) == 1]
+                assert same(results) == same(expected)
+        # the deviation does show on the benchmark corpus
+        assert differences
@@ -0,0 +1,114 @@
+"""
+Testing module for the batch scoring of attribute columns
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks import corpus
+from search import batch, config, core, index, matchers, utils
+from search.analysis import Analyzer
+from tests.helpers import Item
+from tests.test_search_index import QUERIES
+
+
+class TestBatch:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.column = batch.Column(item.words for item in cls.items)
+
+    def test_profile(self):
+        grams = batch.profile('Holmes, holmes and his dog', 3)
+        assert grams == {'hol': 1, 'olm': 1, 'lme': 1, 'mes': 1}
+        assert batch.profile('the dog', 3) == {}
+
+    def test_scores(self):
+        assert len(self.column) == len(self.items)
+        for query in QUERIES:
+            query_grams = batch.profile(query)
+            scores = self.column.scores(query)
+            for item, score in zip(self.items, scores):
+                grams = batch.profile(item.words)
+                common = sum((query_grams & grams).values())
+                expected = common / sum(query_grams.values())
+                assert score == pytest.approx(expected)
+
+    def test_min_common(self):
+        words = ['holmes', 'holms', 'hlomes', 'sherlock', 'shelrock',
+                 'watson', 'wtsn', 'sherlockholmes', 'mrs', 'a', '']
+        analyzer = Analyzer(min_length=0, stop_words=())
+        for size in (2, 3):
+            for first in words:
+                for second in words:
+                    grams = batch.profile(first, size, analyzer) & \
+                        batch.profile(second, size, analyzer)
+                    ratio = utils.ratio(first, second)
+                    if len(first) >= size and len(second) >= size:
+                        assert sum(grams.values()) >= batch.min_common(
+                            len(first), len(second), ratio, size)
+        assert batch.min_common(6, 6, 1) == 5
+        assert batch.min_common(6, 6, .75) <= 1
+
+    def test_plausible(self):
+        column = batch.Column(['sherlock holmes', 'doctor watson', 'holms'])
+        assert column.overlaps('holmes') == ({0: 5, 2: 3}, 5)
+        assert column.plausible('holmes', .95, .95) == [0, 2]
+        # the rows with less than two tokens are rated on their whole strings
+        assert column.plausible('watson', .95, .95) == [1, 2]
+        assert column.plausible('a b c', .95, .95) == [0, 1, 2]
+        assert column.plausible('holmes', .75) == [0, 1, 2]
+
+    def test_plausible_rows_match(self, monkeypatch):
+        strings = [item.words for item in self.items]
+        pruned = 0
+        for similar in (.75, .9, .95):
+            monkeypatch.setattr(config, 'THRESHOLD', similar)
+            for query in QUERIES:
+                for threshold in (.6, .75, .9, .95):
+                    rows = self.column.plausible(query, threshold)
+                    pruned += len(strings) - len(rows)
+                    assert rows == sorted(rows)
+                    for row, string in enumerate(strings):
+                        if matchers.lazy_match(query, string) >= threshold:
+                            assert row in rows
+        assert pruned
+
+    def test_analyzer(self):
+        analyzer = Analyzer(min_length=2)
+        assert batch.profile('the dog', 3, analyzer) == {'the': 1, 'dog': 1}
+        column = batch.Column(['the big dog', 'a cat', 'big cat'],
+                              analyzer=analyzer)
+        assert column.counts.tolist() == [3, 1, 2]
+        assert column.plausible('dog', 1, 1) == [0, 1]
+        # the index columns split the values as the index does
+        items = self.items[:3] + [SimpleNamespace(words='big dog')]
+        dogs = index.SearchIndex(
+            items, ['words'], prefilter=True, analyzer=analyzer)
+        assert 3 in dogs.plausible('dog', threshold=1)
+
+    def test_index_prefilter(self, monkeypatch):
+        search = core.SearchEngine(['words'], limit=-1)
+        full = index.SearchIndex(self.items, ['words'])
+        filtered = index.SearchIndex(self.items, ['words'], prefilter=True)
+        for similar in (.75, .9):
+            monkeypatch.setattr(config, 'THRESHOLD', similar)
+            for query in QUERIES:
+                for threshold in (.6, .75, .9, .95):
+                    assert len(filtered.candidates(query)) <= \
+                        len(full.candidates(query))
+                    assert search(query, filtered, threshold=threshold) == \
+                        search(query, self.items, threshold=threshold)
+
+    def test_benchmark_corpus(self):
+        items = corpus.generate(300, seed=3)
+        queries = [
+            query for shape in corpus.QUERY_SHAPES
+            for query in corpus.queries(6, shape, seed=3)
+        ]
+        search = core.SearchEngine(['name'], limit=-1)
+        names = index.SearchIndex(items, ['name'], prefilter=True)
+        for query in queries:
+            for threshold in (.6, .75, .9, .95):
+                assert search(query, names, threshold=threshold) == \
+                    search(query, items, threshold=threshold)
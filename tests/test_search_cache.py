@@ -0,0 +1,158 @@
+"""
+Testing module for the caching utilities
+"""
+import pickle
+import threading
+import time
+
+from search import core, utils
+from search.cache import LRUCache, RatioCache, ResultCache
+from search.corpus import Corpus
+from search.index import SearchIndex
+from tests.helpers import Item
+
+
+class TestLRUCache:
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1  # 'b' is now the least recently used
+        cache.set('c', 3)
+        assert 'b' not in cache
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    def test_counters(self):
+        cache = LRUCache(-1)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        assert (cache.hits, cache.misses) == (1, 1)
+        cache.clear()
+        assert (len(cache), cache.hits, cache.misses) == (0, 0, 0)
+
+
+class TestRatioCache:
+    def test_memoize(self):
+        ratio = RatioCache(utils.ratio, 10)
+        assert ratio('holmes', 'holmez') == utils.ratio('holmes', 'holmez')
+        assert ratio('holmes', 'holmez') == utils.ratio('holmes', 'holmez')
+        assert (ratio.hits, ratio.misses) == (1, 1)
+        assert ratio.hit_rate == .5
+
+    def test_bounded(self):
+        ratio = RatioCache(utils.ratio, 2)
+        for word in ('sherlock', 'holmes', 'watson'):
+            ratio('holmes', word)
+        assert len(ratio) == 2
+        assert ('holmes', 'sherlock') not in ratio
+
+    def test_threads(self):
+        ratio = RatioCache(utils.ratio, 5)
+        words = ['word{}'.format(i) for i in range(10)]
+
+        def work():
+            for a in words:
+                for b in words:
+                    assert ratio(a, b) == utils.ratio(a, b)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(ratio) == 5
+        assert ratio.hits + ratio.misses == 4 * len(words) ** 2
+
+    def test_pickle(self):
+        ratio = RatioCache(utils.ratio, 10)
+        ratio('holmes', 'holmez')
+        copy = pickle.loads(pickle.dumps(ratio))
+        assert (copy.ratio, copy.maxsize, len(copy)) == (utils.ratio, 10, 0)
+
+    def test_engine(self):
+        items = Item.setup()
+        search = core.SearchEngine(['words'], limit=10)
+        plain = core.SearchEngine(['words'], limit=10, ratio_cache=0)
+        assert isinstance(search.ratio, RatioCache)
+        assert plain.ratio is utils.ratio
+        for query in ('sherlock holmes', 'watson', 'sherlock holmes'):
+            assert search(query, items) == plain(query, items)
+        assert search.ratio.hits > 0
+
+
+class TestResultCache:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.index = SearchIndex(cls.items, ['words'])
+        cls.search = core.SearchEngine(['words'], limit=10)
+
+    def engine(self, cache):
+        return core.SearchEngine(['words'], limit=10, cache=cache)
+
+    def test_hits(self):
+        cache = ResultCache(10)
+        engine = self.engine(cache)
+        expected = self.search('sherlock holmes', self.index)
+        assert engine('sherlock holmes', self.index) == expected
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert engine('sherlock holmes', self.index) == expected
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_serves_narrower_searches(self):
+        cache = ResultCache(10)
+        engine = self.engine(cache)
+        engine('sherlock holmes', self.index, limit=-1, threshold=.5)
+        for limit, threshold in ((3, .5), (-1, .9), (5, .8), (-1, .5)):
+            expected = self.search(
+                'sherlock holmes', self.index, limit=limit,
+                threshold=threshold)
+            assert engine(
+                'sherlock holmes', self.index, limit=limit,
+                threshold=threshold) == expected
+        assert (cache.hits, cache.misses) == (4, 1)
+
+    def test_does_not_serve_broader_searches(self):
+        cache = ResultCache(10)
+        engine = self.engine(cache)
+        engine('sherlock holmes', self.index, limit=3)
+        # more results or a lower threshold need a new search
+        assert engine('sherlock holmes', self.index, limit=5) == \
+            self.search('sherlock holmes', self.index, limit=5)
+        assert engine('sherlock holmes', self.index, threshold=.5) == \
+            self.search('sherlock holmes', self.index, threshold=.5)
+        assert cache.hits == 0
+
+    def test_invalidation(self):
+        cache = ResultCache(10)
+        engine = self.engine(cache)
+        index = SearchIndex(self.items[:10], ['words'])
+        engine('sherlock holmes', index)
+        index.add(self.items[10])
+        engine('sherlock holmes', index)
+        assert (cache.hits, cache.misses) == (0, 2)
+        # datasets without a version are not cached
+        engine('sherlock holmes', self.items)
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    def test_throwaway_datasets(self):
+        # released datasets of the same size may get the same address
+        Row = type('Row', (), {})
+        first, second = Row(), Row()
+        first.words, second.words = 'sherlock holmes', 'mycroft holmes'
+        engine = self.engine(ResultCache(10))
+        for dataset in (Corpus, SearchIndex):
+            assert engine('holmes', dataset([first], ['words'])) == [first]
+            assert engine('holmes', dataset([second], ['words'])) == \
+                [second]
+
+    def test_ttl(self):
+        cache = ResultCache(10, ttl=.01)
+        engine = self.engine(cache)
+        engine('watson', self.index)
+        time.sleep(.02)
+        engine('watson', self.index)
+        assert (cache.hits, cache.misses) == (0, 2)
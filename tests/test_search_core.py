@@ -1,7 +1,13 @@
 """
 Testing module for the search core functionalities
 """
-from search import core
+import asyncio
+
+import pytest
+
+from search import core, ranking, utils
+from search.index import SearchIndex
+from search.stats import SearchStats
 from tests.helpers import Item
 
 
@@ -59,3 +65,207 @@ class TestCore:
             'sherlock holmes great many scattered papers have whatever bears upon stone professional work attend'   # noqa: E501
         ]
         assert results == expected
+
+    def test_best_segment(self, monkeypatch):
+        # the token matchers rate the best segment of the string as long as
+        # each query token, not the last one as they once did
+        search = core.SearchEngine(['words'])
+        assert len(search('your', self.items)) == 23
+        assert len(search('alst', self.items)) == 24
+
+        # and rating only the promising segments finds the same one
+        queries = ('your', 'alst', 'sherlock holmes', 'shelrock holms',
+                   'miss violet hunter my friend and colleague')
+        expected = {query: search(query, self.items) for query in queries}
+
+        def every_segment(query, string, ratio=utils.ratio, min_score=0):
+            return max(
+                ratio(query, segment)
+                for segment in utils.shifter(string, len(query)))
+        monkeypatch.setattr(utils, 'best_partial_ratio', every_segment)
+        search = core.SearchEngine(['words'])
+        for query in queries:
+            assert search(query, self.items) == expected[query]
+
+
+class TestTopK:
+    def test_keeps_best_in_order(self):
+        ratings = [.5, .9, .7, .9, .1, .7]
+        everything = ranking.TopK()
+        best = ranking.TopK(limit=3)
+        for seq, rating in enumerate(ratings):
+            everything.push(rating, seq, seq)
+            best.push(rating, seq, seq)
+
+        # equal ratings keep the dataset order
+        assert everything.items() == [1, 3, 2, 5, 0, 4]
+        assert best.items() == [1, 3, 2]
+        assert best.full
+        assert best.cutoff == .7
+
+    def test_rejects_when_full(self):
+        top = ranking.TopK(limit=1)
+        assert top.cutoff is None
+        assert top.push(.8, 0, 'a')
+        assert not top.push(.8, 1, 'b')  # same rating, comes later
+        assert not top.push(.2, 2, 'c')
+        assert top.push(.9, 3, 'd')
+        assert top.items() == ['d']
+
+
+class TestPruning:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.rows = [(item, [item.words]) for item in cls.items]
+
+    def test_same_results(self):
+        queries = ('sherlock holmes', 'watson', 'shelrock holms',
+                   'miss violet hunter my friend and colleague')
+        for query in queries:
+            for limit in (1, 5, -1):
+                pruned = ranking.collect(
+                    query, self.rows, [1], .75, limit)
+                exact = ranking.collect(
+                    query, self.rows, [1], .75, limit, prune=False)
+                assert pruned.entries() == exact.entries()
+
+    def test_skipped_work(self):
+        pruned, exact = SearchStats(), SearchStats()
+        ranking.collect(
+            'holmes said that', self.rows, [1], .75, 5, stats=pruned)
+        ranking.collect(
+            'holmes said that', self.rows, [1], .75, 5, stats=exact,
+            prune=False)
+        assert pruned.ratio_calls < exact.ratio_calls
+        assert pruned.rejected > 0
+        assert sum(pruned.skipped.values()) > sum(exact.skipped.values())
+
+    def test_rate(self):
+        values = ['sherlock holmes', 'holmes']
+        assert ranking.rate('holmes', values, [2, 1]) == (1, 3)
+        match, _ = ranking.rate(
+            'watson', values, [2, 1], min_score=.9)
+        assert match < .9
+
+
+class TestIterSearch:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.search = core.SearchEngine(['words'])
+
+    def test_same_matches_as_search(self):
+        seq = Item.get_by_length(3, 5)
+        found = list(self.search.iter_search('sherlock holmes', seq))
+        assert sorted(obj for obj, _ in found) == \
+            sorted(self.search('sherlock holmes', seq))
+        # objects come in the dataset order
+        positions = [seq.index(obj) for obj, _ in found]
+        assert positions == sorted(positions)
+        assert all(match >= self.search.threshold for _, match in found)
+
+    def test_stop_after(self):
+        consumed = []
+
+        def dataset():
+            for item in Item.get_by_length(3, 5):
+                consumed.append(item)
+                yield item
+
+        found = list(self.search.iter_search(
+            'sherlock holmes', dataset(), stop_after=2))
+        perfect = [obj for obj, match in found if match == 1]
+        assert len(perfect) == 2
+        assert found[-1][0] is consumed[-1]
+        assert len(consumed) < len(Item.get_by_length(3, 5))
+
+
+class TestAsyncSearch:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.search = core.SearchEngine(['words'], limit=10)
+
+    @staticmethod
+    async def cursor(items, consumed=None):
+        for item in items:
+            if consumed is not None:
+                consumed.append(item)
+            await asyncio.sleep(0)
+            yield item
+
+    def test_same_results_as_search(self):
+        for query in ('sherlock holmes', 'watson', 'inconvene'):
+            for limit in (3, -1):
+                expected = self.search(query, self.items, limit=limit)
+                coro = self.search.async_search(
+                    query, self.cursor(self.items), limit=limit,
+                    batch_size=64)
+                assert asyncio.run(coro) == expected
+                coro = self.search.async_search(
+                    query, self.items, limit=limit, batch_size=64)
+                assert asyncio.run(coro) == expected
+
+    def test_cancel(self):
+        consumed = []
+
+        async def run():
+            task = asyncio.ensure_future(self.search.async_search(
+                'sherlock holmes', self.cursor(self.items, consumed),
+                batch_size=16))
+            while len(consumed) < 32:
+                await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        assert len(consumed) < len(self.items)
+
+
+class TestSearchMany:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.search = core.SearchEngine(['words'], limit=5)
+        cls.queries = ['sherlock holmes', 'watson', 'inconvene', 'laugh']
+
+    def test_same_results_as_search(self):
+        for limit in (5, -1):
+            results = self.search.search_many(
+                self.queries, self.items, limit=limit)
+            assert results == [
+                self.search(query, self.items, limit=limit)
+                for query in self.queries
+            ]
+
+    def test_index(self):
+        index = SearchIndex(self.items, ['words'])
+        results = self.search.search_many(self.queries, index)
+        assert results == [
+            self.search(query, index) for query in self.queries]
+
+    def test_index_reads_candidates(self):
+        read = []
+
+        class Tracked:
+            def __init__(self, words):
+                self._words = words
+
+            @property
+            def words(self):
+                read.append(self)
+                return self._words
+
+        docs = [Tracked(item.words) for item in self.items]
+        index = SearchIndex(docs, ['words'])
+        candidates = {
+            doc_id for query in self.queries
+            for doc_id in index.candidate_ids(query)}
+        del read[:]
+        results = self.search.search_many(self.queries, index)
+        # only the candidates of some query were read, once each
+        assert sorted(docs.index(doc) for doc in read) == sorted(candidates)
+        assert results == [
+            self.search(query, docs) for query in self.queries]
@@ -0,0 +1,81 @@
+"""
+Testing module for the columnar corpus
+"""
+import asyncio
+
+import pytest
+
+from search import core, parallel
+from search.cache import ResultCache
+from search.corpus import Corpus
+from search.index import SearchIndex
+from tests.helpers import Item
+from tests.test_search_index import QUERIES
+
+
+class TestCorpus:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.corpus = Corpus(cls.items, ['words', 'length'])
+        cls.ids = Corpus(cls.items, ['words'], key=cls.items.index)
+        cls.search = core.SearchEngine(['words'], limit=10)
+
+    def test_columns(self):
+        assert len(self.corpus) == len(self.items)
+        assert list(self.corpus) == self.items
+        assert self.corpus.columns['words'][3] == self.items[3].words
+        assert list(self.corpus.rows(['length'], [0])) == \
+            [(self.items[0], [self.items[0].length])]
+        with pytest.raises(AttributeError):
+            list(self.ids.rows(['length']))
+
+    def test_key(self):
+        corpus = Corpus(self.items[:3], ['words'], key='length')
+        assert corpus.items == [item.length for item in self.items[:3]]
+
+    def test_same_results(self):
+        for query in QUERIES:
+            expected = self.search(query, self.items)
+            assert self.search(query, self.corpus) == expected
+            assert self.search(query, self.ids) == \
+                [self.items.index(item) for item in expected]
+
+    def test_other_searches(self):
+        query = 'sherlock holmes'
+        assert self.search.search_many([query], self.corpus) == \
+            self.search.search_many([query], self.items)
+        assert list(self.search.iter_search(query, self.corpus)) == \
+            list(self.search.iter_search(query, self.items))
+        assert asyncio.run(self.search.async_search(query, self.corpus)) == \
+            self.search(query, self.items)
+
+    def test_index(self):
+        index = SearchIndex(self.ids, ['words'])
+        candidates = index.candidates('sherlock holmes')
+        assert isinstance(candidates, Corpus)
+        for query in QUERIES:
+            assert self.search(query, index) == self.search(query, self.ids)
+
+        corpus = Corpus(self.items[:5], ['words'])
+        index = SearchIndex(corpus, ['words'])
+        doc_id = index.add(self.items[5])
+        assert (doc_id, len(corpus), index.version) == (5, 6, 6)
+        assert index.documents[doc_id] is self.items[5]
+
+    def test_cache(self):
+        search = core.SearchEngine(['words'], limit=10, cache=ResultCache(10))
+        corpus = Corpus(self.items, ['words'])
+        expected = search('watson', corpus)
+        assert search('watson', corpus) == expected
+        assert search.cache.hits == 1
+        corpus.append(self.items[0])
+        search('watson', corpus)
+        assert search.cache.hits == 1
+
+    def test_shared_corpus(self):
+        with parallel.SharedCorpus(self.ids, ['words']) as shared:
+            assert shared.documents == self.ids.items
+            attached = parallel._AttachedCorpus(shared.spec)
+            assert attached.value(0, 0) == self.items[0].words
+            attached.close()
@@ -0,0 +1,85 @@
+"""
+Testing module for the inverted index
+"""
+import random
+
+from benchmarks import corpus
+from search import config, core, index, utils
+from tests.helpers import Item
+
+QUERIES = [
+    'inconvene',
+    'laugh',
+    'sherlock holmes',
+    'holmes sherlock',
+    'watson',
+    'shelrock',
+    'doctor watson wanted',
+    'miss violet hunter my friend and colleague',
+]
+
+
+class TestIndex:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.index = index.SearchIndex(cls.items, ['words'])
+        cls.search = core.SearchEngine(['words'], limit=-1)
+
+    def test_lookup(self):
+        for token in ('holmes', 'shelrock', 'wtson', 'inconvene', 'hunt'):
+            expected = {
+                other for other in self.index.vocabulary
+                if utils.ratio(token, other) >= config.THRESHOLD
+            }
+            assert self.index.lookup(token) == expected
+
+    def test_candidates_are_pruned(self):
+        candidates = self.index.candidates('sherlock holmes')
+        assert 0 < len(candidates) < len(self.items)
+        # candidates keep the dataset order
+        positions = [self.items.index(c) for c in candidates]
+        assert positions == sorted(positions)
+
+    def test_candidates_fallback(self):
+        # no usable n-grams or unknown attributes, everything is a candidate
+        assert len(self.index.candidates('a b c')) == len(self.items)
+        assert len(self.index.candidates('holmes', ['other'])) == \
+            len(self.items)
+
+    def test_results_of_full_scan(self):
+        rng = random.Random(17)
+        vocabulary = sorted({
+            word for item in self.items for word in item.words.split()
+            if len(word) > 4
+        })
+
+        def query():
+            word = rng.choice(vocabulary)
+            if rng.random() < .5:
+                # swap two letters
+                i = rng.randrange(len(word) - 1)
+                word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+            if rng.random() < .3:
+                word += ' ' + rng.choice(vocabulary)
+            return word
+
+        for query in [query() for _ in range(60)] + QUERIES:
+            assert self.search(query, self.index) == \
+                self.search(query, self.items)
+
+    def test_benchmark_corpus(self):
+        items = corpus.generate(300, seed=3)
+        queries = [
+            query for shape in corpus.QUERY_SHAPES
+            for query in corpus.queries(6, shape, seed=3)
+        ]
+        # four letters tokens, that share few characters with the segments
+        # of the values they match
+        queries += ['send', 'nigh', 'brass', 'places', 'send nigh']
+        search = core.SearchEngine(['name'], limit=-1)
+        names = index.SearchIndex(items, ['name'])
+        for query in queries:
+            for threshold in (.6, .75, .9):
+                assert search(query, names, threshold=threshold) == \
+                    search(query, items, threshold=threshold)
@@ -0,0 +1,97 @@
+"""
+Testing module for the parallel search on shared memory
+"""
+from collections import namedtuple
+
+from search import core, parallel
+from search.corpus import Corpus
+from search.analysis import Analyzer
+from tests.helpers import Item
+
+Row = namedtuple('Row', ['words', 'length'])
+
+
+class TestParallel:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.search = core.SearchEngine(['words'], limit=10)
+        cls.parallel = core.SearchEngine(['words'], limit=10, workers=2)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.parallel.close()
+
+    def test_shared_corpus(self):
+        items = [Row('sherlock holmes', 2), Row('caffè latte', 2)]
+        with parallel.SharedCorpus(items, ['words', 'length']) as corpus:
+            assert list(corpus) == items
+            attached = parallel._AttachedCorpus(corpus.spec)
+            assert attached.value(0, 0) == 'sherlock holmes'
+            assert attached.value(1, 0) == 'caffè latte'
+            assert attached.value(1, 1) == '2'
+            attached.close()
+
+    def test_same_results_as_serial(self):
+        with parallel.SharedCorpus(self.items, ['words']) as corpus:
+            for query in ('sherlock holmes', 'watson', 'inconvene'):
+                for limit in (3, -1):
+                    expected = self.search(query, self.items, limit=limit)
+                    assert self.parallel(query, corpus, limit=limit) == \
+                        expected
+
+    def test_plain_dataset(self):
+        seq = Item.get_by_length(3, 5)
+        assert self.parallel('sherlock holmes', seq) == \
+            self.search('sherlock holmes', seq)
+
+    def test_analyzer(self):
+        # the workers compile the query with the analyzer of the engine,
+        # that keeps the short tokens the default one drops
+        items = [Row('the cat', 2), Row('the dog', 2), Row('cats', 1)]
+        engine = core.SearchEngine(
+            ['words'], workers=2, analyzer=Analyzer(min_length=1))
+        try:
+            assert engine('cat', items) == [items[0], items[2]]
+        finally:
+            engine.close()
+
+    def test_temporary_corpora_detached(self):
+        # the copies of the datasets are not left attached to the workers
+        with core.SearchEngine(['words'], workers=2) as engine:
+            engine('sherlock holmes', self.items)
+            engine('sherlock holmes', Corpus(self.items, ['words']))
+            futures = [
+                engine._pool._executor.submit(attached) for _ in range(4)]
+            assert all(future.result() == [] for future in futures)
+
+            with parallel.SharedCorpus(self.items, ['words']) as corpus:
+                engine('sherlock holmes', corpus)
+                futures = [
+                    engine._pool._executor.submit(attached)
+                    for _ in range(4)]
+                assert any(future.result() for future in futures)
+
+    def test_corpus_copied_once(self):
+        corpus = Corpus(self.items[:20], ['words'])
+        engine = core.SearchEngine(['words'], workers=2)
+        try:
+            expected = self.search('sherlock holmes', corpus)
+            assert engine('sherlock holmes', corpus) == expected
+            shared = engine._shared[1]
+            assert engine('watson', corpus) == self.search('watson', corpus)
+            assert engine._shared[1] is shared
+
+            # a changed corpus is copied again, releasing the old copy
+            corpus.append(self.items[20])
+            engine('sherlock holmes', corpus)
+            assert engine._shared[1] is not shared
+            assert shared._shm is None
+        finally:
+            engine.close()
+        assert engine._shared is None
+
+
+def attached():
+    """Return the names of the corpora attached to a worker process."""
+    return list(parallel._attached)
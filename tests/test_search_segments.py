@@ -0,0 +1,155 @@
+"""
+Testing module for the incremental, segmented index
+"""
+import threading
+from collections import namedtuple
+
+import pytest
+
+from search import core
+from search.cache import ResultCache
+from search.corpus import Corpus
+from search.index import SearchIndex
+from search.segments import SegmentedIndex
+from tests.helpers import Item
+from tests.test_search_index import QUERIES
+
+Doc = namedtuple('Doc', ['id', 'words'])
+
+
+class TestSegments:
+    @classmethod
+    def setup_class(cls):
+        items = Item.setup()
+        cls.docs = [Doc(i, item.words) for i, item in enumerate(items)]
+        cls.search = core.SearchEngine(['words'], limit=10)
+
+    def index(self, docs=None, **options):
+        return SegmentedIndex(
+            self.docs if docs is None else docs, ['words'], 'id', **options)
+
+    def test_same_results(self):
+        index = self.index()
+        for query in QUERIES:
+            assert self.search(query, index) == self.search(query, self.docs)
+        assert self.search.search_many(QUERIES, index) == \
+            self.search.search_many(QUERIES, self.docs)
+        assert list(self.search.iter_search('watson', index)) == \
+            list(self.search.iter_search('watson', self.docs))
+
+    def test_writes(self):
+        index = self.index(self.docs[:10])
+        index.add(Doc(100, 'sherlock holmes'))
+        index.update(Doc(3, 'doctor watson'))
+        index.remove(5)
+        assert len(index) == 10
+        assert index.get(3) == Doc(3, 'doctor watson')
+        assert 5 not in index
+
+        expected = [d for d in self.docs[:10] if d.id not in (3, 5)] + \
+            [Doc(100, 'sherlock holmes'), Doc(3, 'doctor watson')]
+        assert list(index) == expected
+        for query in ('sherlock holmes', 'watson'):
+            assert self.search(query, index) == self.search(query, expected)
+
+        with pytest.raises(ValueError):
+            index.add(Doc(3, 'again'))
+        with pytest.raises(KeyError):
+            index.update(Doc(5, 'removed'))
+        with pytest.raises(KeyError):
+            index.remove(5)
+
+    def test_snapshot(self):
+        index = self.index(self.docs[:10])
+        snapshot = index.snapshot()
+        assert isinstance(snapshot, SearchIndex)
+        index.remove(0)
+        index.update(Doc(1, 'sherlock holmes'))
+        index.add(Doc(100, 'sherlock holmes'))
+        assert list(snapshot) == self.docs[:10]
+        assert self.search('sherlock holmes', snapshot) == \
+            self.search('sherlock holmes', self.docs[:10])
+        with pytest.raises(TypeError):
+            snapshot.add(Doc(101, 'watson'))
+
+    def test_compaction(self):
+        index = self.index(self.docs[:20], max_segments=3)
+        for i in range(20, 40):
+            index.add(self.docs[i])
+            if i % 2:
+                index.remove(i - 20)
+            index.snapshot()
+        index.wait_compaction()
+        assert len(index.segments) <= 4
+
+        expected = list(index)
+        index.compact()
+        assert len(index.segments) == 1
+        assert len(index.segments[0]) == len(index) == 30
+        assert list(index) == expected
+        for query in QUERIES:
+            assert self.search(query, index) == self.search(query, expected)
+
+    def test_corpus(self):
+        corpus = Corpus(self.docs[:20], ['words'], key='id')
+        index = SegmentedIndex(corpus, ['words'], key='id', max_segments=2)
+        assert list(index) == list(range(20))
+        for query in QUERIES:
+            assert self.search(query, index) == self.search(query, corpus)
+        assert self.search.search_many(QUERIES, index) == \
+            self.search.search_many(QUERIES, corpus)
+
+        # the written objects are stored as rows of the same corpus
+        index.update(Doc(3, 'sherlock holmes'))
+        index.remove(5)
+        index.add(Doc(100, 'doctor watson'))
+        index.compact()
+        expected = Corpus(
+            [d for d in self.docs[:20] if d.id not in (3, 5)] +
+            [Doc(3, 'sherlock holmes'), Doc(100, 'doctor watson')],
+            ['words'], key='id')
+        assert list(index) == list(expected)
+        assert index.get(100) == 100
+        for query in QUERIES:
+            assert self.search(query, index) == self.search(query, expected)
+
+    def test_concurrent(self):
+        index = self.index(self.docs[:50], max_segments=2)
+        errors = []
+
+        def write():
+            for i in range(50, 150):
+                index.add(self.docs[i])
+                index.remove(i - 50)
+
+        def read():
+            try:
+                for _ in range(20):
+                    snapshot = index.snapshot()
+                    docs = list(snapshot)
+                    # between an add and its remove there are 51
+                    assert len(docs) in (50, 51)
+                    self.search('sherlock holmes', snapshot)
+                    assert list(snapshot) == docs
+            except Exception as exc:  # pragma: no cover
+                errors.append(exc)
+
+        threads = [threading.Thread(target=write)] + \
+            [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        index.compact()
+        assert not errors
+        assert list(index) == self.docs[100:150]
+
+    def test_cache(self):
+        index = self.index(self.docs[:20])
+        search = core.SearchEngine(['words'], cache=ResultCache(10))
+        search('watson', index)
+        search('watson', index)
+        assert search.cache.hits == 1
+        index.remove(0)
+        search('watson', index)
+        assert search.cache.hits == 1
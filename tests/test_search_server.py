@@ -0,0 +1,159 @@
+"""
+Testing module for the search server
+"""
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+from search import core, server, storage
+from search.corpus import Corpus
+from tests.helpers import Item
+
+
+class TestServer:
+    @pytest.fixture
+    def address(self, tmp_path):
+        """Start a server of the items on a free port, yield its address."""
+        self.items = Item.setup()
+        self.search = core.SearchEngine(['words'], limit=5)
+        self.path = str(tmp_path / 'items.idx')
+        storage.save(Corpus(self.items, ['words'], key='words'), self.path)
+        self.server = server.SearchServer(self.path, limit=5)
+
+        httpd = server.make_server(self.server, ('127.0.0.1', 0))
+        self.server._httpd = httpd
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        yield httpd.server_address
+        httpd.shutdown()
+        httpd.server_close()
+
+    def request(self, conn, method, path, body=None):
+        conn.request(method, path, body=json.dumps(body) if body else None,
+                     headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+
+    def expected(self, query):
+        return [item.words for item in self.search(query, self.items)]
+
+    def test_search(self, address):
+        conn = http.client.HTTPConnection(*address)
+        # the same connection is kept alive
+        for query in ('sherlock holmes', 'watson', 'shelrock holms'):
+            status, body = self.request(
+                conn, 'POST', '/search', {'query': query})
+            assert status == 200
+            assert body['results'] == self.expected(query)
+        assert self.request(
+            conn, 'POST', '/search', {'query': 'watson', 'limit': 2}
+        )[1]['results'] == self.expected('watson')[:2]
+
+        status, body = self.request(conn, 'GET', '/health')
+        assert (status, body['size'], body['loads']) == \
+            (200, len(self.items), 1)
+        assert self.request(conn, 'POST', '/search', {})[0] == 400
+        assert self.request(conn, 'GET', '/nowhere')[0] == 404
+        conn.close()
+
+    def test_options(self, address):
+        conn = http.client.HTTPConnection(*address)
+        # numbers given as strings are converted
+        status, body = self.request(
+            conn, 'POST', '/search',
+            {'query': 'watson', 'limit': '2', 'threshold': '0.8'})
+        assert status == 200
+        assert body['results'] == [
+            item.words for item in self.search(
+                'watson', self.items, limit=2, threshold=.8)]
+
+        for options in ({'limit': 'ten'}, {'limit': 2.5}, {'limit': -2},
+                        {'limit': True}, {'threshold': 'high'},
+                        {'threshold': [1]}, {'threshold': 1.5},
+                        {'threshold': 'nan'}):
+            status, body = self.request(
+                conn, 'POST', '/search', dict(options, query='watson'))
+            assert status == 400
+            assert body['error']
+        conn.close()
+
+    def test_pipelining(self, address):
+        request = (
+            'POST /search HTTP/1.1\r\nHost: test\r\n'
+            'Content-Type: application/json\r\nContent-Length: {}\r\n\r\n{}')
+        queries = ('sherlock holmes', 'watson')
+        data = ''.join(
+            request.format(len(body), body)
+            for body in (json.dumps({'query': q}) for q in queries))
+
+        with socket.create_connection(address) as sock:
+            # both requests are sent before reading any response
+            sock.sendall(data.encode('utf-8'))
+            for query in queries:
+                response = http.client.HTTPResponse(sock)
+                response.begin()
+                assert response.status == 200
+                assert json.loads(response.read())['results'] == \
+                    self.expected(query)
+
+    def test_reload(self, address, tmp_path, monkeypatch):
+        conn = http.client.HTTPConnection(*address)
+        path = str(tmp_path / 'watson.idx')
+        storage.save(Corpus(
+            [item for item in self.items if 'watson' in item.words],
+            ['words'], key='words'), path)
+
+        # other paths are only loaded if allowed
+        assert self.request(
+            conn, 'POST', '/reload', {'path': path})[0] == 403
+        assert self.request(conn, 'POST', '/reload', {})[0] == 200
+        self.server.reload_path = True
+        status, body = self.request(conn, 'POST', '/reload', {'path': path})
+        assert (status, body['path'], body['loads']) == (200, path, 3)
+        status, body = self.request(
+            conn, 'POST', '/search', {'query': 'sherlock holmes'})
+        assert all('watson' in words for words in body['results'])
+
+        # a broken index leaves the current one in place
+        status, _ = self.request(
+            conn, 'POST', '/reload', {'path': str(tmp_path / 'missing')})
+        assert status == 400
+        assert self.server.path == path
+
+        def reload(path=None):
+            raise RuntimeError('unexpected')
+        monkeypatch.setattr(self.server, 'reload', reload)
+        assert self.request(conn, 'POST', '/reload', {})[0] == 500
+        conn.close()
+
+    def test_unix_socket(self, tmp_path):
+        path = str(tmp_path / 'items.idx')
+        storage.save(Corpus(Item.setup(), ['words'], key='words'), path)
+        search_server = server.SearchServer(path, limit=3)
+        address = str(tmp_path / 'search.sock')
+        thread = threading.Thread(
+            target=search_server.serve, args=(address,), daemon=True)
+        thread.start()
+        try:
+            for _ in range(100):
+                if search_server._httpd is not None:
+                    break
+                threading.Event().wait(.01)
+
+            with socket.socket(socket.AF_UNIX) as sock:
+                sock.connect(address)
+                body = json.dumps({'query': 'watson'})
+                sock.sendall((
+                    'POST /search HTTP/1.1\r\nHost: unix\r\n'
+                    'Content-Length: {}\r\n\r\n{}').format(
+                        len(body), body).encode('utf-8'))
+                response = http.client.HTTPResponse(sock)
+                response.begin()
+                assert response.status == 200
+                assert len(json.loads(response.read())['results']) == 3
+        finally:
+            search_server.shutdown()
+            thread.join()
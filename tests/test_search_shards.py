@@ -0,0 +1,85 @@
+"""
+Testing module for the sharded search
+"""
+from collections import namedtuple
+
+import pytest
+
+from search import core, shards
+from tests.helpers import Item
+
+Book = namedtuple('Book', ['title', 'words'])
+
+
+class TestShards:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.search = core.SearchEngine(['words'])
+        cls.ranged = shards.ShardedSearch(cls.items, ['words'], shards=3)
+        cls.hashed = shards.ShardedSearch(
+            cls.items, ['words'], shards=2, key='words', partition='hash')
+
+    @classmethod
+    def teardown_class(cls):
+        cls.ranged.close()
+        cls.hashed.close()
+
+    def test_same_results(self):
+        for query in ('sherlock holmes', 'watson', 'shelrock holms'):
+            for limit in (1, 5, -1):
+                expected = self.search(query, self.items, limit=limit)
+                for sharded in (self.ranged, self.hashed):
+                    results = sharded(query, limit=limit)
+                    assert results == expected
+                    assert not results.partial
+                    assert results.missing == []
+
+    def test_weights(self):
+        # the title matches less, but its weight is only higher once scaled
+        books = [Book('sherl holmes', 'doctor watson'),
+                 Book('doctor watson', 'sherlock holmes')]
+        attributes = ['title', 'words']
+        expected = core.SearchEngine(attributes)(
+            'sherlock holmes', books, weights=[3, 2.5])
+        assert expected == [books[1], books[0]]
+        with shards.ShardedSearch(books, attributes, shards=2,
+                                  weights=[3, 2.5]) as sharded:
+            assert sharded('sherlock holmes') == expected
+            assert sharded('sherlock holmes', weights=[6, 5]) == expected
+            assert sharded('sherlock holmes', weights=[1, 3]) == \
+                core.SearchEngine(attributes)(
+                    'sherlock holmes', books, weights=[1, 3])
+
+    def test_partition(self):
+        with pytest.raises(ValueError):
+            shards.ShardedSearch(self.items, ['words'], 2, partition='hash')
+        with pytest.raises(ValueError):
+            shards.ShardedSearch(self.items, ['words'], 2, partition='mod')
+        assert self.ranged.shards == 3
+        assert len(self.hashed) == len(self.items)
+
+    def test_timeout(self):
+        results = self.ranged('sherlock holmes', timeout=0)
+        assert results.partial
+        assert results.missing
+        # the late answers are discarded
+        assert self.ranged('watson', limit=5) == \
+            self.search('watson', self.items, limit=5)
+
+    def test_dead_shard(self):
+        sharded = shards.ShardedSearch(self.items, ['words'], shards=2)
+        try:
+            sharded._processes[0].terminate()
+            sharded._processes[0].join()
+            results = sharded('sherlock holmes')
+            assert results.partial
+            assert results.missing == [0]
+            # only the second half of the items is left
+            half = -(-len(self.items) // 2)
+            second = {id(item) for item in self.items[half:]}
+            expected = self.search('sherlock holmes', self.items)
+            assert results == [
+                item for item in expected if id(item) in second]
+        finally:
+            sharded.close()
@@ -0,0 +1,50 @@
+"""
+Testing module for the search instrumentation
+"""
+from search import core
+from search.cache import ResultCache
+from search.index import SearchIndex
+from tests.helpers import Item
+
+
+class TestStats:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.search = core.SearchEngine(['words'], limit=10)
+
+    def test_same_results(self):
+        search = core.SearchEngine(['words'], limit=10, instrument=True)
+        for query in ('sherlock holmes', 'watson', 'inconvene'):
+            assert search(query, self.items) == self.search(query, self.items)
+
+    def test_counters(self):
+        search = core.SearchEngine(['words'], instrument=True)
+        results = search('sherlock holmes', self.items)
+        stats = search.last_stats
+        assert stats.scanned == len(self.items)
+        assert stats.accepted == len(results)
+        assert stats.ratio_calls > 0
+        assert sum(stats.branches.values()) == len(self.items)
+        assert set(stats.matcher_time) <= set(stats.branches)
+        assert stats.elapsed >= stats.attribute_time > 0
+        assert not stats.cached
+        assert stats.as_dict()['scanned'] == len(self.items)
+
+    def test_on_stats(self):
+        collected = []
+        search = core.SearchEngine(['words'], on_stats=collected.append)
+        search('watson', self.items)
+        search('holmes', self.items)
+        assert len(collected) == 2
+        assert collected[-1] is search.last_stats
+
+    def test_cached(self):
+        index = SearchIndex(self.items, ['words'])
+        search = core.SearchEngine(
+            ['words'], limit=10, cache=ResultCache(10), instrument=True)
+        search('watson', index)
+        assert search.last_stats.scanned > 0
+        search('watson', index)
+        assert search.last_stats.cached
+        assert search.last_stats.scanned == 0
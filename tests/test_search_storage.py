@@ -0,0 +1,95 @@
+"""
+Testing module for the on-disk index
+"""
+import json
+
+import pytest
+
+from search import core, storage
+from search.corpus import Corpus
+from search.index import SearchIndex
+from tests.helpers import Item
+from tests.test_search_index import QUERIES
+
+
+class TestStorage:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.corpus = Corpus(cls.items, ['words'], key=cls.items.index)
+        cls.search = core.SearchEngine(['words'], limit=10)
+
+    def test_same_results(self, tmp_path):
+        path = str(tmp_path / 'items.idx')
+        storage.save(self.corpus, path)
+        index = storage.load(path)
+        assert isinstance(index, SearchIndex)
+        assert list(index.corpus) == self.corpus.items
+        assert list(index.corpus.columns['words']) == \
+            self.corpus.columns['words']
+
+        expected = SearchIndex(self.corpus, ['words'])
+        for query in QUERIES:
+            assert self.search(query, index) == self.search(query, expected)
+        assert self.search.search_many(QUERIES, index) == \
+            self.search.search_many(QUERIES, self.corpus)
+
+    def test_string_ids(self, tmp_path):
+        path = str(tmp_path / 'items.idx')
+        corpus = Corpus(self.items, ['words'], key='words')
+        storage.save(SearchIndex(corpus, ['words']), path)
+        index = storage.load(path)
+        assert self.search('watson', index) == self.search('watson', corpus)
+
+    def test_read_only(self, tmp_path):
+        path = str(tmp_path / 'items.idx')
+        storage.save(self.corpus, path)
+        index = storage.load(path)
+        with pytest.raises(TypeError):
+            index.add(self.items[0])
+
+    def test_errors(self, tmp_path):
+        path = str(tmp_path / 'items.idx')
+        with pytest.raises(ValueError):
+            storage.save(Corpus(self.items, ['words']), path)
+        with pytest.raises(ValueError):
+            storage.save(SearchIndex(self.items, ['words']), path)
+
+        storage.save(self.corpus, path)
+        with open(path, 'r+b') as fo:
+            fo.seek(8)
+            fo.write(b'\xff')
+        with pytest.raises(ValueError):
+            storage.load(path)
+
+    def test_corrupted(self, tmp_path):
+        path = str(tmp_path / 'items.idx')
+        storage.save(self.corpus, path)
+        with open(path, 'rb') as fo:
+            data = fo.read()
+        start = storage._PREAMBLE.size
+        stop = start + storage._PREAMBLE.unpack_from(data)[2]
+        header = json.loads(data[start:stop])
+
+        def assert_invalid(contents):
+            with open(path, 'wb') as fo:
+                fo.write(contents)
+            with pytest.raises(ValueError):
+                storage.load(path)
+
+        # truncated files
+        assert_invalid(data[:5])
+        assert_invalid(data[:stop - 10])
+        assert_invalid(data[:len(data) // 2])
+        # malformed headers, padded so that the sections stay in place
+        assert_invalid(data[:start] + b'[' + data[start + 1:])
+        for key in ('sections', 'byteorder', 'attributes', 'ids'):
+            broken = dict(header)
+            del broken[key]
+            meta = json.dumps(broken).encode('utf-8').ljust(stop - start)
+            assert_invalid(data[:start] + meta + data[stop:])
+        sections = dict(
+            header['sections'], **{'lengths:values': [len(data), 8, 'I']})
+        broken = dict(header, sections=sections)
+        meta = json.dumps(broken).encode('utf-8').ljust(stop - start)
+        assert_invalid(data[:start] + meta + data[stop:])
@@ -0,0 +1,55 @@
+"""
+Testing module for the typo tolerant vocabulary
+"""
+import pytest
+
+from search import core
+from search.index import SearchIndex
+from search.typos import TypoIndex, deletes, levenshtein
+from tests.helpers import Item
+from tests.test_search_index import QUERIES
+
+
+class TestTypos:
+    @classmethod
+    def setup_class(cls):
+        cls.items = Item.setup()
+        cls.index = SearchIndex(cls.items, ['words'])
+        cls.typos = SearchIndex(cls.items, ['words'], typos=2)
+
+    def test_levenshtein(self):
+        assert levenshtein('holmes', 'holmes') == 0
+        assert levenshtein('holmes', 'homles') == 2
+        assert levenshtein('watson', 'wtson') == 1
+        assert levenshtein('', 'abc') == 3
+        assert levenshtein('sherlock', 'holmes', 2) == 3
+
+    def test_deletes(self):
+        assert deletes('cat', 1) == {'cat', 'at', 'ct', 'ca'}
+        assert deletes('ab', 5) == {'ab', 'a', 'b', ''}
+
+    def test_lookup(self):
+        vocabulary = list(self.index.vocabulary)
+        typos = self.typos.typos
+        for term in ('shelrock', 'wtson', 'holmez', 'inconvene', 'xy'):
+            for distance in (0, 1, 2):
+                expected = {
+                    token: levenshtein(term, token)
+                    for token in vocabulary
+                    if levenshtein(term, token) <= distance
+                }
+                assert typos.lookup(term, distance) == expected
+        with pytest.raises(ValueError):
+            TypoIndex(max_distance=1).lookup('holmes', 2)
+
+    def test_fuzzy(self):
+        for term in ('shelrock', 'wtson', 'inconvene'):
+            assert self.typos.fuzzy(term) == self.index.fuzzy(term)
+        doc_ids = self.typos.fuzzy('wtson', 1)
+        assert doc_ids
+        assert all('watson' in self.items[i].words for i in doc_ids)
+
+    def test_search(self):
+        search = core.SearchEngine(['words'], limit=10)
+        for query in QUERIES:
+            assert search(query, self.typos) == search(query, self.index)
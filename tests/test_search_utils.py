@@ -1,7 +1,10 @@
 """
 Testing module for search.utils. Even utils need some testing!
 """
+from collections import Counter
+
 from search import utils, matchers
+from tests.helpers import PHRASES
 import pytest
 
 
@@ -127,3 +130,56 @@ class TestUtils:
         assert_equal(seq)
         seq = self.string_walker('', 5, utils.shifter)
         assert_equal(seq, '')
+
+    def test_best_partial_ratio(self):
+        string = 'sherlockholmesconsultingdetective'
+        for query in ('holmes', 'holms', 'wtsn', 'detectives', '', string):
+            expected = max(
+                utils.ratio(query, segment)
+                for segment in utils.shifter(string, len(query)))
+            assert utils.best_partial_ratio(query, string) == expected
+        # the best segment is not the last one
+        assert utils.best_partial_ratio('sher', 'sherlockx') == 1
+
+    def test_ratio_bounds(self):
+        words = ('holmes', 'holms', 'sherlock', 'shelrock', 'mrs', '')
+        for query in words:
+            for string in words:
+                exact = utils.ratio(query, string)
+                assert utils.quick_ratio(query, string) >= exact
+                assert utils.real_quick_ratio(query, string) >= \
+                    utils.quick_ratio(query, string)
+        assert utils.real_quick_ratio('', '') == 1
+        assert utils.quick_ratio('holmes', 'semloh') == 1
+
+        string = 'sherlockholmesconsultingdetective'
+        for query in ('holmes', 'hlomes', 'wtsn', 'xyz', '', string):
+            bound = utils.best_partial_bound(query, string)
+            assert bound >= utils.best_partial_ratio(query, string)
+            assert utils.best_partial_bound(query, string, bound) == bound
+        assert utils.best_partial_bound('hlomes', string) == 1
+        assert utils.best_partial_bound('xyz', string, .5) < .5
+
+    def test_min_score(self):
+        strings = [' '.join(phrase) for phrase in PHRASES if phrase]
+        queries = ['sherlock', 'shelrock holms', 'miss violet hunter',
+                   'holmes said that the doctor']
+        counter = Counter()
+        with utils.recording_skips(counter):
+            for query in queries:
+                for string in strings[::7]:
+                    exact = matchers.lazy_match(query, string)
+                    for min_score in (.5, .75, .9):
+                        match = matchers.lazy_match(query, string,
+                                                    min_score=min_score)
+                        # exact when reaching min_score, below it otherwise
+                        if exact >= min_score:
+                            assert match == exact
+                        else:
+                            assert match < min_score
+        assert counter['windows'] and counter['matches']
+
+    def test_difference_sorted(self):
+        assert utils.difference_sorted([1, 2, 4, 7], [2, 3, 4]) == [1, 7]
+        assert utils.difference_sorted([1, 2], []) == [1, 2]
+        assert utils.difference_sorted([], [1]) == []